@@ -1,22 +1,26 @@
+import functools
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from config import settings
 from models import RefreshToken
 import secrets
 from loguru import logger
+from log_context import redact
 
-# Use Argon2
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# jose and passlib/argon2 are imported on the first login, not at startup
+@functools.cache
+def pwd_context():
+    from passlib.context import CryptContext
+    # Use Argon2
+    return CryptContext(schemes=["argon2"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -25,6 +29,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -49,7 +54,7 @@ async def verify_refresh_token(db: AsyncSession, token: str) -> Optional[int]:
         return None
 
     if db_token.revoked:
-        logger.warning(f"Attempted use of revoked token: {token}")
+        logger.warning(f"Attempted use of revoked token: {redact(token)}")
         return None
 
     if db_token.expires_at < datetime.utcnow():
@@ -65,6 +70,7 @@ async def revoke_refresh_token(db: AsyncSession, token: str):
         await db.commit()
 
 def verify_token(token: str):
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
@@ -0,0 +1,171 @@
+"""
+Server memory held by idle websocket sessions, awake vs hibernated.
+
+Starts the app under uvicorn in a subprocess (providers replaced by local
+fakes, rate limiting off, so no Redis or provider account is needed), opens
+many /ws/chat sessions from this process, optionally has each one complete
+a turn (so its writer holds an answer for replay), lets them sit idle past
+WS_IDLE_HIBERNATE, and reports the server's growth per 1,000 sessions:
+
+- rss:  resident set size (/proc), what the host pays for,
+- heap: bytes allocated by Python and still live (tracemalloc), which
+        drops as soon as hibernation frees something, while the allocator
+        may keep the pages resident for the next sessions.
+
+Usage:
+    python benchmarks/bench_idle_sessions.py [--sessions 1000] [--turns 1] [--answer-kb 64]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def serve(port, answer_kb):
+    """Server side: the real app and session code, fake providers."""
+    import gc
+    import tracemalloc
+    tracemalloc.start()
+
+    import uvicorn
+    import main
+    from routers import ws_router
+
+    async def allow(user):
+        return True
+
+    class FakeASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            async for _ in audio_generator:
+                pass
+            yield {"type": "final", "text": "你好"}
+
+    async def chat(text, history=[], **kwargs):
+        for token in ["你好", "，", "我在", "。"]:
+            yield token
+
+    async def tts(text_iterator, audio_format=None):
+        async for _ in text_iterator:
+            pass
+        for _ in range(4):
+            yield b"\x00" * (answer_kb * 256)
+
+    ws_router.check_rate_limit = allow
+    ws_router.VolcengineASRService = FakeASR
+    ws_router.chat_with_llm = chat
+    ws_router.text_to_speech_stream = tts
+
+    @main.app.get("/bench/memory")
+    def memory():
+        gc.collect()
+        with open("/proc/self/status") as status:
+            rss = next(int(line.split()[1]) * 1024 for line in status if line.startswith("VmRSS:"))
+        return {"rss": rss, "heap": tracemalloc.get_traced_memory()[0]}
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", log_config=None)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_memory(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/bench/memory") as response:
+        return json.load(response)
+
+
+async def open_session(port, token, turns):
+    import websockets
+    ws = await websockets.connect(f"ws://127.0.0.1:{port}/ws/chat?token={token}", max_size=None)
+    await ws.recv()
+    for _ in range(turns):
+        await ws.send(b"\x00" * 3200)
+        await ws.send(json.dumps({"action": "finish_speaking"}))
+        while True:
+            message = await ws.recv()
+            if isinstance(message, str) and json.loads(message)["type"] == "turn_end":
+                break
+    return ws
+
+
+async def measure(port, sessions, turns, idle):
+    from auth import create_access_token
+    token = create_access_token({"sub": "bench"})
+
+    # One session first, so lazily created state is not counted per session
+    warm = await open_session(port, token, turns)
+    await warm.close()
+    await asyncio.sleep(0.5)
+    before = server_memory(port)
+
+    clients = []
+    for start in range(0, sessions, 50):
+        batch = range(start, min(start + 50, sessions))
+        clients += await asyncio.gather(*(open_session(port, token, turns) for _ in batch))
+    await asyncio.sleep(idle)
+    after = server_memory(port)
+
+    await asyncio.gather(*(ws.close() for ws in clients))
+    scale = 1000 / sessions
+    return {key: (after[key] - before[key]) * scale for key in ("rss", "heap")}
+
+
+def run(label, sessions, turns, answer_kb, idle, env):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--answer-kb", str(answer_kb)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(100):
+            try:
+                server_memory(port)
+                break
+            except OSError:
+                time.sleep(0.1)
+        result = asyncio.run(measure(port, sessions, turns, idle))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    print(f"{label:<12} rss {result['rss'] / 2**20:>8.1f} MiB   heap {result['heap'] / 2**20:>8.1f} MiB   per 1,000 sessions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=1, help="turns each session completes before idling")
+    parser.add_argument("--answer-kb", type=int, default=64, help="answer audio per turn")
+    parser.add_argument("--hibernate-after", type=float, default=2.0, help="WS_IDLE_HIBERNATE for the hibernated run")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.answer_kb)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+            WS_IDLE_TIMEOUT="0",
+            LOG_FILE=os.path.join(tmp, "app.log"),
+        )
+        print(f"{args.sessions} idle sessions, {args.turns} turn(s) of {args.answer_kb} KiB answer audio each")
+        idle = args.hibernate_after + 3
+        run("awake", args.sessions, args.turns, args.answer_kb, idle, dict(env, WS_IDLE_HIBERNATE="0"))
+        run("hibernated", args.sessions, args.turns, args.answer_kb, idle, dict(env, WS_IDLE_HIBERNATE=str(args.hibernate_after)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Event-loop time spent in logging under load.
+
+Runs many concurrent "sessions" that each log a burst of records (the shape
+of a per-chunk / per-token hot path) and measures, on the event loop:
+
+- total time spent inside logging calls,
+- the worst event-loop lag seen by a ticker task while they run.
+
+Compared setups:
+
+- sync:       serialize=True file sink written from the loop (previous setup)
+- enqueue:    same sink with loguru's enqueue=True (pickles every record
+              through a multiprocessing queue)
+- background: BackgroundSink + JsonFileWriter (config.setup_logging)
+- stdlib:     stdlib logger bridged through InterceptHandler into the
+              background sink
+- sampled:    background sink, hot path goes through a LogSampler
+
+Usage:
+    python benchmarks/bench_logging.py [--sessions 200] [--records 200]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from config import InterceptHandler
+from log_context import BackgroundSink, JsonFileWriter, LogSampler, add_context, bind_session
+
+
+async def ticker(interval, stop, lags):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run(emit, sessions, records):
+    spent = [0.0]
+    stop = asyncio.Event()
+    lags = []
+    tick = asyncio.create_task(ticker(0.005, stop, lags))
+
+    async def session():
+        bind_session()
+        for i in range(records):
+            start = time.perf_counter()
+            emit(i)
+            spent[0] += time.perf_counter() - start
+            # Yield like a streaming loop does between chunks
+            await asyncio.sleep(0)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    wall = time.perf_counter() - wall
+    stop.set()
+    await tick
+    return spent[0], max(lags or [0.0]), wall
+
+
+def configure(path, mode):
+    logger.remove()
+    logger.configure(patcher=add_context)
+    if mode == "background":
+        logger.add(BackgroundSink(JsonFileWriter(path)), format="{message}", level="INFO")
+    else:
+        logger.add(path, serialize=True, level="INFO", enqueue=mode == "enqueue")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--records", type=int, default=200)
+    args = parser.parse_args()
+    total = args.sessions * args.records
+
+    std_logger = logging.getLogger("bench")
+    std_logger.handlers = [InterceptHandler()]
+    std_logger.propagate = False
+    std_logger.setLevel(logging.INFO)
+
+    sampler = LogSampler(interval=0.05)
+
+    def sampled_emit(i):
+        if (suppressed := sampler.allow("chunk")) is not None:
+            logger.info(f"audio chunk {i} (+{suppressed} suppressed)")
+
+    setups = [
+        ("sync", "sync", lambda i: logger.info(f"audio chunk {i}")),
+        ("enqueue", "enqueue", lambda i: logger.info(f"audio chunk {i}")),
+        ("background", "background", lambda i: logger.info(f"audio chunk {i}")),
+        ("stdlib", "background", lambda i: std_logger.info(f"audio chunk {i}")),
+        ("sampled", "background", sampled_emit),
+    ]
+
+    print(f"{args.sessions} sessions x {args.records} records = {total} log calls")
+    print(f"{'setup':<12}{'loop time (ms)':>16}{'per call (us)':>16}{'max lag (ms)':>15}{'wall (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, mode, emit in setups:
+            configure(os.path.join(tmp, f"{name}.log"), mode)
+            spent, lag, wall = asyncio.run(run(emit, args.sessions, args.records))
+            # Flush the queue outside the measurement
+            logger.remove()
+            print(f"{name:<12}{spent * 1000:>16.1f}{spent / total * 1e6:>16.2f}{lag * 1000:>15.1f}{wall:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
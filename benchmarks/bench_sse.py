@@ -0,0 +1,161 @@
+"""
+Provider stream parsing: per-line str/JSON (before) vs the shared SSE decoder.
+
+Replays LLM (OpenAI-style token deltas) and TTS (MiniMax hex audio) streams
+through httpx responses in network-sized chunks and measures the CPU spent
+getting the tokens / audio out. Streams are synthesized in the providers'
+shape unless recorded bodies are given (raw response bytes, e.g. saved with
+`curl -N ... > llm.sse`).
+
+Usage:
+    python benchmarks/bench_sse.py [--repeat 200] [--chunk 4096]
+    python benchmarks/bench_sse.py --llm-stream llm.sse --tts-stream tts.sse
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import sse
+from services.tts_service import parse_audio_event
+
+TOKENS = ["你好", "，", "我", "是", "你的", "语音", "助手", "。", "今天", "天气", "不错", "！"]
+
+
+def synthetic_llm(tokens=300):
+    lines = []
+    for i in range(tokens):
+        event = {
+            "id": "chatcmpl-8f3a", "object": "chat.completion.chunk", "created": 1700000000,
+            "model": "deepseek-ai/DeepSeek-V3",
+            "choices": [{"index": 0, "delta": {"content": TOKENS[i % len(TOKENS)]}, "finish_reason": None}],
+        }
+        lines.append(b"data: " + json.dumps(event, ensure_ascii=False).encode() + b"\n\n")
+    return b"".join(lines) + b"data: [DONE]\n\n"
+
+
+def synthetic_tts(sentences=8, chunk_bytes=8192):
+    rng = random.Random(0)
+    lines = []
+    for _ in range(sentences):
+        audio = rng.randbytes(chunk_bytes)
+        event = {"data": {"audio": audio.hex(), "status": 1, "ced": ""}, "trace_id": "04ece7", "base_resp": {"status_code": 0}}
+        lines.append(b"data: " + json.dumps(event).encode() + b"\n\n")
+    final = {"data": {"audio": "", "status": 2}, "extra_info": {"audio_length": 4200, "audio_size": sentences * chunk_bytes}}
+    lines.append(b"data: " + json.dumps(final).encode() + b"\n\n")
+    return b"".join(lines)
+
+
+def response(body, chunk):
+    async def chunks():
+        for i in range(0, len(body), chunk):
+            yield body[i:i + chunk]
+    return httpx.Response(200, content=chunks())
+
+
+async def llm_lines(resp):
+    tokens = []
+    async for line in resp.aiter_lines():
+        if line.startswith("data:"):
+            line = line[5:].strip()
+            if line == "[DONE]":
+                break
+            try:
+                data = json.loads(line)
+                if 'choices' in data and len(data['choices']) > 0:
+                    delta = data['choices'][0].get('delta', {})
+                    if delta.get('content'):
+                        tokens.append(delta['content'])
+            except json.JSONDecodeError:
+                continue
+    return "".join(tokens)
+
+
+async def llm_decoder(resp):
+    tokens = []
+    async for payload in sse.iter_events(resp.aiter_bytes()):
+        if payload == b"[DONE]":
+            break
+        try:
+            data = sse.loads(payload)
+        except ValueError:
+            continue
+        choices = data.get('choices')
+        if choices:
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                tokens.append(content)
+    return "".join(tokens)
+
+
+async def tts_lines(resp):
+    full_audio = b""
+    async for line in resp.aiter_lines():
+        if not line: continue
+        if line.startswith("data:"):
+            line = line[5:]
+        try:
+            data = json.loads(line)
+            if 'data' in data and 'audio' in data['data']:
+                full_audio += bytes.fromhex(data['data']['audio'])
+        except json.JSONDecodeError:
+            continue
+    return full_audio
+
+
+async def tts_decoder(resp):
+    chunks = []
+    async for payload in sse.iter_events(resp.aiter_bytes(), bare_json=True):
+        try:
+            chunk, _ = parse_audio_event(payload)
+        except ValueError:
+            continue
+        if chunk:
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def measure(parse, body, repeat, chunk):
+    expected = await parse(response(body, chunk))
+    start = time.process_time()
+    for _ in range(repeat):
+        assert await parse(response(body, chunk)) == expected
+    return (time.process_time() - start) / repeat, expected
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--chunk", type=int, default=4096, help="Bytes per network read")
+    parser.add_argument("--llm-stream", help="Recorded LLM response body")
+    parser.add_argument("--tts-stream", help="Recorded TTS response body")
+    args = parser.parse_args()
+
+    def load(path, fallback):
+        if not path:
+            return fallback()
+        with open(path, "rb") as f:
+            return f.read()
+
+    streams = [
+        ("llm", load(args.llm_stream, synthetic_llm), llm_lines, llm_decoder),
+        ("tts", load(args.tts_stream, synthetic_tts), tts_lines, tts_decoder),
+    ]
+    print(f"json parser: {'orjson' if sse.orjson else 'stdlib'}, {args.chunk}-byte reads")
+    print(f"{'stream':<8}{'bytes':>10}{'lines':>12}{'decoder':>12}{'speedup':>10}")
+    for name, body, before, after in streams:
+        old, old_result = await measure(before, body, args.repeat, args.chunk)
+        new, new_result = await measure(after, body, args.repeat, args.chunk)
+        assert old_result == new_result, f"{name}: results differ"
+        print(f"{name:<8}{len(body):>10}{old * 1e3:>10.2f}ms{new * 1e3:>10.2f}ms{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+llm_token frames per turn and server CPU, per-token vs coalesced.
+
+Many concurrent sessions each stream one LLM answer through the real
+OutboundWriter + TokenBatcher into a local socket pair (so every frame pays
+for JSON encoding, the writer queue and a send syscall, as in production).
+Tokens arrive with a small gap, like DeepSeek's streaming output.
+
+Usage:
+    python benchmarks/bench_token_frames.py [--sessions 150] [--tokens 300] [--gap-ms 5]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ws_session import OutboundWriter, TokenBatcher
+
+TOKENS = ["你好", "，", "我", "是", "你的", "语音", "助手", "。", "今天", "天气", "不错", "！"]
+
+
+class SocketWebSocket:
+    """Minimal server-side websocket: unmasked frame header + payload on a real socket."""
+
+    def __init__(self, stream_writer):
+        self.stream_writer = stream_writer
+        self.frames = 0
+
+    async def send(self, message):
+        if message.get("text") is not None:
+            payload, opcode = message["text"].encode(), 0x1
+        else:
+            payload, opcode = message["bytes"], 0x2
+        if len(payload) < 126:
+            header = struct.pack("!BB", 0x80 | opcode, len(payload))
+        else:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+        self.stream_writer.write(header + payload)
+        await self.stream_writer.drain()
+        self.frames += 1
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+async def drain_socket(sock):
+    loop = asyncio.get_running_loop()
+    while await loop.sock_recv(sock, 65536):
+        pass
+
+
+async def session(tokens, gap, flush_ms, flush_chars):
+    server_sock, client_sock = socket.socketpair()
+    client_sock.setblocking(False)
+    reader = asyncio.create_task(drain_socket(client_sock))
+    _, stream_writer = await asyncio.open_connection(sock=server_sock)
+
+    ws = SocketWebSocket(stream_writer)
+    writer = OutboundWriter(ws, max_bytes=2 * 1024 * 1024).start()
+    batcher = TokenBatcher(writer, flush_ms, flush_chars)
+    for i in range(tokens):
+        await batcher.add(TOKENS[i % len(TOKENS)])
+        await asyncio.sleep(gap)
+    await batcher.close()
+    await writer.close()
+
+    stream_writer.close()
+    await reader
+    client_sock.close()
+    return ws.frames
+
+
+async def run(sessions, tokens, gap, flush_ms, flush_chars):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    frames = await asyncio.gather(*(session(tokens, gap, flush_ms, flush_chars) for _ in range(sessions)))
+    return sum(frames) / sessions, time.process_time() - cpu, time.perf_counter() - wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=150)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--gap-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    setups = [("per-token", 0, 1), ("20ms/32ch", 20, 32), ("40ms/32ch", 40, 32), ("80ms/64ch", 80, 64)]
+    print(f"{args.sessions} sessions x {args.tokens} tokens, {args.gap_ms}ms between tokens")
+    print(f"{'mode':<12}{'frames/turn':>13}{'cpu (s)':>10}{'cpu saved':>11}{'wall (s)':>10}")
+    baseline = None
+    for name, flush_ms, flush_chars in setups:
+        frames, cpu, wall = asyncio.run(run(args.sessions, args.tokens, args.gap_ms / 1000, flush_ms, flush_chars))
+        baseline = baseline or cpu
+        print(f"{name:<12}{frames:>13.1f}{cpu:>10.2f}{(1 - cpu / baseline) * 100:>10.0f}%{wall:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import os
 import sys
+import logging
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import BaseModel, Field
 from loguru import logger
 
+class EndpointConfig(BaseModel):
+    """One candidate upstream endpoint for a capability (LLM, TTS)."""
+    name: str
+    url: str
+    model: str
+    # Empty means the provider-wide key (SILICON_KEY / MINIMAX_API_KEY)
+    api_key: str = ""
+
 class Settings(BaseSettings):
     # Volcengine (ASR)
     VOLC_APPID: str = Field(default="", env="VOLC_APPID")
@@ -22,6 +31,14 @@ class Settings(BaseSettings):
     HOST: str = Field(default="0.0.0.0", env="HOST")
     ENV: str = Field(default="dev", env="ENV")
 
+    # Startup Warm-up (per dependency timeout; failures degrade, never block)
+    WARMUP_TIMEOUT: float = Field(default=5.0, env="WARMUP_TIMEOUT")
+    WARMUP_DB_CONNECTIONS: int = Field(default=5, env="WARMUP_DB_CONNECTIONS")
+
+    # Static Assets (built with fingerprinted names and gzip/brotli variants)
+    STATIC_SOURCE_DIR: str = Field(default="static", env="STATIC_SOURCE_DIR")
+    STATIC_BUILD_DIR: str = Field(default="build/static", env="STATIC_BUILD_DIR")
+
     # Database & Auth
     DATABASE_URL: str = Field(default="sqlite+aiosqlite:///./voice_assistant.db", env="DATABASE_URL")
     SECRET_KEY: str = Field(default="your-secret-key-change-me", env="SECRET_KEY")
@@ -36,25 +53,248 @@ class Settings(BaseSettings):
     SSL_CERT_FILE: str | None = Field(default=None, env="SSL_CERT_FILE")
     SSL_KEY_FILE: str | None = Field(default=None, env="SSL_KEY_FILE")
 
+    # WebSocket Session Buffers
+    WS_AUDIO_QUEUE_MAX_CHUNKS: int = Field(default=200, env="WS_AUDIO_QUEUE_MAX_CHUNKS")
+    WS_AUDIO_QUEUE_MAX_BYTES: int = Field(default=4 * 1024 * 1024, env="WS_AUDIO_QUEUE_MAX_BYTES")
+    # block: stop reading the socket until ASR catches up (disconnect after the timeout)
+    # drop: discard the incoming chunk, disconnect: close the session immediately
+    WS_AUDIO_OVERFLOW_POLICY: str = Field(default="block", env="WS_AUDIO_OVERFLOW_POLICY")
+    WS_AUDIO_OVERFLOW_TIMEOUT: float = Field(default=5.0, env="WS_AUDIO_OVERFLOW_TIMEOUT")
+    WS_SEND_QUEUE_MAX_BYTES: int = Field(default=2 * 1024 * 1024, env="WS_SEND_QUEUE_MAX_BYTES")
+    WS_SLOW_CONSUMER_TIMEOUT: float = Field(default=10.0, env="WS_SLOW_CONSUMER_TIMEOUT")
+    # llm_token frames are coalesced and flushed every N ms or at N characters,
+    # whichever comes first (0 ms sends one frame per token); per session
+    # overridable with ?token_flush_ms=&token_flush_chars=
+    WS_TOKEN_FLUSH_MS: int = Field(default=40, env="WS_TOKEN_FLUSH_MS")
+    WS_TOKEN_FLUSH_CHARS: int = Field(default=32, env="WS_TOKEN_FLUSH_CHARS")
+    # How many recognised turns ASR (and LLM) may run ahead of the turn being spoken
+    WS_PIPELINE_TURNS_AHEAD: int = Field(default=2, env="WS_PIPELINE_TURNS_AHEAD")
+    # A dropped client can reconnect with ?session_id=&last_seq= within the grace
+    # period and get the frames it missed (0 disables resumption); the pipeline
+    # keeps running meanwhile. Sent frames are kept up to WS_REPLAY_MAX_BYTES.
+    WS_RESUME_GRACE_SECONDS: float = Field(default=30.0, env="WS_RESUME_GRACE_SECONDS")
+    WS_REPLAY_MAX_BYTES: int = Field(default=1024 * 1024, env="WS_REPLAY_MAX_BYTES")
+    # Filler audio: when no answer audio has been sent WS_FILLER_DELAY seconds
+    # after asr_final, a short pre-synthesized acknowledgement clip is sent first
+    WS_FILLER_ENABLED: bool = Field(default=False, env="WS_FILLER_ENABLED")
+    WS_FILLER_DELAY: float = Field(default=0.7, env="WS_FILLER_DELAY")
+    WS_FILLER_PHRASES: list[str] = Field(default=["嗯，", "好的，", "我想想，"], env="WS_FILLER_PHRASES")
+    # Server-side endpointing: a turn also ends without finish_speaking once
+    # Volcengine marks the last utterance definite, or once the partial
+    # transcript has not changed for WS_ENDPOINT_SILENCE seconds. The client
+    # gets an "endpoint" frame and may answer it with finish_speaking: audio
+    # received within WS_ENDPOINT_TAIL seconds of the endpoint is then dropped
+    # as the tail of the utterance. Without it (hands-free), that audio opens
+    # the next turn, which gets the recording's WebM header prepended. Per
+    # session with ?endpointing=true|false
+    WS_ENDPOINTING: bool = Field(default=False, env="WS_ENDPOINTING")
+    WS_ENDPOINT_SILENCE: float = Field(default=0.8, env="WS_ENDPOINT_SILENCE")
+    WS_ENDPOINT_ON_DEFINITE: bool = Field(default=True, env="WS_ENDPOINT_ON_DEFINITE")
+    WS_ENDPOINT_TAIL: float = Field(default=0.5, env="WS_ENDPOINT_TAIL")
+    # Idle Sessions: after WS_IDLE_HIBERNATE seconds without a client message or a
+    # turn in progress, a session stops its pipeline tasks and drops the frames
+    # kept for resumption and its flight recorder events; only the socket reader
+    # stays, and the next message starts the pipeline again. After
+    # WS_IDLE_TIMEOUT seconds the socket is closed with 4013 (0 disables either)
+    WS_IDLE_HIBERNATE: float = Field(default=60.0, env="WS_IDLE_HIBERNATE")
+    WS_IDLE_TIMEOUT: float = Field(default=900.0, env="WS_IDLE_TIMEOUT")
+    # Protocol-level pings sent by uvicorn; a peer that does not answer one
+    # within WS_PING_TIMEOUT seconds is disconnected
+    WS_PING_INTERVAL: float = Field(default=20.0, env="WS_PING_INTERVAL")
+    WS_PING_TIMEOUT: float = Field(default=20.0, env="WS_PING_TIMEOUT")
+
+    # Graceful Draining (SIGTERM or POST /admin/drain): /readyz fails, new websocket
+    # sessions and uploads are refused, turns already started run to turn_end for
+    # up to DRAIN_TIMEOUT seconds, then clients are told to reconnect after a
+    # random delay of up to DRAIN_RECONNECT_SPREAD seconds
+    DRAIN_TIMEOUT: float = Field(default=20.0, env="DRAIN_TIMEOUT")
+    DRAIN_RECONNECT_SPREAD: float = Field(default=10.0, env="DRAIN_RECONNECT_SPREAD")
+
+    # Audio Uploads (/api/process_audio), limits are checked while the body streams in
+    UPLOAD_MAX_BYTES: int = Field(default=10 * 1024 * 1024, env="UPLOAD_MAX_BYTES")
+    UPLOAD_MAX_FIELD_BYTES: int = Field(default=1024 * 1024, env="UPLOAD_MAX_FIELD_BYTES")
+    # Feed the upload to the streaming Volcengine ASR as it arrives instead of
+    # transcribing the whole file afterwards (kept as the fallback)
+    UPLOAD_STREAMING_ASR: bool = Field(default=True, env="UPLOAD_STREAMING_ASR")
+
+    # Batch Transcription (/api/transcribe_batch, transcribe_cli.py)
+    BATCH_CONCURRENCY: int = Field(default=8, env="BATCH_CONCURRENCY")
+    BATCH_MAX_ATTEMPTS: int = Field(default=3, env="BATCH_MAX_ATTEMPTS")
+    BATCH_RETRY_BACKOFF: float = Field(default=1.0, env="BATCH_RETRY_BACKOFF")
+    BATCH_MAX_FILES: int = Field(default=200, env="BATCH_MAX_FILES")
+
+    # TTS Text Normalization: markup, code, emoji and URLs are dropped and
+    # whitespace/punctuation width canonicalized before synthesis and before
+    # the tts: cache key is computed
+    TTS_NORMALIZE_TEXT: bool = Field(default=True, env="TTS_NORMALIZE_TEXT")
+    # Also spell out numbers and units for Chinese speech (25℃ -> 二十五摄氏度)
+    TTS_EXPAND_NUMBERS: bool = Field(default=False, env="TTS_EXPAND_NUMBERS")
+
+    # Response Caches (Redis) and the offline warmer (warm_cache.py)
+    LLM_CACHE_TTL: int = Field(default=3600, env="LLM_CACHE_TTL")
+    TTS_CACHE_TTL: int = Field(default=86400, env="TTS_CACHE_TTL")
+    # Websocket questions/answers are stored in chat_history for the warmer to
+    # mine. Opt-in: this keeps users' transcribed speech in the database
+    CHAT_HISTORY_ENABLED: bool = Field(default=False, env="CHAT_HISTORY_ENABLED")
+    CACHE_WARM_TOP: int = Field(default=200, env="CACHE_WARM_TOP")
+    CACHE_WARM_DAYS: int = Field(default=30, env="CACHE_WARM_DAYS")
+    # Kept low so live traffic keeps most of the provider concurrency
+    CACHE_WARM_CONCURRENCY: int = Field(default=4, env="CACHE_WARM_CONCURRENCY")
+    # Warmed LLM answers outlive the regular LLM_CACHE_TTL until the next run
+    CACHE_WARM_TTL: int = Field(default=86400, env="CACHE_WARM_TTL")
+
+    # Upstream Concurrency (per process)
+    VOLC_MAX_CONCURRENCY: int = Field(default=50, env="VOLC_MAX_CONCURRENCY")
+    SILICON_MAX_CONCURRENCY: int = Field(default=50, env="SILICON_MAX_CONCURRENCY")
+    MINIMAX_MAX_CONCURRENCY: int = Field(default=20, env="MINIMAX_MAX_CONCURRENCY")
+    PROVIDER_QUEUE_TIMEOUT: float = Field(default=10.0, env="PROVIDER_QUEUE_TIMEOUT")
+    # New sessions are rejected once this many requests wait on any provider
+    OVERLOAD_QUEUE_THRESHOLD: int = Field(default=50, env="OVERLOAD_QUEUE_THRESHOLD")
+
+    # LLM Streaming Reliability
+    LLM_TTFT_DEADLINE: float = Field(default=2.5, env="LLM_TTFT_DEADLINE")
+    LLM_HEDGE_ENABLED: bool = Field(default=True, env="LLM_HEDGE_ENABLED")
+    # Model for the hedged request; empty means the primary model
+    LLM_HEDGE_MODEL: str = Field(default="", env="LLM_HEDGE_MODEL")
+    LLM_MAX_ATTEMPTS: int = Field(default=3, env="LLM_MAX_ATTEMPTS")
+    LLM_RETRY_BACKOFF: float = Field(default=0.5, env="LLM_RETRY_BACKOFF")
+    # Max gap between two streamed chunks
+    LLM_READ_TIMEOUT: float = Field(default=30.0, env="LLM_READ_TIMEOUT")
+
+    # Endpoint Registry (JSON lists in the environment)
+    LLM_ENDPOINTS: list[EndpointConfig] = Field(default=[
+        EndpointConfig(
+            name="siliconflow-deepseek-v3.2",
+            url="https://api.siliconflow.cn/v1/chat/completions",
+            model="deepseek-ai/DeepSeek-V3.2"
+        )
+    ], env="LLM_ENDPOINTS")
+    TTS_ENDPOINTS: list[EndpointConfig] = Field(default=[
+        EndpointConfig(
+            name="minimax-speech-01-turbo",
+            url="https://api.minimaxi.com/v1/t2a_v2",
+            model="speech-01-turbo"
+        )
+    ], env="TTS_ENDPOINTS")
+
+    # Codecs every TTS endpoint can produce (opus is not offered by Minimax)
+    TTS_AUDIO_FORMATS: list[str] = Field(default=["mp3", "pcm", "flac"], env="TTS_AUDIO_FORMATS")
+
+    # Latency-Aware Routing
+    ROUTER_EWMA_ALPHA: float = Field(default=0.3, env="ROUTER_EWMA_ALPHA")
+    ROUTER_EJECT_CONSECUTIVE_FAILURES: int = Field(default=3, env="ROUTER_EJECT_CONSECUTIVE_FAILURES")
+    ROUTER_EJECT_ERROR_RATE: float = Field(default=0.5, env="ROUTER_EJECT_ERROR_RATE")
+    ROUTER_EJECT_BASE_SECONDS: float = Field(default=10.0, env="ROUTER_EJECT_BASE_SECONDS")
+    ROUTER_EJECT_MAX_SECONDS: float = Field(default=300.0, env="ROUTER_EJECT_MAX_SECONDS")
+
+    # Logging
+    LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")
+    LOG_FILE: str = Field(default="app.log", env="LOG_FILE")
+    # Per-chunk / per-token messages are emitted at most once per interval per kind
+    LOG_SAMPLE_INTERVAL: float = Field(default=5.0, env="LOG_SAMPLE_INTERVAL")
+
+    # Event Loop Monitor
+    LOOP_MONITOR_ENABLED: bool = Field(default=True, env="LOOP_MONITOR_ENABLED")
+    LOOP_MONITOR_INTERVAL: float = Field(default=0.05, env="LOOP_MONITOR_INTERVAL")
+    # Lag above this is a stall: the blocking stack is captured and kept
+    LOOP_LAG_THRESHOLD: float = Field(default=0.1, env="LOOP_LAG_THRESHOLD")
+    LOOP_MONITOR_MAX_OFFENDERS: int = Field(default=50, env="LOOP_MONITOR_MAX_OFFENDERS")
+
+    # Flight Recorder (per-session event timelines)
+    FLIGHT_RECORDER_MAX_EVENTS: int = Field(default=2000, env="FLIGHT_RECORDER_MAX_EVENTS")
+    # Turns slower than this (end of speech -> first audio frame) are saved
+    FLIGHT_RECORDER_SLO: float = Field(default=3.0, env="FLIGHT_RECORDER_SLO")
+    FLIGHT_RECORDER_KEEP: int = Field(default=100, env="FLIGHT_RECORDER_KEEP")
+    # Empty keeps slow turns in memory only
+    FLIGHT_RECORDER_FILE: str = Field(default="slow_turns.jsonl", env="FLIGHT_RECORDER_FILE")
+
+    # Session Recording (audio + raw provider streams, replayed by replay_session.py)
+    # Off by default: archives contain user audio
+    SESSION_RECORDING_ENABLED: bool = Field(default=False, env="SESSION_RECORDING_ENABLED")
+    # Share of sessions recorded when enabled
+    SESSION_RECORDING_SAMPLE: float = Field(default=1.0, env="SESSION_RECORDING_SAMPLE")
+    SESSION_RECORDING_DIR: str = Field(default="recordings", env="SESSION_RECORDING_DIR")
+    # Per session; longer sessions are archived up to this point
+    SESSION_RECORDING_MAX_BYTES: int = Field(default=20 * 1024 * 1024, env="SESSION_RECORDING_MAX_BYTES")
+
+    # Usage Metering: per-user ASR milliseconds, LLM tokens and TTS characters are
+    # counted in process and added to daily Redis hashes (usage:<day>:<user>)
+    # every USAGE_FLUSH_INTERVAL seconds
+    USAGE_FLUSH_INTERVAL: float = Field(default=10.0, env="USAGE_FLUSH_INTERVAL")
+    USAGE_RETENTION_DAYS: int = Field(default=35, env="USAGE_RETENTION_DAYS")
+    # Daily limits per user by counter, e.g. {"llm_tokens": 200000}; a user over
+    # any of them gets no new sessions or answers until the next day (UTC)
+    USAGE_DAILY_QUOTAS: dict[str, int] = Field(default={}, env="USAGE_DAILY_QUOTAS")
+
+    # Startup Budget, enforced by tests/test_startup.py (profile with
+    # `python main.py --profile-startup`): seconds for a fresh interpreter to
+    # import main, and to also run the startup hooks
+    STARTUP_IMPORT_BUDGET: float = Field(default=2.0, env="STARTUP_IMPORT_BUDGET")
+    STARTUP_BOOT_BUDGET: float = Field(default=2.5, env="STARTUP_BOOT_BUDGET")
+
+    # Admin endpoints (/admin/*), usernames whose access token is accepted
+    ADMIN_USERS: list[str] = Field(default=[], env="ADMIN_USERS")
+
     class Config:
         env_file = ".env"
         extra = "ignore"
 
 settings = Settings()
 
-def setup_logging():
+class InterceptHandler(logging.Handler):
+    """Forwards stdlib `logging` records (services, uvicorn, httpx) to loguru."""
+
+    def emit(self, record):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        # Report the caller of logging.info(), not the logging module itself
+        frame, depth = sys._getframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+_logging_configured = False
+
+def setup_logging(force=False):
+    """
+    Configures loguru sinks and routes stdlib logging through them.
+
+    Sinks are BackgroundSinks: the event loop only builds the record and puts
+    it on a queue, writer threads do the JSON encoding and I/O. Call
+    `await logger.complete()` on shutdown to flush them. Safe to call more
+    than once.
+    """
+    global _logging_configured
+    if _logging_configured and not force:
+        return
+    _logging_configured = True
+
+    from log_context import BackgroundSink, JsonFileWriter, StreamWriter, add_context, set_sample_interval
+
     logger.remove()
+    logger.configure(patcher=add_context)
     logger.add(
-        sys.stderr,
+        BackgroundSink(StreamWriter(), name="log-stderr"),
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level> | {extra}",
-        level="INFO"
+        level=settings.LOG_LEVEL,
+        colorize=sys.stderr.isatty()
     )
-    # File logging (JSON formatted for "structure")
+    # File logging (JSON formatted for "structure"), encoded on the writer thread
     logger.add(
-        "app.log",
-        rotation="500 MB",
-        serialize=True,
-        level="INFO"
+        BackgroundSink(JsonFileWriter(settings.LOG_FILE, rotation_bytes=500 * 1024 * 1024), name="log-file"),
+        format="{message}",
+        level=settings.LOG_LEVEL
     )
 
-setup_logging()
+    logging.basicConfig(handlers=[InterceptHandler()], level=settings.LOG_LEVEL, force=True)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        std_logger = logging.getLogger(name)
+        std_logger.handlers = []
+        std_logger.propagate = True
+
+    set_sample_interval(settings.LOG_SAMPLE_INTERVAL)
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+
+# Correlation fields attached to every log record (see config.setup_logging).
+# Set once per websocket session / HTTP request and per conversational turn;
+# tasks created afterwards inherit them.
+session_id_var: ContextVar[str | None] = ContextVar("session_id", default=None)
+turn_id_var: ContextVar[int | None] = ContextVar("turn_id", default=None)
+
+
+def new_session_id():
+    return uuid.uuid4().hex[:16]
+
+
+def bind_session(session_id=None):
+    """Tags all following log records in this context with a session id."""
+    session_id = session_id or new_session_id()
+    session_id_var.set(session_id)
+    turn_id_var.set(None)
+    return session_id
+
+
+def bind_turn(turn_id):
+    turn_id_var.set(turn_id)
+
+
+def add_context(record):
+    """Loguru patcher: copies the correlation ids into record["extra"]."""
+    session_id = session_id_var.get()
+    if session_id is not None:
+        record["extra"].setdefault("session_id", session_id)
+        turn_id = turn_id_var.get()
+        if turn_id is not None:
+            record["extra"].setdefault("turn_id", turn_id)
+
+
+class BackgroundSink:
+    """
+    Loguru sink that hands records to a writer thread.
+
+    The event loop only pays for building the record and a queue put; JSON
+    encoding and blocking I/O run on the thread, which also batches flushes.
+    `logger.complete()` waits until everything queued so far is written,
+    `logger.remove()` drains and stops the thread.
+    """
+
+    _STOP = object()
+
+    def __init__(self, writer, name="log-writer"):
+        self.writer = writer
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, message):
+        self._queue.put(self.writer.prepare(message))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Drain whatever else is queued so one flush covers the burst
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            try:
+                for item in batch:
+                    if item is self._STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        self.writer.flush()
+                        item.set()
+                    else:
+                        self.writer.write(item)
+                self.writer.flush()
+                if stop:
+                    self.writer.close()
+            except Exception:
+                # Never let a broken sink kill the thread (and block complete())
+                traceback.print_exc()
+            finally:
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+            if stop:
+                return
+
+    async def complete(self):
+        done = threading.Event()
+        self._queue.put(done)
+        await asyncio.to_thread(done.wait)
+
+    def stop(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+class StreamWriter:
+    """Writes preformatted loguru messages to a stream, sys.stderr by default."""
+
+    def __init__(self, stream=None):
+        self._stream = stream
+
+    @property
+    def stream(self):
+        # Looked up on every write so redirected stderr (tests, daemons) is honoured
+        return self._stream or sys.stderr
+
+    def prepare(self, message):
+        return str(message)
+
+    def write(self, message):
+        self.stream.write(message)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class JsonFileWriter:
+    """One JSON object per line, rotated to `<path>.<timestamp>` past `rotation_bytes`."""
+
+    def __init__(self, path, rotation_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.rotation_bytes = rotation_bytes
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def prepare(self, message):
+        """Runs on the logging thread, keeps only what the writer thread needs."""
+        record = message.record
+        exception = None
+        if record["exception"] is not None:
+            # The traceback's frames are not safe to read from another thread
+            exc = record["exception"]
+            exception = "".join(traceback.format_exception(exc.type, exc.value, exc.traceback))
+        return record, exception
+
+    def write(self, item):
+        record, exception = item
+        entry = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "name": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        if record["extra"]:
+            entry["extra"] = record["extra"]
+        if exception:
+            entry["exception"] = exception
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+        if self._size and self._size + len(line) > self.rotation_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._size += len(line)
+
+    def _rotate(self):
+        self._file.close()
+        os.rename(self.path, f"{self.path}.{datetime.now():%Y-%m-%d_%H-%M-%S_%f}")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = 0
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class LogSampler:
+    """
+    Rate limiter for log statements on per-chunk / per-token paths.
+
+    Lets one record per key through every `interval` seconds and counts the
+    ones it swallowed in between.
+    """
+
+    def __init__(self, interval=5.0, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self._last: dict[str, float] = {}
+        self._suppressed: dict[str, int] = {}
+
+    def allow(self, key):
+        """
+        Returns:
+            int | None: None if this record should be dropped, otherwise how
+            many records with the same key were dropped since the last one.
+        """
+        now = self.clock()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return None
+        self._last[key] = now
+        return self._suppressed.pop(key, 0)
+
+
+_sampler = LogSampler()
+
+
+def sampled(key):
+    """Module-level shortcut: `if (n := sampled("tts_cache_hit")) is not None: logger.info(...)`."""
+    return _sampler.allow(key)
+
+
+def set_sample_interval(interval):
+    _sampler.interval = interval
+
+
+def redact(secret, keep=6):
+    """Log-safe form of a token: a short prefix only."""
+    if not secret:
+        return "<empty>"
+    return f"{secret[:keep]}…({len(secret)} chars)"
@@ -1,19 +1,33 @@
 import json
 import base64
+import asyncio
+import functools
 import logging
-from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException
-from fastapi.responses import StreamingResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse, HTMLResponse, Response
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from config import settings, setup_logging
 from services.asr_service import transcribe_audio
+from services.volcengine_asr import VolcengineASRService
+from services.upload_ingest import StreamingUpload, UploadRejected
 from services.llm_service import chat_with_llm
 from services.tts_service import text_to_speech_stream
+from services.concurrency import is_overloaded
+from services.audio_format import DEFAULT_AUDIO_FORMAT, negotiate_audio_format
+from services.metrics import OVERLOAD_REJECTIONS, DRAIN_REJECTIONS
 from database import engine, Base
-from routers import auth_router, ws_router
+from static_assets import PrecompressedStaticFiles, asset_manifest, load_static_assets, static_url
+from routers import auth_router, ws_router, health_router, admin_router, transcribe_router
+from routers.deps import limiter
+from services import asr_service, filler_audio, lazy_redis, llm_service, metering, tts_service
+from services.drain import drainer
+from services.warmup import warm_up
+from services.loop_monitor import loop_monitor
+from log_context import bind_session
+from services.flight_recorder import FlightRecorder
+from services import session_archive
+from loguru import logger as loguru_logger
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Setup
@@ -26,70 +40,207 @@ app = FastAPI(title="Voice Assistant API", version="1.0")
 Instrumentator().instrument(app).expose(app)
 
 # Rate Limiter
-limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Static & Templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+# Static & Templates (served from the fingerprinted build, see static_assets.py)
+app.mount("/static", PrecompressedStaticFiles(directory=settings.STATIC_BUILD_DIR, check_dir=False), name="static")
+
+@functools.cache
+def templates():
+    # Jinja2 is only needed once the page is first requested
+    from fastapi.templating import Jinja2Templates
+    templates = Jinja2Templates(directory="templates")
+    templates.env.globals["static_url"] = static_url
+    return templates
 
 # Include Routers
 app.include_router(auth_router.router, prefix="/auth", tags=["auth"])
 app.include_router(ws_router.router, tags=["websocket"])
+app.include_router(health_router.router, tags=["health"])
+app.include_router(admin_router.router, prefix="/admin", tags=["admin"])
+app.include_router(transcribe_router.router, prefix="/api", tags=["transcription"])
 
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    load_static_assets()
+
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
+    # Warm up upstream connections in the background; /readyz turns green when done.
+    # The Redis clients and HTTP pools are created here, nothing connects at import
+    app.state.warmup_task = asyncio.create_task(warm_up(
+        redis_clients=lazy_redis.all_clients(),
+        engine=engine
+    ))
+
+    # Filler clips of the default format are synthesized before the first slow turn
+    if settings.WS_FILLER_ENABLED:
+        filler_audio.filler_pool.preload(DEFAULT_AUDIO_FORMAT)
+
+    # Per-user usage is written to Redis in batches
+    metering.usage_meter.start()
+
+    # SIGTERM drains the websocket sessions before uvicorn shuts down
+    drainer.install_signal_handler()
+
     # Configure SSL if enabled (handled by Uvicorn, but we can log)
     if settings.SSL_CERT_FILE:
         logger.info(f"SSL Enabled with cert: {settings.SSL_CERT_FILE}")
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Pooled upstream connections are closed only once drained sessions are done with them
+    await drainer.wait()
+    for service in (llm_service, tts_service, asr_service):
+        await service.close_httpx_client()
+    await metering.usage_meter.stop()
+    await lazy_redis.close_all()
+    await loop_monitor.stop()
+    # Drain the background log queue before the process exits
+    await loguru_logger.complete()
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates().TemplateResponse(request, "index.html")
+
+@app.get("/sw.js")
+async def service_worker():
+    # Served from the root so it can control the whole origin; never cached
+    # so a new asset version is picked up on the next navigation
+    if not asset_manifest.service_worker:
+        raise HTTPException(status_code=404)
+    return Response(
+        content=asset_manifest.service_worker,
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+async def transcribe_upload(upload):
+    """
+    Transcribes an upload while it is still arriving.
+
+    Chunks go to the streaming Volcengine ASR as they are received, so the
+    final text is ready right after the last byte. Falls back to
+    transcribing the complete file if streaming ASR is off or fails; a
+    stream that completed without text (silence) is not transcribed again.
+    """
+    if settings.UPLOAD_STREAMING_ASR:
+        user_text, failed = "", False
+        async for result in VolcengineASRService().transcribe_stream(upload.chunks(), container=upload.container):
+            if result["type"] == "error":
+                failed = True
+                break
+            if result["type"] == "final":
+                user_text = result["text"]
+        if not failed:
+            return user_text
+        logger.warning("Streaming ASR failed, transcribing the whole upload instead")
 
-@app.post("/api/process_audio")
+    await upload.complete()
+    return await transcribe_audio(upload.body(), container=upload.container)
+
+# The body is parsed by StreamingUpload, so the form is only declared for the docs
+PROCESS_AUDIO_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["audio"],
+            "properties": {
+                "audio": {"type": "string", "format": "binary"},
+                "history": {"type": "string", "default": "[]"},
+                "audio_format": {"type": "string", "default": "mp3"},
+                "sample_rate": {"type": "integer"}
+            }
+        }}}
+    }
+}
+
+@app.post("/api/process_audio", openapi_extra=PROCESS_AUDIO_FORM)
 @limiter.limit("10/minute") # Rate limit
-async def process_audio(
-    request: Request,
-    audio: UploadFile = File(...),
-    history: str = Form("[]")
-):
-    # Input Validation
-    if not audio.filename.endswith(('.webm', '.mp3', '.wav', '.ogg')):
-         raise HTTPException(status_code=400, detail="Invalid file format. Supported formats: .webm, .mp3, .wav, .ogg")
-
-    # 10MB limit (approx)
-    audio_content = await audio.read()
-    if len(audio_content) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File too large. Max 10MB.")
+async def process_audio(request: Request):
+    """
+    Multipart form: `audio` (webm, ogg, wav or mp3, detected from its
+    content), `history` (JSON list), `audio_format`, `sample_rate`.
+
+    The body is read as it streams in: size and format are enforced
+    incrementally and ASR runs during the upload.
+    """
+    # Shed load before reading the upload
+    if drainer.draining:
+        DRAIN_REJECTIONS.labels("process_audio").inc()
+        retry_after = str(max(1, round(drainer.reconnect_after())))
+        raise HTTPException(status_code=503, detail="Server restarting, please retry.", headers={"Retry-After": retry_after})
+    if is_overloaded():
+        OVERLOAD_REJECTIONS.labels("process_audio").inc()
+        raise HTTPException(status_code=503, detail="Server overloaded, please retry later.", headers={"Retry-After": "5"})
+
+    bind_session()
+    recorder = FlightRecorder("process_audio").bind()
+    archive = session_archive.start("process_audio", content_type=request.headers.get("content-type"))
+
+    upload = StreamingUpload(request)
+    asr_task = None
+    try:
+        await upload.start()
+        recorder.record("upload_started", container=upload.container)
+        asr_task = asyncio.create_task(transcribe_upload(upload))
+        fields = await upload.complete()
+    except UploadRejected as e:
+        if asr_task is not None:
+            asr_task.cancel()
+        await upload.abort()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    recorder.record("upload_received", bytes=upload.audio_bytes)
+
+    # 1. ASR (already running, finishes shortly after the upload)
+    user_text = await asr_task
+    recorder.record("asr_final", chars=len(user_text or ""))
+
+    history = fields.get("history", "[]")
+    output_format = negotiate_audio_format(fields.get("audio_format", "mp3"), fields.get("sample_rate"))
+
+    def frame(data):
+        line = json.dumps(data) + "\n"
+        recorder.record("frame_sent", frame=data["type"], bytes=len(line))
+        return line
 
     async def event_generator():
-        # 1. ASR
-        user_text = await transcribe_audio(audio_content)
+        try:
+            async for line in pipeline():
+                yield line
+        finally:
+            recorder.finish_turn()
+            if archive is not None:
+                await archive.save()
 
+    async def pipeline():
+        nonlocal user_text
         if not user_text:
             user_text = ""
             ai_text = "抱歉，我没有听清，请再说一遍。"
             # Send Metadata immediately
-            yield json.dumps({
+            yield frame({
                 "type": "meta",
                 "user_text": user_text,
-                "ai_text": ai_text
-            }) + "\n"
+                "ai_text": ai_text,
+                "audio": output_format.describe()
+            })
 
             # Stream TTS for error message
             async def str_iterator_err(text):
                 yield text
 
-            async for chunk in text_to_speech_stream(str_iterator_err(ai_text)):
-                 yield json.dumps({
+            async for chunk in text_to_speech_stream(str_iterator_err(ai_text), audio_format=output_format):
+                 yield frame({
                     "type": "audio",
                     "data": base64.b64encode(chunk).decode('utf-8')
-                }) + "\n"
+                })
             return
 
         # 2. LLM
@@ -101,35 +252,55 @@ async def process_audio(
         # Accumulate LLM response
         ai_text_tokens = []
         async for token in chat_with_llm(user_text, history_list):
+            if not ai_text_tokens:
+                recorder.record("llm_first_token")
             ai_text_tokens.append(token)
+        recorder.record("llm_last_token", tokens=len(ai_text_tokens))
         ai_text = "".join(ai_text_tokens)
 
         # Send Metadata
-        yield json.dumps({
+        yield frame({
             "type": "meta",
             "user_text": user_text,
-            "ai_text": ai_text
-        }) + "\n"
+            "ai_text": ai_text,
+            "audio": output_format.describe()
+        })
 
         # 3. TTS Streaming
         async def str_iterator(text):
             yield text
 
-        async for chunk in text_to_speech_stream(str_iterator(ai_text)):
-            yield json.dumps({
+        async for chunk in text_to_speech_stream(str_iterator(ai_text), audio_format=output_format):
+            yield frame({
                 "type": "audio",
                 "data": base64.b64encode(chunk).decode('utf-8')
-            }) + "\n"
+            })
 
     return StreamingResponse(event_generator(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Runs the voice assistant server")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print where the import and boot time goes instead of serving")
+    if parser.parse_args().profile_startup:
+        import startup_profile
+        startup_profile.main([])
+        raise SystemExit
+
     import uvicorn
     # SSL config is passed via env vars or args in docker, but here we can support explicit start
     ssl_cert = settings.SSL_CERT_FILE
     ssl_key = settings.SSL_KEY_FILE
 
     if ssl_cert and ssl_key:
-        uvicorn.run(app, host=settings.HOST, port=settings.PORT, ssl_certfile=ssl_cert, ssl_keyfile=ssl_key)
+        uvicorn.run(
+            app, host=settings.HOST, port=settings.PORT, ssl_certfile=ssl_cert, ssl_keyfile=ssl_key, log_config=None,
+            ws_ping_interval=settings.WS_PING_INTERVAL, ws_ping_timeout=settings.WS_PING_TIMEOUT
+        )
     else:
-        uvicorn.run(app, host=settings.HOST, port=settings.PORT)
+        # log_config=None keeps uvicorn's loggers routed through setup_logging()
+        uvicorn.run(
+            app, host=settings.HOST, port=settings.PORT, log_config=None,
+            ws_ping_interval=settings.WS_PING_INTERVAL, ws_ping_timeout=settings.WS_PING_TIMEOUT
+        )
@@ -0,0 +1,428 @@
+"""
+Replays recorded sessions against local stand-ins and profiles their latency.
+
+Sessions are recorded with SESSION_RECORDING_ENABLED (see
+services/session_archive.py). A replay starts this checkout's app on a local
+port with the providers replaced by stand-ins that answer with the recorded
+ASR frames, LLM SSE and TTS SSE, at the recorded pace; the client audio is
+re-sent with its original timing. `--speed 4` compresses all of it (client
+and providers) four times. Redis caches always miss during a replay.
+
+The profile holds, per turn, the client-side latencies from the end of
+speech (finish_speaking, or the last upload byte) to asr_final, the first
+llm_token, the first audio and turn_end (websocket), or to meta, the first
+audio and the end of the response (/api/process_audio).
+
+Usage:
+    python replay_session.py run recordings/*.jsonl.gz --out base.json
+    git checkout my-branch
+    python replay_session.py run recordings/*.jsonl.gz --out new.json
+    python replay_session.py diff base.json new.json
+"""
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import sys
+import time
+from types import SimpleNamespace
+from urllib.parse import urlencode
+
+import httpx
+import uvicorn
+import websockets
+
+from auth import create_access_token
+from config import settings
+from services import asr_service, llm_service, tts_service, volcengine_asr
+from services.session_archive import load
+
+# Latencies of the websocket and the upload path, in profile order
+WS_METRICS = ("asr_final", "first_token", "first_audio", "turn_end")
+UPLOAD_METRICS = ("meta", "first_audio", "end")
+
+
+def upstream_recordings(events):
+    """Recorded upstream exchanges per service, in the order they were opened."""
+    streams = {}
+    for offset, stream, event, data in events:
+        if stream == "client":
+            continue
+        recording = streams.get(stream)
+        if recording is None:
+            recording = streams[stream] = {
+                "service": stream.split(":")[0], "opened": offset,
+                "status": 200, "status_at": offset, "data": [], "eos": None,
+            }
+        if event == "status":
+            recording["status"], recording["status_at"] = data, offset
+        elif event == "data":
+            recording["data"].append((offset, data))
+        elif event == "eos":
+            recording["eos"] = offset
+
+    by_service = {}
+    for recording in streams.values():
+        by_service.setdefault(recording["service"], collections.deque()).append(recording)
+    return by_service
+
+
+class NullRedis:
+    """Every cache lookup misses, so replays always reach the (stand-in) providers."""
+
+    async def eval(self, *args, **kwargs):
+        # Rate limit counter: always the first request of the window
+        return 1
+
+    def pipeline(self, *args, **kwargs):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        async def command(*args, **kwargs):
+            return None
+        return command
+
+
+class StandIns:
+    """
+    Local providers answering with the recorded streams of one archive.
+
+    Requests to a service get its recordings in the order they were made;
+    each response is paced relative to the replayed request as the original
+    was, divided by `speed`. Requests beyond the recording are answered with
+    an error and counted in `unmatched`.
+    """
+
+    def __init__(self, recordings, speed=1.0):
+        self.recordings = recordings
+        self.speed = speed
+        self.unmatched = collections.Counter()
+
+    def next(self, service):
+        queue = self.recordings.get(service)
+        if queue:
+            return queue.popleft()
+        self.unmatched[service] += 1
+        return None
+
+    async def sleep_until(self, start, offset_ms):
+        delay = start + offset_ms / 1000 / self.speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def transport(self, service):
+        async def handle(request):
+            start = time.monotonic()
+            recording = self.next(service)
+            if recording is None:
+                return httpx.Response(503, text="No recorded response left")
+            await self.sleep_until(start, recording["status_at"] - recording["opened"])
+
+            async def body():
+                for offset, data in recording["data"]:
+                    await self.sleep_until(start, offset - recording["opened"])
+                    yield data
+
+            return httpx.Response(recording["status"], content=body())
+        return httpx.MockTransport(handle)
+
+    def connect(self, url, **kwargs):
+        """Stands in for websockets.connect() in the Volcengine ASR client."""
+        return ReplayASRSocket(self, self.next("asr"))
+
+
+class ReplayASRSocket:
+    """
+    Recorded Volcengine frames. Frames the original server sent after the
+    last audio packet (the final result) wait for the replayed last packet.
+    """
+
+    def __init__(self, stand_ins, recording):
+        self.stand_ins = stand_ins
+        self.recording = recording
+        self.start = None
+        self.eos = asyncio.Event()
+        self.eos_at = None
+
+    async def __aenter__(self):
+        if self.recording is None:
+            raise ConnectionError("No recorded ASR connection left")
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send(self, message):
+        # MsgType=AudioOnly, Flags=LastPacket
+        if message[1] == 0x22:
+            self.eos_at = time.monotonic()
+            self.eos.set()
+
+    async def __aiter__(self):
+        recording = self.recording
+        for offset, frame in recording["data"]:
+            if recording["eos"] is not None and offset >= recording["eos"]:
+                await self.eos.wait()
+                await self.stand_ins.sleep_until(self.eos_at, offset - recording["eos"])
+            else:
+                await self.stand_ins.sleep_until(self.start, offset - recording["opened"])
+            yield frame
+
+
+def install(stand_ins):
+    """Points the app's provider clients and Redis caches at `stand_ins`."""
+    import main
+    from routers import ws_router
+
+    # Replays are not recorded again, nor mined by warm_cache.py
+    settings.SESSION_RECORDING_ENABLED = False
+    settings.CHAT_HISTORY_ENABLED = False
+    # A replay ends its sessions when it disconnects
+    settings.WS_RESUME_GRACE_SECONDS = 0
+    main.limiter.enabled = False
+    for service, module in (("asr_http", asr_service), ("llm", llm_service), ("tts", tts_service)):
+        module._client = httpx.AsyncClient(transport=stand_ins.transport(service))
+    volcengine_asr.websockets = SimpleNamespace(connect=stand_ins.connect)
+    for module in (llm_service, tts_service, ws_router):
+        module.redis_client = NullRedis()
+
+
+def _client_events(events):
+    return [(offset, event, data) for offset, stream, event, data in events if stream == "client"]
+
+
+def _is_finish(text):
+    try:
+        return json.loads(text).get("action") == "finish_speaking"
+    except (ValueError, AttributeError):
+        return False
+
+
+def _latencies(start, marks, metrics):
+    return {metric: round((marks[metric] - start) * 1000, 1) for metric in metrics if metric in marks}
+
+
+async def replay_ws(host, header, events, stand_ins, token, timeout):
+    """Re-sends the client side of a websocket session; returns its turns."""
+    params = {key: value for key, value in header["params"].items() if value is not None}
+    url = f"ws://{host}/ws/chat?{urlencode({**params, 'token': token})}"
+    # End of speech per turn, and the frames' arrival times per turn
+    finished = []
+    marks = [{}]
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def send():
+            start = time.monotonic()
+            spoke = False
+            for offset, event, data in _client_events(events):
+                await stand_ins.sleep_until(start, offset)
+                await ws.send(data)
+                if event == "audio":
+                    spoke = True
+                elif spoke and _is_finish(data):
+                    # finish_speaking without audio starts no turn
+                    finished.append(time.monotonic())
+                    spoke = False
+
+        async def receive():
+            async for message in ws:
+                now = time.monotonic()
+                turn = marks[-1]
+                if isinstance(message, bytes):
+                    turn.setdefault("first_audio", now)
+                    continue
+                kind = json.loads(message).get("type")
+                if kind == "asr_final":
+                    turn.setdefault("asr_final", now)
+                elif kind == "llm_token":
+                    turn.setdefault("first_token", now)
+                elif kind == "error":
+                    turn["errors"] = turn.get("errors", 0) + 1
+                elif kind == "turn_end":
+                    turn["turn_end"] = now
+                    marks.append({})
+                    if sender.done() and len(marks) > len(finished):
+                        return
+
+        sender = asyncio.create_task(send())
+        receiver = asyncio.create_task(receive())
+        try:
+            await sender
+            if len(marks) <= len(finished):
+                await asyncio.wait_for(receiver, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            receiver.cancel()
+
+    turns = []
+    for n, start in enumerate(finished):
+        turn = marks[n] if n < len(marks) else {}
+        turns.append({"turn": n + 1, **_latencies(start, turn, WS_METRICS), "errors": turn.get("errors", 0)})
+    return turns
+
+
+async def replay_upload(host, header, events, stand_ins, timeout):
+    """Re-posts a /api/process_audio upload with its chunk timing; returns its one turn."""
+    uploaded = None
+
+    async def body():
+        nonlocal uploaded
+        start = time.monotonic()
+        for offset, event, data in _client_events(events):
+            if event == "body":
+                await stand_ins.sleep_until(start, offset)
+                yield data
+        uploaded = time.monotonic()
+
+    marks = {}
+    headers = {"content-type": header["params"]["content_type"]}
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async with client.stream("POST", f"http://{host}/api/process_audio", content=body(), headers=headers) as response:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                kind = json.loads(line).get("type")
+                if kind in ("meta", "audio"):
+                    marks.setdefault("meta" if kind == "meta" else "first_audio", time.monotonic())
+            marks["end"] = time.monotonic()
+
+    turn = {"turn": 1, **_latencies(uploaded or marks["end"], marks, UPLOAD_METRICS)}
+    if response.status_code != 200:
+        turn["errors"] = 1
+    return [turn]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(turns):
+    summary = {}
+    for metric in WS_METRICS + UPLOAD_METRICS:
+        values = [turn[metric] for turn in turns if metric in turn]
+        if values:
+            summary[metric] = {
+                "count": len(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "mean": round(sum(values) / len(values), 1),
+            }
+    return summary
+
+
+async def replay(paths, speed=1.0, timeout=30.0, user="replay"):
+    """Replays each archive in turn against one local server; returns the profile."""
+    import main
+
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=0, lifespan="off", log_config=None, log_level="warning")
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.01)
+    host = "127.0.0.1:%d" % server.servers[0].sockets[0].getsockname()[1]
+    token = create_access_token({"sub": user})
+
+    profile = {"speed": speed, "archives": [], "turns": [], "unmatched": collections.Counter()}
+    try:
+        for path in paths:
+            header, events = load(path)
+            stand_ins = StandIns(upstream_recordings(events), speed)
+            install(stand_ins)
+            if header["kind"] == "ws_chat":
+                turns = await replay_ws(host, header, events, stand_ins, token, timeout)
+            else:
+                turns = await replay_upload(host, header, events, stand_ins, timeout)
+            # Let the last turn's upstream requests reach the stand-ins
+            await asyncio.sleep(0.05)
+            name = os.path.basename(path)
+            profile["archives"].append(name)
+            profile["turns"].extend({"archive": name, **turn} for turn in turns)
+            profile["unmatched"].update(stand_ins.unmatched)
+            if header.get("truncated"):
+                print(f"{name}: archive is truncated, replayed up to its end", file=sys.stderr)
+    finally:
+        server.should_exit = True
+        await serving
+
+    profile["unmatched"] = dict(profile["unmatched"])
+    profile["summary"] = summarize(profile["turns"])
+    return profile
+
+
+def diff_profiles(base, new):
+    """(metric, stat, base ms, new ms, delta ms) for the metrics both profiles have."""
+    rows = []
+    for metric, stats in base["summary"].items():
+        if metric not in new["summary"]:
+            continue
+        for stat in ("p50", "p95"):
+            before, after = stats[stat], new["summary"][metric][stat]
+            rows.append((metric, stat, before, after, round(after - before, 1)))
+    return rows
+
+
+def print_summary(profile):
+    print(f"{len(profile['turns'])} turns from {len(profile['archives'])} archives at {profile['speed']}x", file=sys.stderr)
+    print(f"{'metric':<14}{'count':>7}{'p50':>10}{'p95':>10}{'mean':>10}", file=sys.stderr)
+    for metric, stats in profile["summary"].items():
+        print(f"{metric:<14}{stats['count']:>7}{stats['p50']:>8.0f}ms{stats['p95']:>8.0f}ms{stats['mean']:>8.0f}ms", file=sys.stderr)
+    if profile["unmatched"]:
+        print(f"Requests without a recording (answered with errors): {profile['unmatched']}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded sessions and compare latency profiles.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Replay archives against this checkout")
+    run.add_argument("archives", nargs="+")
+    run.add_argument("--speed", type=float, default=1.0, help="Time compression, 1 = original timing")
+    run.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for outstanding replies")
+    run.add_argument("--user", default="replay", help="Username in the replay's access token")
+    run.add_argument("--out", help="Write the profile here (default: stdout)")
+
+    diff = commands.add_parser("diff", help="Compare two profiles")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "diff":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        if base["speed"] != new["speed"]:
+            print(f"Warning: profiles replayed at different speeds ({base['speed']}x vs {new['speed']}x)", file=sys.stderr)
+        print(f"{'metric':<14}{'':<5}{'base':>10}{'new':>10}{'delta':>10}")
+        for metric, stat, before, after, delta in diff_profiles(base, new):
+            change = f" ({delta / before:+.0%})" if before else ""
+            print(f"{metric:<14}{stat:<5}{before:>8.0f}ms{after:>8.0f}ms{delta:>+8.0f}ms{change}")
+        return 0
+
+    profile = asyncio.run(replay(args.archives, args.speed, args.timeout, args.user))
+    print_summary(profile)
+    output = json.dumps(profile, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
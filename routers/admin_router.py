@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, Query
+from config import settings
+from routers.deps import require_admin
+from services.loop_monitor import loop_monitor
+from services.flight_recorder import slow_turns
+from services.drain import drainer
+from services.metering import usage_meter
+
+router = APIRouter()
+
+@router.get("/loop")
+async def loop_health(admin: str = Depends(require_admin)):
+    # Current lag and the most recent stalls, newest first
+    return loop_monitor.report()
+
+@router.get("/slow_turns")
+async def recent_slow_turns(limit: int = Query(20, ge=1, le=1000), admin: str = Depends(require_admin)):
+    # Timelines of turns that missed FLIGHT_RECORDER_SLO, newest first
+    return {"slo": settings.FLIGHT_RECORDER_SLO, "turns": slow_turns.recent(limit)}
+
+@router.get("/usage")
+async def usage(
+    day: str | None = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    user: str | None = None,
+    admin: str = Depends(require_admin)
+):
+    # Upstream usage by user for one day (UTC, default today), including counts not flushed yet
+    report = await usage_meter.query(day, user)
+    return {"day": day or usage_meter.day, "quotas": usage_meter.quotas, "users": report}
+
+@router.post("/drain")
+async def start_drain(admin: str = Depends(require_admin)):
+    # Takes this instance out of rotation; the process keeps running until it is stopped
+    drainer.start(f"admin:{admin}")
+    return drainer.report()
+
+@router.get("/drain")
+async def drain_status(admin: str = Depends(require_admin)):
+    return drainer.report()
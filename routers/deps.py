@@ -0,0 +1,24 @@
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from auth import verify_token
+from config import settings
+
+bearer = HTTPBearer(auto_error=False)
+
+# Per client address, shared by main and the routers
+limiter = Limiter(key_func=get_remote_address)
+
+async def require_user(credentials: HTTPAuthorizationCredentials | None = Depends(bearer)):
+    # Username from a valid access token
+    user = verify_token(credentials.credentials) if credentials else None
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return user
+
+async def require_admin(user: str = Depends(require_user)):
+    # Access token of a user listed in ADMIN_USERS
+    if user not in settings.ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return user
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services import warmup
+
+router = APIRouter()
+
+@router.get("/healthz")
+async def healthz():
+    # Liveness: the event loop is serving requests
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz():
+    # Readiness: warm-up finished, upstream connections are established
+    report = warmup.readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
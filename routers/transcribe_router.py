@@ -0,0 +1,40 @@
+import json
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from config import settings
+from routers.deps import limiter, require_user
+from services.batch_transcribe import BatchItem, transcribe_batch
+from services.concurrency import is_overloaded
+from services.drain import drainer
+from services.metrics import DRAIN_REJECTIONS, OVERLOAD_REJECTIONS
+
+router = APIRouter()
+
+@router.post("/transcribe_batch")
+@limiter.limit("5/minute") # Each request is up to BATCH_MAX_FILES transcriptions
+async def transcribe_batch_endpoint(request: Request, files: list[UploadFile] = File(...), user: str = Depends(require_user)):
+    """
+    Transcribes many audio files at once.
+
+    Streams one NDJSON line per file as soon as it is done (completion
+    order); `index` is the file's position in the request.
+    """
+    # Shed load before fanning out to ASR
+    if drainer.draining:
+        DRAIN_REJECTIONS.labels("transcribe_batch").inc()
+        retry_after = str(max(1, round(drainer.reconnect_after())))
+        raise HTTPException(status_code=503, detail="Server restarting, please retry.", headers={"Retry-After": retry_after})
+    if is_overloaded():
+        OVERLOAD_REJECTIONS.labels("transcribe_batch").inc()
+        raise HTTPException(status_code=503, detail="Server overloaded, please retry later.", headers={"Retry-After": "5"})
+
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files. Max {settings.BATCH_MAX_FILES}.")
+
+    items = [BatchItem(i, f.filename or f"file{i}", f.read) for i, f in enumerate(files)]
+
+    async def results():
+        async for result in transcribe_batch(items):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
@@ -7,13 +7,40 @@ from auth import verify_token
 from services.volcengine_asr import VolcengineASRService
 from services.llm_service import chat_with_llm
 from services.tts_service import text_to_speech_stream
-from redis.asyncio import Redis
+from services.ws_session import (
+    AudioInbox,
+    OutboundWriter,
+    AudioOverflowError,
+    SessionClosedError,
+    TokenBatcher,
+    TurnSequencer,
+    sessions,
+    CLOSED,
+    WS_CLOSE_AUDIO_OVERFLOW,
+    WS_CLOSE_IDLE_TIMEOUT,
+    WS_CLOSE_OVERLOADED,
+    WS_CLOSE_QUOTA_EXCEEDED,
+    WS_CLOSE_RESUMED,
+    WS_CLOSE_SERVICE_RESTART
+)
+from services.concurrency import is_overloaded
+from services.audio_format import negotiate_audio_format
+from services.metrics import DRAIN_REJECTIONS, OVERLOAD_REJECTIONS, USAGE_QUOTA_REJECTIONS, WS_IDLE_SESSIONS, WS_SESSION_RESUMES
 from config import settings
+from log_context import bind_session, bind_turn, sampled
+from services.flight_recorder import FlightRecorder, record
+from services.chat_history import record_exchange
+from services.filler_audio import FillerTimer
+from services.endpointing import Endpointer, WebmContinuation
+from services import session_archive
+from services.lazy_redis import LazyRedis
+from services.drain import drainer
+from services.metering import bind_user, usage_meter
 import time
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+redis_client = LazyRedis(decode_responses=True)
 
 # Rate Limits (Simple Redis Implementation)
 # 60 requests per minute per user
@@ -78,7 +105,17 @@ async def check_rate_limit(user: str):
     return True
 
 @router.websocket("/ws/chat")
-async def websocket_chat(websocket: WebSocket, token: str = None):
+async def websocket_chat(
+    websocket: WebSocket,
+    token: str = None,
+    audio_format: str = None,
+    sample_rate: int = None,
+    token_flush_ms: int = None,
+    token_flush_chars: int = None,
+    session_id: str = None,
+    last_seq: int = 0,
+    endpointing: bool = None
+):
     # Verify Token
     if not token:
         token = websocket.query_params.get("token")
@@ -92,117 +129,421 @@ async def websocket_chat(websocket: WebSocket, token: str = None):
     if not await check_rate_limit(user):
         await websocket.close(code=4008, reason="Rate Limit Exceeded")
         return
+    bind_user(user)
+
+    # A client reconnecting within the grace period continues its session
+    session = sessions.get(session_id, user) if session_id else None
+
+    # A draining instance only lets clients back into their running sessions
+    if session is None and drainer.draining:
+        DRAIN_REJECTIONS.labels("ws_chat").inc()
+        await websocket.close(code=WS_CLOSE_SERVICE_RESTART, reason="Service Restart")
+        return
+
+    # Daily quotas, with this user's usage on other instances included
+    if session is None and usage_meter.quotas:
+        await usage_meter.refresh(user)
+        if (exceeded := usage_meter.over_quota(user)) is not None:
+            USAGE_QUOTA_REJECTIONS.labels(exceeded).inc()
+            await websocket.close(code=WS_CLOSE_QUOTA_EXCEEDED, reason="Quota Exceeded")
+            return
+
+    # Shed load before opening any upstream connection (a resume opens none)
+    if session is None and is_overloaded():
+        OVERLOAD_REJECTIONS.labels("ws_chat").inc()
+        await websocket.close(code=WS_CLOSE_OVERLOADED, reason="Server Overloaded")
+        return
 
     await websocket.accept()
-    logger.info(f"WebSocket connected: {user}")
 
-    asr_service = VolcengineASRService()
+    if session is not None:
+        resumed = False
+        if session.writer.can_resume(last_seq):
+            # Current before the first await: the old socket's handler may see
+            # its disconnect meanwhile and must not detach the session
+            connection = session.connect()
+            bind_session(session.session_id)
+            session.recorder.bind()
+            if session.archive is not None:
+                session.archive.bind()
+            previous = session.writer.websocket
+            # Not numbered: announces the replay that follows
+            await websocket.send_json({"type": "resumed", "session_id": session.session_id, "last_seq": last_seq})
+            resumed = await session.writer.attach(websocket, last_seq)
+        if resumed:
+            WS_SESSION_RESUMES.labels("resumed").inc()
+            record("resumed", last_seq=last_seq, replay=session.writer.seq - last_seq)
+            logger.info(f"WebSocket resumed: {user} after seq {last_seq}")
+            if previous is not None:
+                # Half-open socket the server had not noticed yet
+                try:
+                    await previous.close(code=WS_CLOSE_RESUMED, reason="Session Resumed")
+                except Exception:
+                    pass
+        else:
+            # The frames the client missed are gone, it starts over
+            WS_SESSION_RESUMES.labels("gap").inc()
+            await session.close()
+            session = None
+    elif session_id:
+        WS_SESSION_RESUMES.labels("unknown").inc()
+
+    if session is None:
+        session_id = bind_session()
+        recorder = FlightRecorder("ws_chat").bind()
+        logger.info(f"WebSocket connected: {user}")
+
+        # TTS output format, negotiated once per session
+        session_audio = negotiate_audio_format(audio_format, sample_rate)
+        # llm_token coalescing window, clamped so a client cannot stall its own text
+        flush_ms = min(max(settings.WS_TOKEN_FLUSH_MS if token_flush_ms is None else token_flush_ms, 0), 1000)
+        flush_chars = min(max(settings.WS_TOKEN_FLUSH_CHARS if token_flush_chars is None else token_flush_chars, 1), 4096)
+        # Turns end on the server's end-of-speech detection as well as on finish_speaking
+        auto_endpoint = settings.WS_ENDPOINTING if endpointing is None else endpointing
+
+        asr_service = VolcengineASRService()
+
+        # Bounded buffers: audio in, frames out
+        audio_queue = AudioInbox(
+            max_chunks=settings.WS_AUDIO_QUEUE_MAX_CHUNKS,
+            max_bytes=settings.WS_AUDIO_QUEUE_MAX_BYTES,
+            policy=settings.WS_AUDIO_OVERFLOW_POLICY,
+            overflow_timeout=settings.WS_AUDIO_OVERFLOW_TIMEOUT
+        )
+        grace = settings.WS_RESUME_GRACE_SECONDS
+        writer = OutboundWriter(
+            websocket,
+            max_bytes=settings.WS_SEND_QUEUE_MAX_BYTES,
+            slow_consumer_timeout=settings.WS_SLOW_CONSUMER_TIMEOUT,
+            replay_bytes=settings.WS_REPLAY_MAX_BYTES if grace > 0 else 0
+        ).start()
+        session = sessions.open(session_id, user, writer, audio_queue, grace)
+        connection = session.connect()
+        session.recorder = recorder
+        session.archive = session_archive.start(
+            "ws_chat",
+            audio_format=audio_format,
+            sample_rate=sample_rate,
+            token_flush_ms=token_flush_ms,
+            token_flush_chars=token_flush_chars,
+            endpointing=endpointing
+        )
+        await writer.send_json({
+            "type": "session",
+            "session_id": session_id,
+            "resume_grace": grace,
+            "audio": session_audio.describe()
+        })
 
-    # Queues
-    audio_queue = asyncio.Queue()
+    writer = session.writer
+    audio_queue = session.inbox
 
     # Max Audio Size in one Session (e.g. 50MB) for safety
     TOTAL_AUDIO_LIMIT = 50 * 1024 * 1024
-    received_bytes = 0
 
     async def receive_audio_from_client():
-        nonlocal received_bytes
+        """Returns True if the client went away (the session may be resumed)."""
         try:
             while True:
                 data = await websocket.receive()
+                if data["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(data.get("code", 1000))
+                session.touch()
 
-                if "bytes" in data:
+                if data.get("bytes") is not None:
                     chunk_size = len(data["bytes"])
 
                     # Size Check
                     if chunk_size > 2 * 1024 * 1024: # 2MB chunk limit
-                        logger.warning(f"Audio chunk too large from {user}")
+                        if (suppressed := sampled("ws_chunk_too_large")) is not None:
+                            logger.warning(f"Audio chunk too large from {user} (+{suppressed} suppressed)")
                         continue
 
-                    received_bytes += chunk_size
-                    if received_bytes > TOTAL_AUDIO_LIMIT:
+                    session.received_bytes += chunk_size
+                    record("audio_chunk", bytes=chunk_size)
+                    session_archive.capture("client", "audio", data["bytes"])
+                    if session.received_bytes > TOTAL_AUDIO_LIMIT:
                         logger.warning(f"Total audio limit exceeded for {user}")
-                        await websocket.send_json({"type": "error", "message": "Session limit reached. Please reconnect."})
-                        await audio_queue.put(None)
+                        await writer.send_json({"type": "error", "message": "Session limit reached. Please reconnect."})
                         break
 
-                    await audio_queue.put(data["bytes"])
+                    # After drain() the inbox is closed and audio is ignored on purpose
+                    if not await audio_queue.put(data["bytes"]) and session.farewell is None:
+                        if (suppressed := sampled("ws_chunk_dropped")) is not None:
+                            logger.warning(f"Audio chunk dropped for {user}, ASR is falling behind (+{suppressed} suppressed)")
 
-                elif "text" in data:
+                elif data.get("text") is not None:
+                    session_archive.capture("client", "text", data["text"])
                     try:
                         msg = json.loads(data["text"])
                         if msg.get("action") == "finish_speaking":
-                             await audio_queue.put(None)
+                             record("finish_speaking")
+                             audio_queue.end_utterance()
                     except:
                         pass
         except WebSocketDisconnect:
             logger.info("Client disconnected")
-            await audio_queue.put(None)
+            return True
+        except AudioOverflowError as e:
+            logger.warning(f"Audio overflow for {user}: {e}")
+            try:
+                await websocket.close(code=WS_CLOSE_AUDIO_OVERFLOW, reason="Audio Buffer Overflow")
+            except Exception:
+                pass
+        except SessionClosedError:
+            pass
         except Exception as e:
             logger.error(f"Receive Error: {e}")
-            await audio_queue.put(None)
+        return False
 
     async def pipeline_worker():
-        while True:
-            chunk = await audio_queue.get()
-            if chunk is None:
-                if audio_queue.empty():
-                     break
-                else:
-                     continue
-
-            async def single_turn_gen(first_chunk):
-                yield first_chunk
-                while True:
-                    c = await audio_queue.get()
-                    if c is None:
-                        break
-                    yield c
-
-            # 1. ASR
-            user_text = ""
-            try:
-                async for asr_result in asr_service.transcribe_stream(single_turn_gen(chunk)):
-                    if asr_result["type"] == "error":
-                        await websocket.send_json({"type": "error", "message": asr_result["text"]})
-                        break
-
-                    if asr_result["type"] == "partial":
-                         await websocket.send_json({"type": "asr_partial", "text": asr_result["text"]})
-
-                    if asr_result["type"] == "final":
-                        user_text = asr_result["text"]
-                        await websocket.send_json({"type": "asr_final", "text": user_text})
-            except Exception as e:
-                logger.error(f"ASR Error: {e}")
-                await websocket.send_json({"type": "error", "message": "Speech recognition failed"})
-                continue
+        """
+        ASR, LLM and TTS run as separate stage workers joined by bounded queues
+        of turns, so the next utterance is recognised while the current reply is
+        still being generated and spoken. The sequencer keeps each turn's
+        frames together and in order.
+        """
+        # Turn ids continue across hibernations
+        sequencer = session.sequencer = TurnSequencer(
+            writer, max_held_bytes=settings.WS_SEND_QUEUE_MAX_BYTES, first_turn=session.turns + 1
+        )
+        # Pending filler clips by turn, started at asr_final, closed at the first answer audio
+        fillers: dict[int, FillerTimer] = {}
+        # (turn_id, user_text) from ASR, (turn_id, tokens or None) from LLM
+        to_llm: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_PIPELINE_TURNS_AHEAD)
+        to_tts: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_PIPELINE_TURNS_AHEAD)
+
+        async def asr_stage():
+            # The next utterance of a recording the server cut may start mid-stream
+            webm = WebmContinuation()
+            while True:
+                chunk = await audio_queue.get()
+                if chunk is CLOSED:
+                    break
+                if chunk is None:
+                    # finish_speaking without any audio
+                    continue
+                session.turns += 1
+                turn_id = session.turns
+                bind_turn(turn_id)
+                record("turn_start", turn=turn_id)
+                lane = sequencer.lane(turn_id)
+                endpointer = Endpointer(
+                    lambda reason: audio_queue.end_utterance(tail=settings.WS_ENDPOINT_TAIL)
+                ) if auto_endpoint else None
+
+                async def single_turn_gen(first_chunk):
+                    yield first_chunk
+                    while True:
+                        c = await audio_queue.get()
+                        if c is None or c is CLOSED:
+                            if endpointer is not None:
+                                endpointer.client_ended()
+                            break
+                        yield c
+
+                # 1. ASR
+                user_text = ""
+                announced = False
+                try:
+                    async for asr_result in asr_service.transcribe_stream(webm.utterance(single_turn_gen(chunk))):
+                        if asr_result["type"] == "error":
+                            await lane.send_json({"type": "error", "message": asr_result["text"]})
+                            break
+
+                        if asr_result["type"] == "partial":
+                             record("asr_partial")
+                             await lane.send_json({"type": "asr_partial", "text": asr_result["text"]})
+                             if endpointer is not None:
+                                 endpointer.observe(asr_result)
+
+                        if endpointer is not None and endpointer.fired and not announced:
+                            # Not sequenced: the client should stop recording now, not after earlier replies
+                            announced = True
+                            await writer.send_json({"type": "endpoint", "reason": endpointer.reason})
+
+                        if asr_result["type"] == "final":
+                            user_text = asr_result["text"]
+                            record("asr_final", chars=len(user_text), turn=turn_id)
+                            await lane.send_json({"type": "asr_final", "text": user_text})
+                            if user_text and settings.WS_FILLER_ENABLED:
+                                fillers[turn_id] = FillerTimer(lane, session_audio).start()
+                except SessionClosedError:
+                    raise
+                except Exception as e:
+                    logger.error(f"ASR Error: {e}")
+                    await lane.send_json({"type": "error", "message": "Speech recognition failed"})
+                    await lane.end()
+                    continue
+                finally:
+                    if endpointer is not None:
+                        endpointer.close()
+
+                await to_llm.put((turn_id, user_text))
+            await to_llm.put(None)
+
+        async def llm_stage():
+            while (item := await to_llm.get()) is not None:
+                turn_id, user_text = item
+                bind_turn(turn_id)
+                if not user_text:
+                    await to_tts.put((turn_id, None))
+                    continue
+                # A long session can use up the quota it started under
+                if (exceeded := usage_meter.over_quota(user)) is not None:
+                    USAGE_QUOTA_REJECTIONS.labels(exceeded).inc()
+                    await sequencer.lane(turn_id).send_json({"type": "error", "message": "Daily usage limit reached"})
+                    await to_tts.put((turn_id, None))
+                    continue
+
+                # 2. LLM (Stream), tokens handed to TTS as they arrive
+                tokens: asyncio.Queue = asyncio.Queue()
+                await to_tts.put((turn_id, tokens))
+                lane = sequencer.lane(turn_id)
+                reply = []
+                batcher = TokenBatcher(lane, flush_ms, flush_chars)
+                try:
+                    async for token in chat_with_llm(user_text):
+                         if not reply:
+                             record("llm_first_token")
+                         reply.append(token)
+                         await batcher.add(token)
+                         tokens.put_nowait(token)
+                    record("llm_last_token", tokens=len(reply))
+                    await batcher.close()
+                    if settings.CHAT_HISTORY_ENABLED:
+                        # Mined by warm_cache.py
+                        record_exchange(user, user_text, "".join(reply))
+                except SessionClosedError:
+                    raise
+                except Exception as e:
+                    logger.error(f"LLM Error: {e}")
+                    await batcher.close()
+                    await lane.send_json({"type": "error", "message": "AI processing failed"})
+                finally:
+                    tokens.put_nowait(None)
+            await to_tts.put(None)
+
+        async def tts_stage():
+            while (item := await to_tts.get()) is not None:
+                turn_id, tokens = item
+                bind_turn(turn_id)
+                lane = sequencer.lane(turn_id)
+
+                async def text_iterator():
+                    while (token := await tokens.get()) is not None:
+                        yield token
 
-            if user_text:
-                # 2. LLM (Stream)
-                async def llm_iterator_wrapper():
+                # 3. TTS (Stream)
+                filler = fillers.pop(turn_id, None)
+                if tokens is not None:
                     try:
-                        async for token in chat_with_llm(user_text):
-                             await websocket.send_json({"type": "llm_token", "text": token})
-                             yield token
+                        async for audio_chunk in text_to_speech_stream(text_iterator(), audio_format=session_audio):
+                            if filler is not None:
+                                # The answer follows a clip already started, never overlaps it
+                                await filler.close()
+                                filler = None
+                            await lane.send_bytes(audio_chunk)
+                    except SessionClosedError:
+                        raise
                     except Exception as e:
-                        logger.error(f"LLM Error: {e}")
-                        await websocket.send_json({"type": "error", "message": "AI processing failed"})
+                        logger.error(f"TTS Error: {e}")
+                        # TTS error might happen mid-stream, hard to recover gracefully for user except logging
+
+                if filler is not None:
+                    await filler.close()
+                await lane.send_json({"type": "turn_end"})
+                await lane.end()
+                # Let the writer flush the turn before judging its latency
+                await writer.drain()
+                recorder.finish_turn(turn_id)
+
+        stages = [asyncio.create_task(stage()) for stage in (asr_stage, llm_stage, tts_stage)]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+            for filler in fillers.values():
+                filler.cancel()
+
+    if session.pipeline is None and session.pipeline_factory is None:
+        session.start_pipeline(pipeline_worker)
+
+    async def watch_idle():
+        """
+        Returns once the receiver or the pipeline is done, or with True once
+        the session was closed for idling. Meanwhile an idle session
+        hibernates, and wakes on the client's next message.
+        """
+        hibernate_after, close_after = settings.WS_IDLE_HIBERNATE, settings.WS_IDLE_TIMEOUT
+        while True:
+            idle_for = time.monotonic() - session.last_activity
+            deadlines = [close_after - idle_for] if close_after > 0 else []
+            if hibernate_after > 0 and not session.hibernated:
+                deadlines.append(hibernate_after - idle_for)
+            timeout = max(min(deadlines), 0) if deadlines else None
+
+            if session.hibernated:
+                waiting = {receiver, session.wakeup}
+            else:
+                waiting = {receiver} if session.pipeline is None else {receiver, session.pipeline}
+            # Not keeping the pending set: it would hold a hibernated pipeline's task and frames
+            done = (await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED))[0]
+            if receiver in done or (session.pipeline is not None and session.pipeline in done):
+                return False
+            if session.hibernated and session.wakeup.done():
+                session.wake()
+                continue
+            if done:
+                continue
 
-                # 3. TTS (Stream)
+            idle_for = time.monotonic() - session.last_activity
+            if not session.idle:
+                # A long turn is activity too
+                session.touch()
+            elif close_after > 0 and idle_for >= close_after:
+                WS_IDLE_SESSIONS.labels("closed").inc()
+                logger.info(f"Closing session {session.session_id}, idle for {idle_for:.0f}s")
                 try:
-                    async for audio_chunk in text_to_speech_stream(llm_iterator_wrapper()):
-                        await websocket.send_bytes(audio_chunk)
-                except Exception as e:
-                    logger.error(f"TTS Error: {e}")
-                    # TTS error might happen mid-stream, hard to recover gracefully for user except logging
-
-            await websocket.send_json({"type": "turn_end"})
-
+                    await websocket.close(code=WS_CLOSE_IDLE_TIMEOUT, reason="Idle Timeout")
+                except Exception:
+                    pass
+                return True
+            elif hibernate_after > 0 and idle_for >= hibernate_after:
+                await session.hibernate()
+
+    receiver = asyncio.create_task(receive_audio_from_client())
+    detached = False
     try:
-        await asyncio.gather(
-            receive_audio_from_client(),
-            pipeline_worker()
-        )
+        if await watch_idle():
+            # Closed for idling: the session ends with its socket
+            pass
+        elif receiver.done():
+            if not session.is_current(connection):
+                # Replaced by a newer socket of the same session
+                detached = True
+            elif receiver.result() and session.resumable:
+                if session.hibernated and not audio_queue.empty():
+                    # Audio arrived just before the drop
+                    session.wake()
+                # The turn in progress keeps going; whatever was said so far is transcribed
+                if not session.hibernated:
+                    audio_queue.end_utterance()
+                await session.disconnect(connection)
+                detached = True
+                logger.info(f"Holding session {session.session_id} for {session.grace}s")
+            else:
+                audio_queue.close()
+                if session.pipeline is not None:
+                    await session.pipeline
+        else:
+            session.pipeline.result()
+    except SessionClosedError:
+        logger.info(f"Session closed while sending: {user}")
     except Exception as e:
         logger.error(f"WS Handler Error: {e}")
+    finally:
+        receiver.cancel()
+        if not detached and session.is_current(connection):
+            await session.close()
@@ -1,25 +1,51 @@
-import httpx
 import logging
+from typing import TYPE_CHECKING
 from config import settings
+from services.concurrency import get_limiter
+from services import session_archive
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
-async def transcribe_audio(audio_data):
+ASR_URL = "https://api.siliconflow.cn/v1/audio/transcriptions"
+
+# Shared Client (created lazily, reused across requests; httpx is imported with it)
+_client: "httpx.AsyncClient | None" = None
+
+async def get_httpx_client():
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        limits = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+        _client = httpx.AsyncClient(limits=limits, timeout=30.0)
+    return _client
+
+async def close_httpx_client():
+    # On shutdown, after the last session using the pool is gone
+    if _client is not None:
+        await _client.aclose()
+
+# Upload content types by container (see upload_ingest.sniff_audio_container)
+CONTENT_TYPES = {"webm": "audio/webm", "ogg": "audio/ogg", "wav": "audio/wav", "mp3": "audio/mpeg"}
+
+async def transcribe_audio(audio_data, container="webm"):
     """
     Transcribes audio data using SiliconFlow's TeleSpeechASR.
 
     Args:
         audio_data (bytes): The audio file content (e.g., mp3 or wav bytes).
+        container (str): Container of `audio_data`, used for the upload's
+            filename and content type.
 
     Returns:
         str: The transcribed text, or None if failed.
     """
-    url = "https://api.siliconflow.cn/v1/audio/transcriptions"
-
     # TeleSpeechASR usually expects a file upload.
     # Based on standard OpenAI-compatible ASR endpoints:
     files = {
-        'file': ('audio.webm', audio_data, 'audio/webm'),
+        'file': (f'audio.{container}', audio_data, CONTENT_TYPES.get(container, 'audio/webm')),
         'model': (None, 'TeleAI/TeleSpeech-ASR1.0'),
     }
 
@@ -28,8 +54,12 @@ async def transcribe_audio(audio_data):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, files=files)
+        client = await get_httpx_client()
+        upstream = session_archive.upstream("asr_http", bytes=len(audio_data))
+        async with get_limiter("siliconflow").acquire():
+            response = await client.post(ASR_URL, headers=headers, files=files)
+        upstream.record("status", response.status_code)
+        upstream.record("data", response.content)
 
         if response.status_code == 200:
             result = response.json()
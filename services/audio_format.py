@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from config import settings
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """Output encoding requested from the TTS provider for one session."""
+    format: str
+    sample_rate: int
+    # Only meaningful for compressed formats
+    bitrate: int | None = None
+    channel: int = 1
+
+    @property
+    def key(self):
+        """Stable identifier used in cache keys and metric labels."""
+        return f"{self.format}_{self.sample_rate}_{self.bitrate or 0}_{self.channel}"
+
+    def audio_setting(self):
+        """The `audio_setting` block of a Minimax t2a_v2 request."""
+        setting = {
+            "sample_rate": self.sample_rate,
+            "format": self.format,
+            "channel": self.channel
+        }
+        if self.bitrate:
+            setting["bitrate"] = self.bitrate
+        return setting
+
+    def describe(self):
+        """What the client needs to decode the audio frames."""
+        info = {"format": self.format, "sample_rate": self.sample_rate, "channel": self.channel}
+        if self.format == "pcm":
+            # Raw little-endian 16 bit samples, no container
+            info["sample_width"] = 2
+        return info
+
+    def pcm_duration(self, num_bytes):
+        """Seconds of speech in `num_bytes`, or None for compressed formats."""
+        if self.format != "pcm":
+            return None
+        return num_bytes / (self.sample_rate * 2 * self.channel)
+
+
+# Named presets a client can ask for
+PRESETS = {
+    # Previous fixed behaviour
+    "mp3": AudioFormat("mp3", 32000, 128000),
+    # Voice-grade MP3 for cellular clients (~4 KB/s)
+    "mp3_low": AudioFormat("mp3", 16000, 32000),
+    # No decode step on the client, lowest playback latency
+    "pcm": AudioFormat("pcm", 16000),
+    "pcm_24k": AudioFormat("pcm", 24000),
+    # Only used when every TTS endpoint can produce it (TTS_AUDIO_FORMATS)
+    "opus": AudioFormat("opus", 16000, 32000),
+}
+
+DEFAULT_AUDIO_FORMAT = PRESETS["mp3"]
+
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100)
+
+
+def negotiate_audio_format(requested=None, sample_rate=None):
+    """
+    Picks the output format for a session.
+
+    Args:
+        requested (str): Comma separated preset names in order of preference,
+            e.g. "opus,mp3_low". Unknown or unsupported entries are skipped.
+        sample_rate (int): Optional override, must be a rate the provider
+            supports.
+
+    Returns:
+        AudioFormat: The first acceptable preference, else the default.
+    """
+    chosen = DEFAULT_AUDIO_FORMAT
+    for name in (requested or "").split(","):
+        preset = PRESETS.get(name.strip().lower())
+        if preset and preset.format in settings.TTS_AUDIO_FORMATS:
+            chosen = preset
+            break
+
+    if sample_rate:
+        try:
+            sample_rate = int(sample_rate)
+        except (TypeError, ValueError):
+            sample_rate = None
+        if sample_rate in SUPPORTED_SAMPLE_RATES:
+            chosen = AudioFormat(chosen.format, sample_rate, chosen.bitrate, chosen.channel)
+
+    return chosen
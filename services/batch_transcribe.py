@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from config import settings
+from services.asr_service import transcribe_audio
+from services.upload_ingest import sniff_audio_container
+from services.metrics import BATCH_FILES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchItem:
+    """One file of a batch; `read` loads its bytes when a worker picks it up."""
+    index: int
+    name: str
+    read: Callable[[], Awaitable[bytes]]
+
+
+async def _transcribe_with_retries(audio, container, max_attempts, backoff):
+    for attempt in range(1, max_attempts + 1):
+        text = await transcribe_audio(audio, container=container)
+        if text is not None:
+            return text, attempt
+        if attempt < max_attempts:
+            await asyncio.sleep(backoff * (2 ** (attempt - 1)))
+    return None, max_attempts
+
+
+async def transcribe_batch(items, concurrency=None, max_attempts=None, backoff=None, max_bytes=None):
+    """
+    Transcribes many files concurrently and yields results as they finish.
+
+    A fixed pool of `concurrency` workers pulls files in order, so memory
+    stays bounded by the pool size. Files with identical content (by
+    SHA-256) are transcribed once; later copies get the same result with
+    `duplicate_of` set. Failed transcriptions are retried with exponential
+    backoff.
+
+    Args:
+        items (list[BatchItem]): Files to transcribe.
+
+    Yields:
+        dict: {"index", "name", "sha256", "text", "attempts"} in completion
+        order, with "error" instead of "text" on failure.
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    max_attempts = max_attempts or settings.BATCH_MAX_ATTEMPTS
+    backoff = settings.BATCH_RETRY_BACKOFF if backoff is None else backoff
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        pending.put_nowait(item)
+    results: asyncio.Queue = asyncio.Queue()
+    # sha256 -> (index of the first copy, future of its result)
+    seen: dict[str, tuple[int, asyncio.Future]] = {}
+
+    async def process(item):
+        result = {"index": item.index, "name": item.name}
+        audio = await item.read()
+        if len(audio) > max_bytes:
+            return {**result, "error": f"File too large. Max {max_bytes // (1024 * 1024)}MB."}
+        container = sniff_audio_container(audio[:12])
+        if container is None:
+            return {**result, "error": "Unsupported audio format"}
+
+        digest = hashlib.sha256(audio).hexdigest()
+        result["sha256"] = digest
+        if digest in seen:
+            first_index, future = seen[digest]
+            shared = await asyncio.shield(future)
+            return {**shared, **result, "duplicate_of": first_index}
+
+        future = asyncio.get_running_loop().create_future()
+        seen[digest] = (item.index, future)
+        try:
+            text, attempts = await _transcribe_with_retries(audio, container, max_attempts, backoff)
+            shared = {"attempts": attempts}
+            if text is None:
+                shared["error"] = "Transcription failed"
+            else:
+                shared["text"] = text
+            future.set_result(shared)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # Duplicates waiting on it will raise, not hang
+            future.set_exception(e)
+            future.exception()
+            raise
+        return {**result, **shared}
+
+    async def worker():
+        while not pending.empty():
+            item = pending.get_nowait()
+            try:
+                result = await process(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Batch item {item.index} ({item.name}) failed: {e}")
+                result = {"index": item.index, "name": item.name, "error": str(e) or type(e).__name__}
+            outcome = "error" if "error" in result else "duplicate" if "duplicate_of" in result else "ok"
+            BATCH_FILES.labels(outcome).inc()
+            await results.put(result)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)) or 1)]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from config import settings
+from services import llm_service
+from services.llm_service import chat_with_llm, llm_cache_key
+from services.tts_service import text_to_speech_stream
+
+logger = logging.getLogger(__name__)
+
+
+async def _replay(tokens):
+    for token in tokens:
+        yield token
+
+
+async def warm_caches(utterances, total, audio_formats, concurrency=None, ttl=None, dry_run=False):
+    """
+    Fills the LLM answer cache and the per-sentence TTS cache for frequent
+    questions, through the same chat_with_llm / text_to_speech_stream calls a
+    live turn makes, so keys and sentence boundaries match exactly.
+
+    Args:
+        utterances (list[FrequentUtterance]): Questions to warm.
+        total (int): User messages in the mined window, for hit rates.
+        audio_formats (list[AudioFormat]): TTS variants to synthesize.
+
+    Returns:
+        dict: Counts and the projected LLM cache hit rate before/after.
+    """
+    concurrency = concurrency or settings.CACHE_WARM_CONCURRENCY
+    ttl = max(ttl or settings.CACHE_WARM_TTL, settings.LLM_CACHE_TTL)
+    redis = llm_service.redis_client
+    semaphore = asyncio.Semaphore(concurrency)
+    report = {"candidates": len(utterances), "messages": total, "already_cached": 0,
+              "warmed": 0, "failed": 0, "audio_bytes": 0}
+
+    async def warm(utterance):
+        """Returns (cached before, cached after)."""
+        key = llm_cache_key(utterance.text)
+        cached = bool(await redis.exists(key))
+        report["already_cached"] += cached
+        if dry_run:
+            return cached, True
+
+        async with semaphore:
+            tokens = [token async for token in chat_with_llm(utterance.text)]
+            # Fallback answers (provider busy/down) are not cached
+            if not tokens or not await redis.exists(key):
+                report["failed"] += 1
+                logger.warning(f"Could not warm answer for {utterance.text!r}")
+                return cached, False
+            await redis.expire(key, ttl)
+            for audio_format in audio_formats:
+                async for audio in text_to_speech_stream(_replay(tokens), audio_format=audio_format):
+                    report["audio_bytes"] += len(audio)
+        report["warmed"] += 1
+        return cached, True
+
+    start = time.monotonic()
+    results = await asyncio.gather(*(warm(u) for u in utterances), return_exceptions=True)
+    hits_before = hits_after = 0
+    for utterance, result in zip(utterances, results):
+        if isinstance(result, Exception):
+            report["failed"] += 1
+            logger.error(f"Warming {utterance.text!r} failed: {result}")
+            continue
+        before, after = result
+        hits_before += utterance.count * before
+        hits_after += utterance.count * (before or after)
+
+    # Share of the window's questions that would have been answered from cache
+    report["hit_rate_before"] = round(hits_before / total, 4) if total else 0.0
+    report["hit_rate_after"] = round(hits_after / total, 4) if total else 0.0
+    report["seconds"] = round(time.monotonic() - start, 2)
+    return report
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from database import SessionLocal
+from models import ChatHistory, User
+
+logger = logging.getLogger(__name__)
+
+# Writes in flight, referenced so they are not garbage collected mid-way
+_pending: set[asyncio.Task] = set()
+
+_TRAILING_PUNCTUATION = "。！？；，、.!?;,~～ "
+
+
+def normalize_utterance(text):
+    """Groups ASR variants of the same question: case, spacing and trailing punctuation."""
+    return re.sub(r"\s+", " ", text).strip().rstrip(_TRAILING_PUNCTUATION).casefold()
+
+
+async def save_exchange(username, user_text, reply):
+    """Stores one question/answer pair for `username` in chat_history."""
+    async with SessionLocal() as db:
+        user_id = (await db.execute(select(User.id).where(User.username == username))).scalar()
+        if user_id is None:
+            return
+        db.add_all([
+            ChatHistory(user_id=user_id, role="user", content=user_text),
+            ChatHistory(user_id=user_id, role="assistant", content=reply),
+        ])
+        await db.commit()
+
+
+def record_exchange(username, user_text, reply):
+    """save_exchange() in the background; the turn never waits on the database."""
+    async def run():
+        try:
+            await save_exchange(username, user_text, reply)
+        except Exception as e:
+            logger.warning(f"Chat history write failed: {e}")
+
+    task = asyncio.create_task(run())
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return task
+
+
+@dataclass
+class FrequentUtterance:
+    text: str          # most common raw form, the one the live cache key sees
+    count: int         # occurrences of exactly `text`
+    group_count: int   # occurrences of all its normalized variants
+
+
+async def frequent_utterances(db, days=30, limit=200, now=None):
+    """
+    The most frequent user questions of the last `days` days.
+
+    Returns:
+        tuple[list[FrequentUtterance], int]: Questions by normalized
+        frequency, and the number of user messages in the window.
+    """
+    since = (now or datetime.utcnow()) - timedelta(days=days)
+    rows = (await db.execute(
+        select(ChatHistory.content, func.count())
+        .where(ChatHistory.role == "user", ChatHistory.timestamp >= since)
+        .group_by(ChatHistory.content)
+    )).all()
+
+    groups: dict[str, Counter] = {}
+    total = 0
+    for content, count in rows:
+        total += count
+        key = normalize_utterance(content or "")
+        if key:
+            groups.setdefault(key, Counter())[content] += count
+
+    ranked = sorted(groups.values(), key=lambda variants: -sum(variants.values()))[:limit]
+    utterances = []
+    for variants in ranked:
+        text, count = variants.most_common(1)[0]
+        utterances.append(FrequentUtterance(text, count, sum(variants.values())))
+    return utterances, total
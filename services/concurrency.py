@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from config import settings
+from services.metrics import (
+    PROVIDER_QUEUE_WAIT,
+    PROVIDER_QUEUE_DEPTH,
+    PROVIDER_IN_FLIGHT,
+    PROVIDER_QUEUE_TIMEOUTS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderBusyError(Exception):
+    """Raised when no provider slot became free within the queue timeout."""
+
+
+class ProviderLimiter:
+    """
+    Caps concurrent upstream requests to a single provider.
+
+    Callers queue for a slot for at most `queue_timeout` seconds; the slot is
+    held for the whole request, including streamed responses.
+    """
+
+    def __init__(self, name, max_concurrency, queue_timeout):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.active = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.monotonic()
+        self.waiting += 1
+        PROVIDER_QUEUE_DEPTH.labels(self.name).inc()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            PROVIDER_QUEUE_TIMEOUTS.labels(self.name).inc()
+            raise ProviderBusyError(f"{self.name}: no slot within {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+            PROVIDER_QUEUE_DEPTH.labels(self.name).dec()
+            PROVIDER_QUEUE_WAIT.labels(self.name).observe(time.monotonic() - start)
+
+        self.active += 1
+        PROVIDER_IN_FLIGHT.labels(self.name).inc()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            PROVIDER_IN_FLIGHT.labels(self.name).dec()
+            self._semaphore.release()
+
+
+# SiliconFlow serves both the LLM and the HTTP transcription endpoint,
+# so they share one limiter.
+limiters = {
+    "volcengine": ProviderLimiter("volcengine", settings.VOLC_MAX_CONCURRENCY, settings.PROVIDER_QUEUE_TIMEOUT),
+    "siliconflow": ProviderLimiter("siliconflow", settings.SILICON_MAX_CONCURRENCY, settings.PROVIDER_QUEUE_TIMEOUT),
+    "minimax": ProviderLimiter("minimax", settings.MINIMAX_MAX_CONCURRENCY, settings.PROVIDER_QUEUE_TIMEOUT),
+}
+
+
+def get_limiter(provider):
+    return limiters[provider]
+
+
+def is_overloaded():
+    """True when any provider queue is deep enough that new work should be shed."""
+    return any(l.waiting >= settings.OVERLOAD_QUEUE_THRESHOLD for l in limiters.values())
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+import signal
+import threading
+import time
+from config import settings
+from services import warmup
+from services.metrics import DRAINED_SESSIONS, DRAIN_DURATION
+from services.ws_session import sessions
+
+logger = logging.getLogger(__name__)
+
+
+class Drainer:
+    """
+    Takes the process out of rotation without dropping answers mid-sentence.
+
+    Once started, /readyz fails and new sessions are refused. Every open
+    websocket session stops taking new turns; the ones already started run
+    to turn_end for up to `timeout` seconds. Each client is then sent a
+    reconnect hint, spread randomly over `reconnect_spread` seconds so they
+    do not all land on the remaining instances at once, and its socket is
+    closed with 1012.
+    """
+
+    def __init__(self, timeout=None, reconnect_spread=None):
+        self.timeout = settings.DRAIN_TIMEOUT if timeout is None else timeout
+        self.reconnect_spread = settings.DRAIN_RECONNECT_SPREAD if reconnect_spread is None else reconnect_spread
+        self.draining = False
+        self.reason = None
+        self.started = None
+        self.finished = None
+        self.outcomes = {"completed": 0, "timed_out": 0}
+        self._task: asyncio.Task | None = None
+        self._signals = 0
+
+    def reconnect_after(self):
+        """Seconds a client should wait before reconnecting, jittered per client."""
+        return round(random.uniform(0, self.reconnect_spread), 1)
+
+    def start(self, reason):
+        """Starts draining (once); returns the task that finishes when every session is closed."""
+        if self._task is None:
+            self.draining = True
+            self.reason = reason
+            self.started = time.monotonic()
+            warmup.readiness.draining = True
+            logger.info(f"Draining ({reason}): {len(sessions)} open sessions, up to {self.timeout}s")
+            self._task = asyncio.create_task(self._drain())
+        return self._task
+
+    async def wait(self):
+        """Returns once a started drain is complete; immediately if none was started."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def _drain(self):
+        draining = sessions.all()
+        for session in draining:
+            session.drain(self.reconnect_after())
+
+        pipelines = {session.pipeline for session in draining if session.pipeline is not None}
+        if pipelines:
+            await asyncio.wait(pipelines, timeout=self.timeout)
+        for session in draining:
+            outcome = "completed" if session.pipeline is None or session.pipeline.done() else "timed_out"
+            self.outcomes[outcome] += 1
+            DRAINED_SESSIONS.labels(outcome).inc()
+
+        # Sessions whose client is away are closed here, attached ones usually by their handler already
+        late = [session for session in sessions.all() if session not in draining]
+        for session in late:
+            session.drain(self.reconnect_after())
+        await asyncio.gather(*(session.close() for session in draining + late), return_exceptions=True)
+
+        self.finished = time.monotonic()
+        DRAIN_DURATION.set(self.finished - self.started)
+        logger.info(f"Drained in {self.finished - self.started:.3f}s: {self.outcomes}")
+
+    def report(self):
+        now = self.finished or time.monotonic()
+        return {
+            "draining": self.draining,
+            "reason": self.reason,
+            "done": self.finished is not None,
+            "elapsed": round(now - self.started, 3) if self.started else None,
+            "open_sessions": len(sessions),
+            "sessions": self.outcomes
+        }
+
+    def install_signal_handler(self):
+        """
+        Makes SIGTERM drain first and only then run the handler it replaces
+        (uvicorn's, which closes whatever sockets are left and shuts down).
+        A second SIGTERM skips the rest of the drain.
+
+        Returns False outside the main thread, where signals cannot be handled.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def exit_now(signum):
+            if callable(previous):
+                previous(signum, None)
+            else:
+                signal.signal(signum, previous or signal.SIG_DFL)
+                signal.raise_signal(signum)
+
+        def drain_then_exit(signum):
+            self.start("SIGTERM").add_done_callback(lambda _: exit_now(signum))
+
+        def on_signal(signum, frame):
+            self._signals += 1
+            if self._signals > 1:
+                logger.warning("SIGTERM received again, not waiting for the drain")
+                exit_now(signum)
+            else:
+                loop.call_soon_threadsafe(drain_then_exit, signum)
+
+        signal.signal(signal.SIGTERM, on_signal)
+        return True
+
+
+drainer = Drainer()
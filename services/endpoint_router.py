@@ -0,0 +1,148 @@
+import logging
+import time
+from dataclasses import dataclass
+from config import settings
+from services.metrics import (
+    ROUTER_DECISIONS,
+    ENDPOINT_TTFT,
+    ENDPOINT_EWMA_TTFT,
+    ENDPOINT_ERRORS,
+    ENDPOINT_EJECTED
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EndpointStats:
+    ewma_ttft: float | None = None
+    # Output units (characters, audio bytes) per second after the first one
+    ewma_throughput: float | None = None
+    ewma_error_rate: float = 0.0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    # After an ejection expires the endpoint gets one request at a time
+    # until a success re-admits it
+    probation: bool = False
+    probe_in_flight: bool = False
+
+
+class EndpointRouter:
+    """
+    Sends each request to the currently fastest healthy endpoint.
+
+    Keeps EWMAs of time-to-first-byte, throughput and error rate per
+    endpoint. Endpoints that fail repeatedly are ejected for an exponentially
+    growing period and re-admitted through single-request probes.
+    """
+
+    def __init__(self, capability, endpoints, alpha=None, clock=time.monotonic):
+        if not endpoints:
+            raise ValueError(f"No endpoints configured for {capability}")
+        self.capability = capability
+        self.endpoints = {e.name: e for e in endpoints}
+        self.stats = {e.name: EndpointStats() for e in endpoints}
+        self.alpha = alpha if alpha is not None else settings.ROUTER_EWMA_ALPHA
+        self.clock = clock
+
+    def _ewma(self, current, sample):
+        if current is None:
+            return sample
+        return self.alpha * sample + (1 - self.alpha) * current
+
+    def pick(self, exclude=()):
+        """
+        Returns the endpoint config to use for the next request.
+
+        Falls back to excluded or ejected endpoints rather than failing when
+        nothing better is available.
+        """
+        now = self.clock()
+        candidates = [n for n in self.endpoints if n not in exclude] or list(self.endpoints)
+
+        # A due probe takes precedence so ejected endpoints can come back
+        for name in candidates:
+            s = self.stats[name]
+            if s.probation and not s.probe_in_flight and now >= s.ejected_until:
+                s.probe_in_flight = True
+                return self._decide(name, "probe")
+
+        healthy = [n for n in candidates if not self.stats[n].probation]
+        if not healthy:
+            name = min(candidates, key=lambda n: self.stats[n].ejected_until)
+            return self._decide(name, "fallback")
+
+        unmeasured = [n for n in healthy if self.stats[n].ewma_ttft is None]
+        if unmeasured:
+            return self._decide(unmeasured[0], "explore")
+
+        name = min(healthy, key=lambda n: (self.stats[n].ewma_ttft, -(self.stats[n].ewma_throughput or 0.0)))
+        return self._decide(name, "fastest")
+
+    def _decide(self, name, reason):
+        ROUTER_DECISIONS.labels(self.capability, name, reason).inc()
+        return self.endpoints[name]
+
+    def record_success(self, name, ttft, units=0, duration=0.0):
+        s = self.stats[name]
+        s.ewma_ttft = self._ewma(s.ewma_ttft, ttft)
+        if units and duration > 0:
+            s.ewma_throughput = self._ewma(s.ewma_throughput, units / duration)
+        s.ewma_error_rate = self._ewma(s.ewma_error_rate, 0.0)
+        s.consecutive_failures = 0
+        if s.probation:
+            logger.info(f"{self.capability} endpoint {name} re-admitted")
+            s.probation = False
+            s.probe_in_flight = False
+            ENDPOINT_EJECTED.labels(self.capability, name).set(0)
+        elif s.ejections and s.ewma_error_rate < 0.01:
+            # Sustained health forgives earlier ejections
+            s.ejections = 0
+
+        ENDPOINT_TTFT.labels(self.capability, name).observe(ttft)
+        ENDPOINT_EWMA_TTFT.labels(self.capability, name).set(s.ewma_ttft)
+
+    def record_slow(self, name, elapsed):
+        """Request abandoned before its first byte (e.g. lost a hedge race)."""
+        s = self.stats[name]
+        # elapsed is a lower bound of the real TTFT, only ever push it up
+        if s.ewma_ttft is None or elapsed > s.ewma_ttft:
+            s.ewma_ttft = self._ewma(s.ewma_ttft, elapsed)
+            ENDPOINT_EWMA_TTFT.labels(self.capability, name).set(s.ewma_ttft)
+        s.probe_in_flight = False
+
+    def record_failure(self, name):
+        s = self.stats[name]
+        s.ewma_error_rate = self._ewma(s.ewma_error_rate, 1.0)
+        s.consecutive_failures += 1
+        ENDPOINT_ERRORS.labels(self.capability, name).inc()
+
+        if s.probation:
+            # Only a failed probe extends the ejection, not stragglers
+            # that were already in flight when it was ejected
+            if s.probe_in_flight:
+                self._eject(name)
+            return
+
+        if s.consecutive_failures >= settings.ROUTER_EJECT_CONSECUTIVE_FAILURES \
+                or s.ewma_error_rate >= settings.ROUTER_EJECT_ERROR_RATE and s.consecutive_failures > 1:
+            self._eject(name)
+
+    def release(self, name):
+        """Request ended without a verdict (cancelled after the first byte)."""
+        self.stats[name].probe_in_flight = False
+
+    def _eject(self, name):
+        s = self.stats[name]
+        duration = min(
+            settings.ROUTER_EJECT_BASE_SECONDS * (2 ** s.ejections),
+            settings.ROUTER_EJECT_MAX_SECONDS
+        )
+        s.ejections += 1
+        s.ejected_until = self.clock() + duration
+        s.probation = True
+        s.probe_in_flight = False
+        s.consecutive_failures = 0
+        ENDPOINT_EJECTED.labels(self.capability, name).set(1)
+        logger.warning(f"{self.capability} endpoint {name} ejected for {duration:.0f}s")
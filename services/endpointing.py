@@ -0,0 +1,130 @@
+import asyncio
+import time
+from config import settings
+from services import flight_recorder
+from services.metrics import WS_ENDPOINT_DELAY
+
+
+class Endpointer:
+    """
+    Decides from a turn's ASR partials when the user has finished speaking,
+    so the turn can end without the client's finish_speaking.
+
+    Fires on the first partial whose last utterance Volcengine marks
+    definite, or once the transcript has not changed for `silence` seconds:
+    the recognizer answers every audio packet, so a stable transcript means
+    trailing silence. Nothing fires before any text was recognised, and
+    nothing after the client ended the utterance itself.
+
+    The delay from the last transcript change to the decision is observed
+    by reason, with the client's own end of speech as the baseline.
+    """
+
+    def __init__(self, on_endpoint, silence=None, on_definite=None):
+        self.on_endpoint = on_endpoint
+        self.silence = settings.WS_ENDPOINT_SILENCE if silence is None else silence
+        self.on_definite = settings.WS_ENDPOINT_ON_DEFINITE if on_definite is None else on_definite
+        # Why the turn ended: definite / silence / client, None while it lasts
+        self.reason = None
+        self._text = ""
+        self._changed_at = None
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def fired(self):
+        """Whether the server ended the turn (rather than the client)."""
+        return self.reason in ("definite", "silence")
+
+    def observe(self, result):
+        """Feeds one partial result ({"text", "definite"}) of the turn."""
+        if self.reason is not None:
+            return
+        text = result.get("text") or ""
+        if not text:
+            return
+        if text != self._text:
+            self._text = text
+            self._changed_at = time.monotonic()
+            self._restart_timer()
+        if self.on_definite and result.get("definite"):
+            self._end("definite")
+
+    def client_ended(self):
+        """The utterance ended on the client's side (finish_speaking, disconnect)."""
+        self._end("client")
+
+    def _restart_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.silence > 0:
+            self._timer = asyncio.get_running_loop().call_later(self.silence, self._end, "silence")
+
+    def _end(self, reason):
+        if self.reason is not None:
+            return
+        self.reason = reason
+        self.close()
+        if self._changed_at is None:
+            # No speech recognised, nothing to measure
+            return
+        delay = time.monotonic() - self._changed_at
+        WS_ENDPOINT_DELAY.labels(reason).observe(delay)
+        flight_recorder.record("endpoint", reason=reason, delay=round(delay, 4))
+        if reason != "client":
+            self.on_endpoint(reason)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+# WebM (Matroska) element ids
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+CLUSTER_ID = b"\x1f\x43\xb6\x75"
+
+
+class WebmContinuation:
+    """
+    Keeps every utterance of a hands-free WebM recording decodable.
+
+    MediaRecorder writes the container header (EBML, segment info, tracks)
+    once, at the start of a recording. An utterance the server ended lets
+    the next one start in the middle of that recording, with no header and
+    possibly inside a cluster, which the recognizer cannot decode. This
+    keeps the header of the current recording and, for such an utterance,
+    sends it followed by the audio from the next cluster on.
+    """
+
+    def __init__(self):
+        self.header: bytes | None = None
+
+    async def utterance(self, chunks):
+        """Passes one utterance's chunks through, repaired if it starts mid-recording."""
+        head = b""
+        mode = None
+        async for chunk in chunks:
+            if mode is None:
+                if chunk.startswith(EBML_MAGIC):
+                    # A new recording: its header ends where the first cluster starts
+                    self.header, mode = None, "header"
+                elif self.header is not None:
+                    mode = "resync"
+                else:
+                    mode = "pass"
+
+            if mode == "header":
+                head += chunk
+                if (index := head.find(CLUSTER_ID)) >= 0:
+                    self.header, mode = head[:index], "pass"
+                yield chunk
+            elif mode == "resync":
+                head += chunk
+                if (index := head.find(CLUSTER_ID)) >= 0:
+                    mode = "pass"
+                    yield self.header + head[index:]
+                else:
+                    # An id may straddle two chunks
+                    head = head[-(len(CLUSTER_ID) - 1):]
+            else:
+                yield chunk
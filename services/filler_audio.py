@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import random
+from config import settings
+from services import flight_recorder
+from services.metrics import FILLER_CLIPS
+from services.tts_service import tts_request
+
+logger = logging.getLogger(__name__)
+
+
+class FillerPool:
+    """
+    Short acknowledgement clips ("嗯，", "好的，"), synthesized once per audio
+    format and kept in memory so sending one costs no provider round trip.
+    """
+
+    def __init__(self, phrases=None):
+        self.phrases = phrases if phrases is not None else settings.WS_FILLER_PHRASES
+        self._clips: dict[str, list[tuple[str, bytes]]] = {}
+        self._loading: dict[str, asyncio.Task] = {}
+
+    def preload(self, audio_format):
+        """Starts synthesizing the clips of `audio_format` in the background, unless they are ready or on their way."""
+        key = audio_format.key
+        if key not in self._clips and key not in self._loading:
+            self._loading[key] = asyncio.create_task(self._load(audio_format))
+        return self._loading.get(key)
+
+    def get(self, audio_format):
+        """A random (phrase, clip) in `audio_format`, or None while its clips are not ready."""
+        clips = self._clips.get(audio_format.key)
+        if clips:
+            return random.choice(clips)
+        self.preload(audio_format)
+        return None
+
+    def add(self, audio_format, phrase, clip):
+        self._clips.setdefault(audio_format.key, []).append((phrase, clip))
+
+    async def _load(self, audio_format):
+        loaded = 0
+        for phrase in self.phrases:
+            try:
+                clip = b"".join([chunk async for chunk in tts_request(phrase, audio_format)])
+            except Exception as e:
+                logger.warning(f"Could not synthesize filler {phrase!r}: {e}")
+                continue
+            if clip:
+                self.add(audio_format, phrase, clip)
+                loaded += 1
+        if not loaded:
+            # Tried again on the next turn that needs one
+            self._loading.pop(audio_format.key, None)
+        logger.info(f"Filler clips ready for {audio_format.key}: {loaded}/{len(self.phrases)}")
+
+
+filler_pool = FillerPool()
+
+
+class FillerTimer:
+    """
+    Masks a slow answer start: if the turn's real audio has not begun `delay`
+    seconds after its final transcript, sends a filler clip on the turn's lane.
+
+    close() must be awaited before the turn's first real audio frame (and
+    before its turn_end): afterwards no clip can start, and a clip already
+    being sent is queued completely ahead of the answer.
+    """
+
+    def __init__(self, lane, audio_format, delay=None, pool=None):
+        self.lane = lane
+        self.audio_format = audio_format
+        self.delay = settings.WS_FILLER_DELAY if delay is None else delay
+        self.pool = pool or filler_pool
+        self.sent = False
+        self._closed = False
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def _run(self):
+        await asyncio.sleep(self.delay)
+        if self._closed:
+            return
+        # While an earlier turn is still being delivered its audio fills the gap
+        if not self.lane.is_current:
+            FILLER_CLIPS.labels("skipped").inc()
+            return
+        filler = self.pool.get(self.audio_format)
+        if filler is None:
+            FILLER_CLIPS.labels("not_ready").inc()
+            return
+        phrase, clip = filler
+        self.sent = True
+        FILLER_CLIPS.labels("sent").inc()
+        flight_recorder.record("filler", chars=len(phrase), bytes=len(clip))
+        await self.lane.send_json({"type": "filler", "text": phrase})
+        await self.lane.send_bytes(clip, frame="filler_audio")
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is None:
+            return
+        if self.sent:
+            await self._task
+        else:
+            self._task.cancel()
+
+    def cancel(self):
+        """Pipeline teardown: drops the timer without waiting."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
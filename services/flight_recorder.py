@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from config import settings
+from log_context import session_id_var
+from services.metrics import SLOW_TURNS, TURN_FIRST_SOUND, TURN_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Recorder of the session/request being handled; pipeline code records into
+# it through `record()` without passing it around
+current_recorder: ContextVar["FlightRecorder | None"] = ContextVar("flight_recorder", default=None)
+
+# Repeated per-chunk events are collapsed into one timeline entry
+COLLAPSIBLE = {"audio_chunk", "frame_sent", "asr_partial"}
+
+
+def record(event, **fields):
+    """Adds an event to the current session's recorder, if any."""
+    recorder = current_recorder.get()
+    if recorder is not None:
+        recorder.record(event, **fields)
+
+
+class SlowTurnStore:
+    """The last slow-turn timelines, in memory and appended to FLIGHT_RECORDER_FILE."""
+
+    def __init__(self, path=None, keep=None):
+        self.path = path if path is not None else settings.FLIGHT_RECORDER_FILE
+        self.turns = collections.deque(maxlen=keep or settings.FLIGHT_RECORDER_KEEP)
+        self._file_lock = threading.Lock()
+
+    def add(self, timeline):
+        self.turns.append(timeline)
+        if self.path:
+            line = json.dumps(timeline, separators=(",", ":"), ensure_ascii=False, default=str)
+            # File I/O stays off the event loop
+            asyncio.get_running_loop().run_in_executor(None, self._append, line)
+
+    def _append(self, line):
+        with self._file_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def recent(self, limit=20):
+        return list(reversed(self.turns))[:limit]
+
+
+slow_turns = SlowTurnStore()
+
+
+class FlightRecorder:
+    """
+    Ring buffer of timestamped pipeline events for one websocket session or
+    one /api/process_audio request.
+
+    When a turn finishes, its response latency (end of user speech to the
+    first audio frame sent) is checked against FLIGHT_RECORDER_SLO; slow
+    turns are saved as compact timelines for /admin/slow_turns.
+    """
+
+    def __init__(self, kind, session_id=None, max_events=None, slo=None, store=None):
+        self.kind = kind
+        self.session_id = session_id or session_id_var.get()
+        self.events = collections.deque(maxlen=max_events or settings.FLIGHT_RECORDER_MAX_EVENTS)
+        self.slo = slo if slo is not None else settings.FLIGHT_RECORDER_SLO
+        self.store = store or slow_turns
+        self._turn_boundary = time.monotonic()
+
+    def bind(self):
+        """Makes this the recorder for the current context and tasks created from it."""
+        current_recorder.set(self)
+        return self
+
+    def record(self, event, **fields):
+        self.events.append((time.monotonic(), event, fields))
+
+    def finish_turn(self, turn_id=None):
+        """
+        Closes a turn: every event since its turn_start, or since the previous
+        turn finished.
+
+        Turns may overlap (the next one's ASR runs during this one's reply);
+        events that carry a `turn` field only count for that turn.
+
+        Returns:
+            dict | None: The timeline if the turn was slow, else None.
+        """
+        start = self._turn_boundary
+        end = self._turn_boundary = time.monotonic()
+        if turn_id is not None:
+            start = next(
+                (t for t, name, fields in self.events if name == "turn_start" and fields.get("turn") == turn_id),
+                start
+            )
+        events = [e for e in self.events if e[0] >= start]
+        if not events:
+            return None
+
+        def own(fields):
+            return fields.get("turn", turn_id) == turn_id
+
+        # Measured from the end of the user's speech when it is known
+        user_done = next(
+            (t for t, name, fields in events if name in ("asr_final", "upload_received") and own(fields)),
+            events[0][0]
+        )
+        def first_frame(frames):
+            return next(
+                (t for t, name, fields in events
+                 if name == "frame_sent" and fields.get("frame") in frames and own(fields) and t >= user_done),
+                None
+            )
+
+        # Time to answer, and perceived time to first sound (filler clips count)
+        first_audio = first_frame(("audio",))
+        first_sound = first_frame(("audio", "filler_audio"))
+        latency = (first_audio or end) - user_done
+        TURN_LATENCY.labels(self.kind).observe(latency)
+        TURN_FIRST_SOUND.labels(self.kind).observe((first_sound or end) - user_done)
+        if latency < self.slo:
+            return None
+
+        SLOW_TURNS.labels(self.kind).inc()
+        origin = events[0][0]
+        timeline = {
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "turn_id": turn_id,
+            "at": datetime.fromtimestamp(time.time() - (end - origin), timezone.utc).isoformat(),
+            "latency": round(latency, 4),
+            "first_sound": round((first_sound or end) - user_done, 4),
+            "duration": round(end - origin, 4),
+            "audio_sent": first_audio is not None,
+            "events": self._compact(events, origin)
+        }
+        self.store.add(timeline)
+        logger.warning(f"Slow {self.kind} turn {turn_id}: {latency:.2f}s to first audio (SLO {self.slo}s)")
+        return timeline
+
+    @staticmethod
+    def _compact(events, origin):
+        """[offset_ms, event, fields] entries, runs of per-chunk events merged into one."""
+        timeline = []
+        for t, name, fields in events:
+            offset = round((t - origin) * 1000, 1)
+            last = timeline[-1] if timeline else None
+            if last and name in COLLAPSIBLE and last[1] == name and last[2].get("frame") == fields.get("frame"):
+                merged = last[2]
+                merged["count"] = merged.get("count", 1) + 1
+                merged["until_ms"] = offset
+                if "bytes" in fields:
+                    merged["bytes"] = merged.get("bytes", 0) + fields["bytes"]
+                continue
+            timeline.append([offset, name, dict(fields)])
+        return timeline
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from services.metrics import STREAM_HEDGES, STREAM_ATTEMPT_FAILURES
+
+logger = logging.getLogger(__name__)
+
+
+class FirstTokenError(Exception):
+    """Raised when every attempt failed before producing its first item."""
+
+
+class _Attempt:
+    """One upstream stream, advanced one item at a time in its own task."""
+
+    def __init__(self, agen, label):
+        self.agen = agen
+        self.label = label
+        self.pending = asyncio.ensure_future(self._next())
+
+    async def _next(self):
+        try:
+            return "item", await self.agen.__anext__()
+        except StopAsyncIteration:
+            return "done", None
+        except Exception as e:
+            return "error", e
+
+    async def cancel(self):
+        self.pending.cancel()
+        await asyncio.gather(self.pending, return_exceptions=True)
+        try:
+            await self.agen.aclose()
+        except Exception:
+            pass
+
+
+async def hedged_stream(
+    primary,
+    hedge=None,
+    ttft_deadline=None,
+    max_attempts=3,
+    backoff=0.5,
+    non_retryable=(),
+    name="stream"
+):
+    """
+    Streams items from `primary()` with a deadline on the first item.
+
+    If no item arrived within `ttft_deadline` seconds, `hedge()` is started
+    alongside and whichever produces first wins; the other is cancelled.
+    Attempts that fail before their first item are retried (with exponential
+    backoff) up to `max_attempts` in total. Once an item has been yielded the
+    stream is committed: later failures are raised to the caller and never
+    retried, so output is never duplicated.
+
+    Args:
+        primary: Callable returning a new async iterator per attempt.
+        hedge: Optional callable for the hedged request (e.g. a faster model).
+        non_retryable: Exception types that abort immediately.
+
+    Raises:
+        FirstTokenError: every attempt failed before the first item.
+    """
+    loop = asyncio.get_running_loop()
+    attempts: list[_Attempt] = []
+    launched = 0
+    hedged = hedge is None or not ttft_deadline
+    last_error = None
+    winner = None
+    first = None
+
+    def launch(factory, label):
+        nonlocal launched
+        launched += 1
+        attempts.append(_Attempt(factory(), label))
+        return loop.time() + (ttft_deadline or 0)
+
+    deadline_at = launch(primary, "primary")
+    try:
+        while winner is None:
+            if not attempts:
+                if launched >= max_attempts:
+                    raise FirstTokenError(f"{name}: all {launched} attempts failed") from last_error
+                await asyncio.sleep(backoff * (2 ** (launched - 1)))
+                deadline_at = launch(primary, "retry")
+                continue
+
+            timeout = None if hedged else max(0.0, deadline_at - loop.time())
+            done, _ = await asyncio.wait(
+                [a.pending for a in attempts],
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                # First-item deadline passed: fire the hedge once
+                hedged = True
+                if launched < max_attempts:
+                    logger.info(f"{name}: no first item after {ttft_deadline}s, hedging")
+                    STREAM_HEDGES.labels(name, "fired").inc()
+                    launch(hedge, "hedge")
+                continue
+
+            for attempt in list(attempts):
+                if not attempt.pending.done():
+                    continue
+                kind, value = attempt.pending.result()
+                if kind == "error":
+                    attempts.remove(attempt)
+                    last_error = value
+                    STREAM_ATTEMPT_FAILURES.labels(name, "before_first_item").inc()
+                    logger.warning(f"{name}: {attempt.label} attempt failed before first item: {value}")
+                    if isinstance(value, non_retryable):
+                        raise value
+                    continue
+                winner = attempt
+                first = value if kind == "item" else None
+                if kind == "done":
+                    winner.pending = None
+                break
+
+        for attempt in attempts:
+            if attempt is not winner:
+                await attempt.cancel()
+        if winner.label == "hedge":
+            STREAM_HEDGES.labels(name, "won").inc()
+        attempts = [winner]
+
+        if winner.pending is None:
+            return
+        winner.pending = None
+        yield first
+
+        try:
+            async for item in winner.agen:
+                yield item
+        except Exception:
+            STREAM_ATTEMPT_FAILURES.labels(name, "mid_stream").inc()
+            raise
+    finally:
+        for attempt in attempts:
+            if attempt.pending is not None:
+                await attempt.cancel()
+            else:
+                try:
+                    await attempt.agen.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,51 @@
+import logging
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Every client declared so far, for the lifespan to warm up and close
+_clients: list["LazyRedis"] = []
+
+
+class LazyRedis:
+    """
+    A Redis client that is created on first use rather than at import.
+
+    Importing a service module then costs neither the redis package nor a
+    connection pool; the app's warm-up is the first user, CLI tools create
+    the client when they need it. Attribute access is forwarded to the
+    real client, so call sites use it like a `redis.asyncio.Redis`.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self._client = None
+        _clients.append(self)
+
+    @property
+    def client(self):
+        if self._client is None:
+            from redis.asyncio import Redis
+            self._client = Redis.from_url(settings.REDIS_URL, **self.options)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def aclose(self):
+        """Closes the pool if one was created; the next use creates a new client."""
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+
+def all_clients():
+    return list(_clients)
+
+
+async def close_all():
+    for client in _clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Closing Redis client failed: {e}")
@@ -1,28 +1,152 @@
-import httpx
 import logging
 import json
 import hashlib
-from redis.asyncio import Redis
-from tenacity import retry, stop_after_attempt, wait_exponential
+import time
+from typing import TYPE_CHECKING
 from config import settings
+from services.concurrency import get_limiter, ProviderBusyError
+from services.hedging import hedged_stream, FirstTokenError
+from services.endpoint_router import EndpointRouter
+from services import session_archive, sse
+from services.metrics import LLM_TTFT
+from services.metering import usage_meter
+from services.lazy_redis import LazyRedis
+
+if TYPE_CHECKING:
+    import httpx
+
+def __getattr__(name):
+    # `services.llm_service.httpx` still resolves (mock.patch targets), importing httpx on demand
+    if name == "httpx":
+        import httpx
+        return httpx
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 logger = logging.getLogger(__name__)
 
+# Routes across settings.LLM_ENDPOINTS by observed latency
+llm_router = EndpointRouter("llm", settings.LLM_ENDPOINTS)
+
 # Redis Connection
-redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+redis_client = LazyRedis(decode_responses=True)
+
+# Shared Client (created lazily, reused across requests; httpx is imported with it)
+_client: "httpx.AsyncClient | None" = None
 
-# Shared Client
 async def get_httpx_client():
-    limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
-    return httpx.AsyncClient(limits=limits, timeout=30.0)
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
+        timeout = httpx.Timeout(settings.LLM_READ_TIMEOUT, connect=5.0)
+        _client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return _client
+
+async def close_httpx_client():
+    # On shutdown, after the last session using the pool is gone
+    if _client is not None:
+        await _client.aclose()
+
+class LLMUpstreamError(Exception):
+    """Raised when the LLM provider answers with a non-200 status."""
+
+async def stream_completion(messages, endpoint):
+    """
+    Single upstream attempt: streams tokens from one LLM endpoint.
+
+    Raises on any failure so the caller can decide whether to retry.
+    Outcome and timing are reported to the router.
+    """
+    payload = {
+        "model": endpoint.model,
+        "messages": messages,
+        "stream": True, # Enabled Streaming
+        "max_tokens": 512,
+        "temperature": 0.7
+    }
+
+    headers = {
+        "Authorization": f"Bearer {endpoint.api_key or settings.SILICON_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    start = time.monotonic()
+    first_token_at = None
+    chars = 0
+    tokens = 0
+    # Token counts reported by the provider in the last chunk, if it does
+    usage = None
+    outcome = "cancelled"
+
+    try:
+        client = await get_httpx_client()
+        upstream = session_archive.upstream("llm", endpoint=endpoint.name)
+        async with get_limiter("siliconflow").acquire(), \
+                client.stream("POST", endpoint.url, headers=headers, json=payload) as response:
+            upstream.record("status", response.status_code)
+            if response.status_code != 200:
+                raise LLMUpstreamError(f"LLM Error: {response.status_code} from {endpoint.name}")
+
+            async for payload in sse.iter_events(upstream.tap(response.aiter_bytes())):
+                if payload == b"[DONE]":
+                    break
+                try:
+                    data = sse.loads(payload)
+                except ValueError:
+                    continue
+                if data.get('usage'):
+                    usage = data['usage']
+                choices = data.get('choices')
+                if choices:
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        chars += len(content)
+                        tokens += 1
+                        yield content
+        outcome = "success"
+    except ProviderBusyError:
+        # Local queueing says nothing about the endpoint itself
+        outcome = "busy"
+        raise
+    except Exception:
+        outcome = "failure"
+        llm_router.record_failure(endpoint.name)
+        raise
+    finally:
+        # Every attempt is billed, including the loser of a hedge
+        if usage:
+            usage_meter.add("llm_prompt_tokens", usage.get('prompt_tokens') or 0)
+            usage_meter.add("llm_tokens", usage.get('completion_tokens') or 0)
+        else:
+            usage_meter.add("llm_tokens", tokens)
+        now = time.monotonic()
+        if outcome == "success":
+            llm_router.record_success(
+                endpoint.name,
+                ttft=(first_token_at or now) - start,
+                units=chars,
+                duration=now - (first_token_at or now)
+            )
+        elif outcome == "cancelled" and first_token_at is None:
+            llm_router.record_slow(endpoint.name, now - start)
+        elif outcome != "failure":
+            llm_router.release(endpoint.name)
+
+def llm_cache_key(user_text, history=()):
+    """Redis key of a cached answer; covers the full history plus the current text."""
+    # sort_keys=True for a deterministic JSON string
+    messages = list(history) + [{'role': 'user', 'content': user_text}]
+    return f"llm:{hashlib.md5(json.dumps(messages, sort_keys=True).encode()).hexdigest()}"
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10)
-)
 async def chat_with_llm(user_text, history=[]):
     """
-    Sends text to SiliconFlow's DeepSeek-V3.2 model and yields tokens.
+    Sends text to the fastest configured LLM endpoint and yields tokens.
+
+    Attempts that produce no token within LLM_TTFT_DEADLINE are hedged with a
+    second request on the next best endpoint; failures are only retried
+    before the first token.
 
     Args:
         user_text (str): The user's input text.
@@ -31,68 +155,67 @@ async def chat_with_llm(user_text, history=[]):
     Yields:
         str: Text tokens.
     """
-    # Cache Key Generation
-    # We cache based on full history + current text
-    # Ensure sort_keys=True for deterministic JSON string
-    cache_key = f"llm:{hashlib.md5(json.dumps(history + [{'role': 'user', 'content': user_text}], sort_keys=True).encode()).hexdigest()}"
+    cache_key = llm_cache_key(user_text, history)
 
     # Check Cache
     cached_response = await redis_client.get(cache_key)
     if cached_response:
         logger.info("LLM Cache Hit")
+        cached_tokens = json.loads(cached_response)
+        usage_meter.add("llm_cached_tokens", len(cached_tokens))
         # Yield cached tokens (simulated stream)
-        for token in json.loads(cached_response):
+        for token in cached_tokens:
             yield token
         return
 
-    url = "https://api.siliconflow.cn/v1/chat/completions"
-
     messages = history + [{"role": "user", "content": user_text}]
+    chosen = []
 
-    payload = {
-        "model": "deepseek-ai/DeepSeek-V3.2",
-        "messages": messages,
-        "stream": True, # Enabled Streaming
-        "max_tokens": 512,
-        "temperature": 0.7
-    }
+    def primary():
+        endpoint = llm_router.pick()
+        chosen.append(endpoint.name)
+        return stream_completion(messages, endpoint)
 
-    headers = {
-        "Authorization": f"Bearer {settings.SILICON_KEY}",
-        "Content-Type": "application/json"
-    }
+    def hedge():
+        endpoint = llm_router.pick(exclude=chosen)
+        if endpoint.name in chosen and settings.LLM_HEDGE_MODEL:
+            # Single endpoint: hedge with the faster model instead
+            endpoint = endpoint.model_copy(update={"model": settings.LLM_HEDGE_MODEL})
+        return stream_completion(messages, endpoint)
 
     full_response_tokens = []
+    start = time.monotonic()
 
     try:
-        client = await get_httpx_client()
-        async with client.stream("POST", url, headers=headers, json=payload) as response:
-            if response.status_code != 200:
-                logger.error(f"LLM Error: {response.status_code}")
-                yield "抱歉，服务暂时不可用。"
-                return
-
-            async for line in response.aiter_lines():
-                if line.startswith("data:"):
-                    line = line[5:].strip()
-                    if line == "[DONE]":
-                        break
-                    try:
-                        data = json.loads(line)
-                        if 'choices' in data and len(data['choices']) > 0:
-                            delta = data['choices'][0].get('delta', {})
-                            if 'content' in delta:
-                                token = delta['content']
-                                full_response_tokens.append(token)
-                                yield token
-                    except json.JSONDecodeError:
-                        continue
-
-        # Set Cache (Expire in 1 hour)
-        if full_response_tokens:
-            await redis_client.setex(cache_key, 3600, json.dumps(full_response_tokens))
-
+        async for token in hedged_stream(
+            primary,
+            hedge=hedge if settings.LLM_HEDGE_ENABLED else None,
+            ttft_deadline=settings.LLM_TTFT_DEADLINE,
+            max_attempts=settings.LLM_MAX_ATTEMPTS,
+            backoff=settings.LLM_RETRY_BACKOFF,
+            non_retryable=(ProviderBusyError,),
+            name="llm"
+        ):
+            if not full_response_tokens:
+                LLM_TTFT.observe(time.monotonic() - start)
+            full_response_tokens.append(token)
+            yield token
+    except ProviderBusyError as e:
+        logger.warning(f"LLM busy: {e}")
+        yield "抱歉，服务繁忙，请稍后再试。"
+        return
+    except FirstTokenError as e:
+        logger.error(f"LLM unavailable: {e} ({e.__cause__})")
+        yield "抱歉，服务暂时不可用。"
+        return
     except Exception as e:
-        logger.error(f"LLM Exception: {e}")
-        yield "发生错误。"
-        raise e # Re-raise for retry
+        # Tokens were already delivered; end the answer here instead of retrying
+        logger.error(f"LLM stream broke after {len(full_response_tokens)} tokens: {e}")
+        return
+
+    # Set Cache
+    if full_response_tokens:
+        try:
+            await redis_client.setex(cache_key, settings.LLM_CACHE_TTL, json.dumps(full_response_tokens))
+        except Exception as e:
+            logger.error(f"LLM Cache Write Error: {e}")
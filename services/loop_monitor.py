@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from config import settings
+from services.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+_ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+MAX_STACK_FRAMES = 20
+
+
+def _loop_stack(frame):
+    """Frames of the running callback, innermost last, without the asyncio machinery below it."""
+    frames = []
+    while frame is not None and not frame.f_code.co_filename.startswith(_ASYNCIO_DIR):
+        frames.append((frame, frame.f_lineno))
+        frame = frame.f_back
+    frames.reverse()
+    summary = traceback.StackSummary.extract(frames[-MAX_STACK_FRAMES:], capture_locals=False)
+    return tuple(f"{f.filename}:{f.lineno} in {f.name}: {f.line}" for f in summary)
+
+
+class LoopMonitor:
+    """
+    Measures event-loop scheduling lag and catches what blocks it.
+
+    A ticker coroutine sleeps `interval` and records how late it woke up
+    (EVENT_LOOP_LAG). A watchdog thread samples the loop thread's stack
+    whenever the ticker is overdue by more than `threshold`, so the code
+    that is blocking the loop is caught while it runs. Each stall is kept
+    in `offenders` with its most frequently sampled stack.
+    """
+
+    def __init__(self, interval=None, threshold=None, max_offenders=None):
+        self.interval = interval or settings.LOOP_MONITOR_INTERVAL
+        self.threshold = threshold or settings.LOOP_LAG_THRESHOLD
+        self.offenders = collections.deque(maxlen=max_offenders or settings.LOOP_MONITOR_MAX_OFFENDERS)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+        self._heartbeat = time.monotonic()
+        self._stall = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+
+    def start(self):
+        """Starts monitoring the running loop. Call from inside it."""
+        if self._task is not None:
+            return self
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick(), name="loop-monitor")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join)
+        self._task = None
+        self._thread = None
+
+    async def _tick(self):
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record_lag(max(0.0, now - due))
+
+    def record_lag(self, lag):
+        EVENT_LOOP_LAG.observe(lag)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+        with self._lock:
+            stall, self._stall = self._stall, None
+        if lag < self.threshold:
+            return
+
+        EVENT_LOOP_STALLS.inc()
+        if stall is None:
+            # Shorter than one watchdog period, nothing was sampled
+            stall = {"started": time.time() - lag, "task": None, "stacks": collections.Counter()}
+        self.offenders.append(self._offender(stall, lag))
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms in {stall['task'] or 'unknown'}")
+
+    def _offender(self, stall, lag):
+        stack, samples = (stall["stacks"].most_common(1) or [((), 0)])[0]
+        return {
+            "at": datetime.fromtimestamp(stall["started"], timezone.utc).isoformat(),
+            "lag": round(lag, 4),
+            "task": stall["task"],
+            "samples": sum(stall["stacks"].values()),
+            "stack_samples": samples,
+            "stack": list(stack)
+        }
+
+    def _watch(self):
+        # Sampling profiler for the loop thread, only active during stalls
+        while not self._stopped.wait(self.interval):
+            overdue = time.monotonic() - self._heartbeat - self.interval
+            if overdue < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = _loop_stack(frame)
+            task = asyncio.current_task(self._loop)
+            with self._lock:
+                if self._stall is None:
+                    self._stall = {
+                        "started": time.time() - overdue,
+                        "task": self._describe(task),
+                        "stacks": collections.Counter()
+                    }
+                self._stall["stacks"][stack] += 1
+
+    @staticmethod
+    def _describe(task):
+        if task is None:
+            # Plain callbacks (call_soon, transports) run outside any task
+            return None
+        coro = task.get_coro()
+        return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+    def report(self):
+        return {
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "last_lag": round(self.last_lag, 4),
+            "max_lag": round(self.max_lag, 4),
+            "offenders": list(reversed(self.offenders))
+        }
+
+
+loop_monitor = LoopMonitor()
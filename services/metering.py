@@ -0,0 +1,195 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from config import settings
+from services.lazy_redis import LazyRedis
+from services.metrics import USAGE_FLUSHES
+
+logger = logging.getLogger(__name__)
+
+# Usage outside an authenticated session (/api/process_audio)
+ANONYMOUS = "anonymous"
+
+# Set once per websocket session; pipeline tasks created afterwards inherit it
+user_var: ContextVar[str | None] = ContextVar("usage_user", default=None)
+
+redis_client = LazyRedis(decode_responses=True)
+
+
+def bind_user(user):
+    """Attributes the upstream usage of this context to `user`."""
+    user_var.set(user)
+
+
+def usage_day(now=None):
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+
+def usage_key(day, user):
+    return f"usage:{day}:{user}"
+
+
+def users_key(day):
+    return f"usage:{day}:users"
+
+
+class UsageMeter:
+    """
+    Per-user usage counters: asr_streams, asr_ms (audio duration billed by
+    Volcengine), llm_prompt_tokens, llm_tokens, tts_chars, and what the
+    caches answered instead of a provider, llm_cached_tokens and
+    tts_cached_chars.
+
+    add() is a dict update, cheap enough for the token and chunk paths.
+    Pending counts are added to one Redis hash per user and day by a
+    periodic flush, in a single pipeline; the totals Redis answers with are
+    kept, so quota checks need no round trip.
+    """
+
+    def __init__(self, redis=None, interval=None, retention_days=None, quotas=None):
+        self._redis = redis
+        self.interval = interval or settings.USAGE_FLUSH_INTERVAL
+        self.retention_days = retention_days or settings.USAGE_RETENTION_DAYS
+        self.quotas = settings.USAGE_DAILY_QUOTAS if quotas is None else quotas
+        self.day = usage_day()
+        # user -> counter -> amount, not flushed yet / flushed totals of self.day
+        self._pending: dict[str, dict[str, int]] = {}
+        self._totals: dict[str, dict[str, int]] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else redis_client
+
+    def add(self, counter, amount, user=None):
+        if not amount:
+            return
+        user = user or user_var.get() or ANONYMOUS
+        counters = self._pending.get(user)
+        if counters is None:
+            counters = self._pending[user] = {}
+        counters[counter] = counters.get(counter, 0) + amount
+
+    def _merge(self, pending):
+        for user, counters in pending.items():
+            for counter, amount in counters.items():
+                self.add(counter, amount, user)
+
+    def _roll_day(self):
+        day = usage_day()
+        if day != self.day:
+            self.day = day
+            self._totals.clear()
+
+    async def flush(self):
+        """Adds the pending counts to Redis; they are kept for the next flush if that fails."""
+        if not self._pending:
+            self._roll_day()
+            return
+        pending, self._pending = self._pending, {}
+        day = self.day
+        ttl = self.retention_days * 86400
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user, counters in pending.items():
+                    key = usage_key(day, user)
+                    for counter, amount in counters.items():
+                        pipe.hincrby(key, counter, amount)
+                    pipe.expire(key, ttl)
+                pipe.sadd(users_key(day), *pending)
+                pipe.expire(users_key(day), ttl)
+                replies = iter(await pipe.execute())
+        except asyncio.CancelledError:
+            self._merge(pending)
+            raise
+        except Exception as e:
+            self._merge(pending)
+            USAGE_FLUSHES.labels("error").inc()
+            logger.warning(f"Usage flush failed, retrying with the next one: {e}")
+            return
+
+        USAGE_FLUSHES.labels("ok").inc()
+        for user, counters in pending.items():
+            totals = self._totals.setdefault(user, {})
+            for counter in counters:
+                totals[counter] = int(next(replies))
+            # expire
+            next(replies)
+        self._roll_day()
+
+    def usage(self, user):
+        """Today's counts of `user`: the totals of the last flush plus what is pending."""
+        usage = dict(self._totals.get(user, {}))
+        for counter, amount in self._pending.get(user, {}).items():
+            usage[counter] = usage.get(counter, 0) + amount
+        return usage
+
+    async def refresh(self, user):
+        """Loads the totals of `user` from Redis, which may include usage on other instances."""
+        try:
+            stored = await self.redis.hgetall(usage_key(self.day, user))
+        except Exception as e:
+            logger.warning(f"Could not load the usage of {user}: {e}")
+            return
+        self._totals[user] = {counter: int(amount) for counter, amount in stored.items()}
+
+    def over_quota(self, user):
+        """The first counter in which `user` reached its daily quota, or None."""
+        if not self.quotas:
+            return None
+        usage = self.usage(user)
+        for counter, limit in self.quotas.items():
+            if limit and usage.get(counter, 0) >= limit:
+                return counter
+        return None
+
+    async def query(self, day=None, user=None):
+        """Counts by user for `day` (default today), as stored plus what is still pending here."""
+        day = day or self.day
+        if user is not None:
+            users = [user]
+        else:
+            users = set(await self.redis.smembers(users_key(day)))
+            if day == self.day:
+                users.update(self._pending)
+            users = sorted(users)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for name in users:
+                pipe.hgetall(usage_key(day, name))
+            stored = await pipe.execute() if users else []
+
+        report = {}
+        for name, counters in zip(users, stored):
+            counts = {counter: int(amount) for counter, amount in counters.items()}
+            if day == self.day:
+                for counter, amount in self._pending.get(name, {}).items():
+                    counts[counter] = counts.get(counter, 0) + amount
+            report[name] = counts
+        return report
+
+    def start(self):
+        """Starts the periodic flush. Call from inside the running loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="usage-flush")
+        return self
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def stop(self):
+        """Stops the periodic flush and writes what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+usage_meter = UsageMeter()
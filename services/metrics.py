@@ -0,0 +1,244 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Registered on the default registry, so they are served by the
+# Instrumentator's /metrics endpoint alongside the HTTP metrics.
+
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# WebSocket Session Buffers
+WS_BUFFERED_BYTES = Gauge(
+    "ws_buffered_bytes",
+    "Bytes currently buffered across all websocket sessions",
+    ["direction"]
+)
+WS_SESSION_BUFFERED_BYTES = Histogram(
+    "ws_session_buffered_bytes",
+    "Per-session buffered bytes observed on every enqueue",
+    ["direction"],
+    buckets=BYTES_BUCKETS
+)
+WS_AUDIO_OVERFLOWS = Counter(
+    "ws_audio_overflows_total",
+    "Inbound audio chunks that hit the bounded queue limit",
+    ["policy"]
+)
+WS_SLOW_CONSUMERS = Counter(
+    "ws_slow_consumers_total",
+    "Websocket sessions disconnected because the client stopped reading"
+)
+WS_SESSION_RESUMES = Counter(
+    "ws_session_resumes_total",
+    "Websocket resume attempts and sessions whose grace period ran out",
+    ["outcome"]
+)
+
+WS_IDLE_SESSIONS = Counter(
+    "ws_idle_sessions_total",
+    "Idle websocket session transitions",
+    ["event"]  # hibernated / woken / closed
+)
+WS_HIBERNATED_SESSIONS = Gauge(
+    "ws_hibernated_sessions",
+    "Websocket sessions currently hibernated"
+)
+
+# Upstream Provider Concurrency
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROVIDER_QUEUE_WAIT = Histogram(
+    "provider_queue_wait_seconds",
+    "Time spent waiting for a provider concurrency slot",
+    ["provider"],
+    buckets=QUEUE_WAIT_BUCKETS
+)
+PROVIDER_QUEUE_DEPTH = Gauge(
+    "provider_queue_depth",
+    "Requests waiting for a provider concurrency slot",
+    ["provider"]
+)
+PROVIDER_IN_FLIGHT = Gauge(
+    "provider_in_flight",
+    "Requests currently holding a provider concurrency slot",
+    ["provider"]
+)
+PROVIDER_QUEUE_TIMEOUTS = Counter(
+    "provider_queue_timeouts_total",
+    "Requests that gave up waiting for a provider concurrency slot",
+    ["provider"]
+)
+OVERLOAD_REJECTIONS = Counter(
+    "overload_rejections_total",
+    "Requests rejected early because provider queues are saturated",
+    ["endpoint"]
+)
+
+# Streaming Reliability
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+LLM_TTFT = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from request to the first LLM token (cache misses only)",
+    buckets=LATENCY_BUCKETS
+)
+STREAM_HEDGES = Counter(
+    "stream_hedges_total",
+    "Hedged upstream requests fired and won",
+    ["stream", "outcome"]
+)
+STREAM_ATTEMPT_FAILURES = Counter(
+    "stream_attempt_failures_total",
+    "Upstream stream attempts that failed",
+    ["stream", "phase"]
+)
+
+# Endpoint Routing
+ROUTER_DECISIONS = Counter(
+    "router_decisions_total",
+    "Endpoint chosen by the latency-aware router",
+    ["capability", "endpoint", "reason"]
+)
+ENDPOINT_TTFT = Histogram(
+    "endpoint_time_to_first_byte_seconds",
+    "Time to first token/byte per upstream endpoint",
+    ["capability", "endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+ENDPOINT_EWMA_TTFT = Gauge(
+    "endpoint_ewma_ttft_seconds",
+    "Smoothed time to first token/byte per upstream endpoint",
+    ["capability", "endpoint"]
+)
+ENDPOINT_ERRORS = Counter(
+    "endpoint_errors_total",
+    "Failed requests per upstream endpoint",
+    ["capability", "endpoint"]
+)
+ENDPOINT_EJECTED = Gauge(
+    "endpoint_ejected",
+    "1 while an endpoint is ejected as an outlier",
+    ["capability", "endpoint"]
+)
+
+# TTS Output
+TTS_BYTES_PER_SECOND = Histogram(
+    "tts_bytes_per_second_of_speech",
+    "Synthesized bytes per second of speech, per output format",
+    ["format"],
+    buckets=(1000, 2000, 4000, 8000, 16000, 32000, 48000, 64000, 96000)
+)
+
+# Startup Warm-up
+WARMUP_DURATION = Gauge(
+    "warmup_duration_seconds",
+    "Time spent warming up each upstream dependency at startup",
+    ["dependency"]
+)
+WARMUP_OK = Gauge(
+    "warmup_ok",
+    "1 if the dependency warmed up successfully, 0 if it failed or timed out",
+    ["dependency"]
+)
+
+# Graceful Draining
+DRAINED_SESSIONS = Counter(
+    "drained_sessions_total",
+    "Websocket sessions closed by a drain, by whether their last turn finished in time",
+    ["outcome"]
+)
+DRAIN_REJECTIONS = Counter(
+    "drain_rejections_total",
+    "New sessions and uploads refused while the process was draining",
+    ["endpoint"]
+)
+DRAIN_DURATION = Gauge(
+    "drain_duration_seconds",
+    "Time the last drain took from its start until every session was closed"
+)
+
+# Usage Metering
+USAGE_FLUSHES = Counter(
+    "usage_flushes_total",
+    "Batched writes of the per-user usage counters to Redis",
+    ["outcome"]
+)
+USAGE_QUOTA_REJECTIONS = Counter(
+    "usage_quota_rejections_total",
+    "Sessions and turns refused because the user used up a daily quota",
+    ["counter"]
+)
+
+# Event Loop Health
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when a loop tick was due and when it ran",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls_total",
+    "Times the event loop was blocked longer than LOOP_LAG_THRESHOLD"
+)
+
+# Turn Latency (flight recorder)
+TURN_LATENCY = Histogram(
+    "turn_response_latency_seconds",
+    "Time from the end of user speech to the first audio frame of the answer sent",
+    ["kind"],
+    buckets=LATENCY_BUCKETS
+)
+TURN_FIRST_SOUND = Histogram(
+    "turn_first_sound_latency_seconds",
+    "Time from the end of user speech to the first audio frame sent, filler clips included",
+    ["kind"],
+    buckets=LATENCY_BUCKETS
+)
+SLOW_TURNS = Counter(
+    "slow_turns_total",
+    "Turns that exceeded FLIGHT_RECORDER_SLO and were saved",
+    ["kind"]
+)
+
+# TTS Text Normalization
+TTS_TEXT_CHARS = Counter(
+    "tts_text_chars_total",
+    "Characters of TTS sentences as segmented from the LLM output and as sent to synthesis",
+    ["stage"]  # segmented / spoken; the difference is what normalization removed
+)
+TTS_CACHE_LOOKUPS = Counter(
+    "tts_cache_lookups_total",
+    "TTS cache lookups; hits on rewritten sentences are the ones normalization can have won",
+    ["result", "text"]  # hit / miss, rewritten / verbatim
+)
+
+# Filler Audio
+FILLER_CLIPS = Counter(
+    "ws_filler_clips_total",
+    "Filler clip decisions for slow-starting answers",
+    ["outcome"]  # sent / skipped (earlier turn still playing) / not_ready
+)
+
+# Server-side Endpointing
+WS_ENDPOINT_DELAY = Histogram(
+    "ws_endpoint_delay_seconds",
+    "Time from the last change of the partial transcript to the end of the turn",
+    ["reason"],  # definite / silence (server-side), client (finish_speaking came first)
+    buckets=(0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0)
+)
+
+# Token Frame Coalescing
+WS_TOKEN_FRAMES_PER_TURN = Histogram(
+    "ws_llm_token_frames_per_turn",
+    "llm_token frames sent per turn, after coalescing",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+WS_TOKENS_PER_FRAME = Histogram(
+    "ws_llm_tokens_per_frame",
+    "LLM tokens carried by each llm_token frame",
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34)
+)
+
+# Batch Transcription
+BATCH_FILES = Counter(
+    "batch_transcription_files_total",
+    "Files processed by batch transcription",
+    ["outcome"]
+)
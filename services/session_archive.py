@@ -0,0 +1,202 @@
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from config import settings
+from log_context import session_id_var
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+
+# Archive of the session/request being handled, like flight_recorder.current_recorder
+current_archive: ContextVar["SessionArchive | None"] = ContextVar("session_archive", default=None)
+
+
+def start(kind, **params):
+    """
+    Starts recording the current session if SESSION_RECORDING_ENABLED (and it
+    is sampled); returns the bound archive or None.
+
+    `params` are what the replayer needs to open the session the same way
+    (query parameters, content type).
+    """
+    if not settings.SESSION_RECORDING_ENABLED or random.random() >= settings.SESSION_RECORDING_SAMPLE:
+        return None
+    return SessionArchive(kind, params=params).bind()
+
+
+def capture(stream, event, data=None):
+    """Adds an event to the current archive, if any."""
+    archive = current_archive.get()
+    if archive is not None:
+        archive.capture(stream, event, data)
+
+
+def upstream(service, **request):
+    """
+    Opens a recorded upstream exchange with `service` ("asr", "llm", ...).
+
+    Call it right before the request is sent; the replayer times the
+    response relative to this point. Returns a no-op stream when the
+    session is not recorded.
+    """
+    archive = current_archive.get()
+    if archive is None:
+        return NULL_UPSTREAM
+    return UpstreamStream(archive, archive.open_stream(service), request)
+
+
+class UpstreamStream:
+    """One upstream request/connection of a recorded session, e.g. "llm:2"."""
+
+    def __init__(self, archive, name, request):
+        self.archive = archive
+        self.name = name
+        archive.capture(name, "open", request)
+
+    def record(self, event, data=None):
+        self.archive.capture(self.name, event, data)
+
+    async def tap(self, source):
+        """Passes `source` (response bytes, websocket frames) through, recording each item."""
+        async for data in source:
+            self.archive.capture(self.name, "data", data)
+            yield data
+
+
+class _NullUpstream:
+    name = None
+
+    def record(self, event, data=None):
+        pass
+
+    def tap(self, source):
+        return source
+
+
+NULL_UPSTREAM = _NullUpstream()
+
+
+def _encode(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return {"b64": base64.b64encode(data).decode("ascii")}
+    return data
+
+
+def _decode(data):
+    if isinstance(data, dict) and data.keys() == {"b64"}:
+        return base64.b64decode(data["b64"])
+    return data
+
+
+def _size(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    return len(str(data)) if data is not None else 0
+
+
+class SessionArchive:
+    """
+    Timestamped inbound client traffic and raw upstream streams of one
+    websocket session or /api/process_audio request, for replay_session.py.
+
+    Events are [offset_ms, stream, event, data]: stream "client" for what
+    the client sent, "<service>:<n>" for the n-th upstream exchange with a
+    service. Kept in memory up to SESSION_RECORDING_MAX_BYTES and written
+    once, as gzipped JSON lines, when the session ends.
+    """
+
+    def __init__(self, kind, session_id=None, params=None, max_bytes=None, directory=None):
+        self.kind = kind
+        self.session_id = session_id or session_id_var.get()
+        self.params = params or {}
+        self.max_bytes = max_bytes or settings.SESSION_RECORDING_MAX_BYTES
+        self.directory = directory or settings.SESSION_RECORDING_DIR
+        self.started_at = datetime.now(timezone.utc)
+        self.events = []
+        self.bytes = 0
+        self.truncated = False
+        self.saved = None
+        self._start = time.monotonic()
+        self._streams: dict[str, int] = {}
+
+    def bind(self):
+        """Makes this the archive for the current context and tasks created from it."""
+        current_archive.set(self)
+        return self
+
+    def open_stream(self, service):
+        self._streams[service] = self._streams.get(service, 0) + 1
+        return f"{service}:{self._streams[service]}"
+
+    def capture(self, stream, event, data=None):
+        if self.truncated or self.saved:
+            return
+        self.bytes += _size(data)
+        if self.bytes > self.max_bytes:
+            # A partial archive still replays up to this point
+            self.truncated = True
+            logger.warning(f"Session archive {self.session_id} truncated at {self.max_bytes} bytes")
+            return
+        offset = round((time.monotonic() - self._start) * 1000, 1)
+        self.events.append((offset, stream, event, data))
+
+    def header(self):
+        return {
+            "version": ARCHIVE_VERSION,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "started_at": self.started_at.isoformat(),
+            "params": self.params,
+            "truncated": self.truncated,
+        }
+
+    def dumps(self):
+        lines = [json.dumps(self.header(), separators=(",", ":"))]
+        for offset, stream, event, data in self.events:
+            lines.append(json.dumps([offset, stream, event, _encode(data)], separators=(",", ":"), ensure_ascii=False))
+        return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def _write(self, path, blob):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(blob)
+
+    async def save(self):
+        """Writes the archive (once); returns its path, or None if it failed."""
+        if self.saved is not None:
+            return self.saved
+        stamp = self.started_at.strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.directory, f"{self.kind}-{stamp}-{self.session_id}.jsonl.gz")
+        self.saved = path
+        try:
+            # Compression and file I/O stay off the event loop
+            loop = asyncio.get_running_loop()
+            blob = await loop.run_in_executor(None, self.dumps)
+            await loop.run_in_executor(None, self._write, path, blob)
+        except Exception as e:
+            logger.error(f"Could not save session archive {path}: {e}")
+            return None
+        logger.info(f"Session archive saved: {path} ({len(self.events)} events)")
+        return path
+
+
+def load(path):
+    """Reads an archive written by SessionArchive.save(): (header, [(offset_ms, stream, event, data)])."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"{path}: unsupported archive version {header.get('version')}")
+        events = []
+        for line in f:
+            if line.strip():
+                offset, stream, event, data = json.loads(line)
+                events.append((offset, stream, event, _decode(data)))
+    return header, events
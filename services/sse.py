@@ -0,0 +1,117 @@
+"""
+Server-sent events decoding for the streaming providers (LLM tokens, TTS audio).
+
+Works on the raw response bytes: no text decoding of whole lines, one JSON
+parse per event, and TTS audio is unhexed straight from the event bytes.
+"""
+import binascii
+import json
+
+try:
+    import orjson
+except ImportError: # Optional, the stdlib parser is used instead
+    orjson = None  # type: ignore[assignment]
+
+
+def loads(payload):
+    """Parses a JSON event payload (bytes). Raises ValueError on bad JSON."""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+class SSEDecoder:
+    """
+    Incremental SSE decoder: feed it byte chunks as they arrive, get back the
+    `data` of every event completed by them.
+
+    Lines may be split across chunks and end in LF or CRLF. Multi-line data
+    fields are joined with "\\n"; comments and other fields (event, id,
+    retry) are skipped. With `bare_json` a line that is a JSON object on its
+    own, without a "data:" prefix, is an event by itself.
+    """
+
+    def __init__(self, bare_json=False):
+        self.bare_json = bare_json
+        # Pieces of a line not terminated yet (large audio events span many chunks)
+        self._partial: list[bytes] = []
+        self._data: list[bytes] = []
+
+    def feed(self, chunk):
+        if b"\n" not in chunk:
+            if chunk:
+                self._partial.append(chunk)
+            return []
+
+        lines = chunk.split(b"\n")
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = b"".join(self._partial)
+            self._partial = []
+        # Last piece is an incomplete line (b"" if the chunk ended with one)
+        tail = lines.pop()
+        if tail:
+            self._partial.append(tail)
+
+        events = []
+        for line in lines:
+            self._line(line, events)
+        return events
+
+    def close(self):
+        """Flushes an event left without its terminating blank line."""
+        events = []
+        if self._partial:
+            self._line(b"".join(self._partial), events)
+            self._partial = []
+        self._dispatch(events)
+        return events
+
+    def _line(self, line, events):
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        if not line:
+            self._dispatch(events)
+        elif line.startswith(b"data:"):
+            value = line[5:]
+            self._data.append(value[1:] if value.startswith(b" ") else value)
+        elif self.bare_json and line.startswith(b"{"):
+            self._dispatch(events)
+            events.append(line)
+
+    def _dispatch(self, events):
+        if self._data:
+            events.append(self._data[0] if len(self._data) == 1 else b"\n".join(self._data))
+            self._data = []
+
+
+async def iter_events(byte_stream, bare_json=False):
+    """Yields the data (bytes) of every event in an async stream of byte chunks."""
+    decoder = SSEDecoder(bare_json=bare_json)
+    async for chunk in byte_stream:
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.close():
+        yield event
+
+
+def hex_field(payload, key):
+    """
+    Decodes the hex string `"<key>":"..."` directly from a raw JSON event.
+
+    Skips building the JSON tree and the intermediate str for large hex
+    payloads (TTS audio). Returns None if the field is not there in compact
+    form, so callers can fall back to loads().
+    """
+    marker = b'"' + key + b'":"'
+    start = payload.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+    end = payload.find(b'"', start)
+    if end == -1:
+        return None
+    try:
+        return binascii.unhexlify(memoryview(payload)[start:end])
+    except (binascii.Error, ValueError):
+        return None
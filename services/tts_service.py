@@ -1,51 +1,109 @@
-import httpx
 import logging
-import json
 import hashlib
-from redis.asyncio import Redis
+import time
 from tenacity import retry, stop_after_attempt, wait_exponential
+from typing import TYPE_CHECKING
 from config import settings
+from services.concurrency import get_limiter, ProviderBusyError
+from services.endpoint_router import EndpointRouter
+from services.audio_format import DEFAULT_AUDIO_FORMAT
+from services.metrics import TTS_BYTES_PER_SECOND, TTS_CACHE_LOOKUPS, TTS_TEXT_CHARS
+from services.tts_text import SpeechNormalizer
+from services.metering import usage_meter
+from services.lazy_redis import LazyRedis
+from log_context import sampled
+from services import flight_recorder, session_archive, sse
+
+if TYPE_CHECKING:
+    import httpx
+
+def __getattr__(name):
+    # `services.tts_service.httpx` still resolves (mock.patch targets), importing httpx on demand
+    if name == "httpx":
+        import httpx
+        return httpx
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 logger = logging.getLogger(__name__)
 
+# Routes across settings.TTS_ENDPOINTS by observed latency
+tts_router = EndpointRouter("tts", settings.TTS_ENDPOINTS)
+
 # Redis for Audio Caching (Binary safe)
-redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=False)
+redis_client = LazyRedis(decode_responses=False)
+
+# Shared Client (created lazily, reused across requests; httpx is imported with it)
+_client: "httpx.AsyncClient | None" = None
 
-# Shared Client
 async def get_httpx_client():
-    limits = httpx.Limits(max_keepalive_connections=20, max_connections=50)
-    return httpx.AsyncClient(limits=limits, timeout=10.0)
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        limits = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+        _client = httpx.AsyncClient(limits=limits, timeout=10.0)
+    return _client
+
+async def close_httpx_client():
+    # On shutdown, after the last session using the pool is gone
+    if _client is not None:
+        await _client.aclose()
+
+def parse_audio_event(payload):
+    """
+    Audio bytes and, on the final event, the audio length (ms) of one MiniMax
+    stream event. The hex audio is decoded without a full JSON parse when
+    possible. Raises ValueError on malformed events.
+    """
+    audio = sse.hex_field(payload, b"audio")
+    if audio is not None and b'"audio_length"' not in payload:
+        return audio, None
+
+    data = sse.loads(payload)
+    if audio is None and isinstance(data.get('data'), dict) and data['data'].get('audio'):
+        audio = bytes.fromhex(data['data']['audio'])
+    return audio, (data.get('extra_info') or {}).get('audio_length')
 
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=2, max=5)
 )
-async def tts_request(text):
+async def tts_request(text, audio_format=DEFAULT_AUDIO_FORMAT, rewritten=False):
     """
     Helper to send a single TTS request for a sentence.
     Yields the full audio bytes for that sentence once complete.
+
+    Args:
+        text (str): Sentence to synthesize.
+        audio_format (AudioFormat): Output codec and sample rate.
+        rewritten (bool): Whether normalization changed the sentence; only
+            labels the cache metrics.
     """
     if not text.strip():
         return
 
-    # Cache Key
-    cache_key = f"tts:{hashlib.md5(text.encode()).hexdigest()}"
+    # Cache Key (variants of the same sentence must not collide)
+    cache_key = f"tts:{audio_format.key}:{hashlib.md5(text.encode()).hexdigest()}"
 
     # Check Cache
     cached_audio = await redis_client.get(cache_key)
+    TTS_CACHE_LOOKUPS.labels("hit" if cached_audio else "miss", "rewritten" if rewritten else "verbatim").inc()
     if cached_audio:
-        logger.info("TTS Cache Hit")
+        if (suppressed := sampled("tts_cache_hit")) is not None:
+            logger.info(f"TTS Cache Hit (+{suppressed} suppressed)")
+        flight_recorder.record("tts_cache_hit", bytes=len(cached_audio))
+        usage_meter.add("tts_cached_chars", len(text))
         yield cached_audio
         return
 
-    url = f"https://api.minimaxi.com/v1/t2a_v2?groupId={settings.MINIMAX_GROUP_ID}"
+    endpoint = tts_router.pick()
+    url = f"{endpoint.url}?groupId={settings.MINIMAX_GROUP_ID}"
     headers = {
-        "Authorization": f"Bearer {settings.MINIMAX_API_KEY}",
+        "Authorization": f"Bearer {endpoint.api_key or settings.MINIMAX_API_KEY}",
         "Content-Type": "application/json"
     }
 
     payload = {
-        "model": "speech-01-turbo",
+        "model": endpoint.model,
         "text": text,
         "stream": True,
         "voice_setting": {
@@ -54,73 +112,125 @@ async def tts_request(text):
             "vol": 1.0,
             "pitch": 0
         },
-        "audio_setting": {
-            "sample_rate": 32000,
-            "format": "mp3",
-            "channel": 1
-        }
+        "audio_setting": audio_format.audio_setting()
     }
 
-    full_audio = b""
+    audio_chunks = []
+    start = time.monotonic()
+    first_byte_at = None
+    upstream_done = False
+    audio_length_ms = None
 
+    flight_recorder.record("tts_request_start", endpoint=endpoint.name, chars=len(text))
     try:
         client = await get_httpx_client()
-        async with client.stream("POST", url, headers=headers, json=payload) as response:
+        upstream = session_archive.upstream("tts", endpoint=endpoint.name, chars=len(text))
+        async with get_limiter("minimax").acquire(), \
+                client.stream("POST", url, headers=headers, json=payload) as response:
+            upstream.record("status", response.status_code)
             if response.status_code != 200:
-                logger.error(f"TTS Error: {response.status_code}")
+                logger.error(f"TTS Error: {response.status_code} from {endpoint.name}")
+                tts_router.record_failure(endpoint.name)
                 # Don't retry on 4xx errors usually, but 5xx yes.
                 # raising error triggers tenacity retry
                 if response.status_code >= 500:
+                    # Already counted as a failure
+                    upstream_done = True
                     response.raise_for_status()
                 return
 
-            async for line in response.aiter_lines():
-                if not line: continue
-                if line.startswith("data:"):
-                    line = line[5:]
-
+            async for payload in sse.iter_events(upstream.tap(response.aiter_bytes()), bare_json=True):
                 try:
-                    data = json.loads(line)
-                    if 'data' in data and 'audio' in data['data']:
-                        chunk = bytes.fromhex(data['data']['audio'])
-                        full_audio += chunk
-                except json.JSONDecodeError:
+                    chunk, length_ms = parse_audio_event(payload)
+                except ValueError:
                     continue
-
-        # Cache Update (Expire in 24 hours)
+                if chunk:
+                    if first_byte_at is None:
+                        first_byte_at = time.monotonic()
+                        flight_recorder.record("tts_first_byte")
+                    audio_chunks.append(chunk)
+                if length_ms:
+                    audio_length_ms = length_ms
+
+        full_audio = b"".join(audio_chunks)
+        now = time.monotonic()
+        upstream_done = True
+        usage_meter.add("tts_chars", len(text))
+        flight_recorder.record("tts_end", bytes=len(full_audio))
+        tts_router.record_success(
+            endpoint.name,
+            ttft=(first_byte_at or now) - start,
+            units=len(full_audio),
+            duration=now - (first_byte_at or now)
+        )
+
+        seconds = audio_length_ms / 1000 if audio_length_ms else audio_format.pcm_duration(len(full_audio))
+        if full_audio and seconds:
+            TTS_BYTES_PER_SECOND.labels(audio_format.key).observe(len(full_audio) / seconds)
+
+        # Cache Update
         if full_audio:
-             await redis_client.setex(cache_key, 86400, full_audio)
+             await redis_client.setex(cache_key, settings.TTS_CACHE_TTL, full_audio)
              yield full_audio
 
+    except ProviderBusyError as e:
+        logger.warning(f"TTS busy: {e}")
+        tts_router.release(endpoint.name)
+        raise e
     except Exception as e:
         logger.error(f"TTS Request Exception: {e}")
+        flight_recorder.record("tts_error", error=type(e).__name__)
+        if not upstream_done:
+            tts_router.record_failure(endpoint.name)
         raise e
 
-async def text_to_speech_stream(text_iterator):
+async def text_to_speech_stream(text_iterator, audio_format=DEFAULT_AUDIO_FORMAT):
     """
     Consumes an async generator of text tokens, buffers them into sentences,
     and yields audio chunks (full sentences) for each sentence.
+
+    Each sentence is normalized for speech (tts_text.SpeechNormalizer)
+    before it is synthesized or looked up in the cache.
     """
     buffer = ""
     punctuation = "。！？；!?;."
+    normalizer = SpeechNormalizer(expand_numbers=settings.TTS_EXPAND_NUMBERS) if settings.TTS_NORMALIZE_TEXT else None
+
+    async def speak(sentence):
+        flight_recorder.record("sentence", chars=len(sentence))
+        spoken = normalizer.normalize(sentence) if normalizer else sentence
+        TTS_TEXT_CHARS.labels("segmented").inc(len(sentence))
+        TTS_TEXT_CHARS.labels("spoken").inc(len(spoken))
+        if not spoken.strip():
+            # Only markup, code or emoji
+            return
+        try:
+            async for audio_chunk in tts_request(spoken, audio_format, rewritten=spoken != sentence):
+                yield audio_chunk
+        except Exception:
+            pass # Continue to next sentence even if one fails
 
+    held = False
     async for token in text_iterator:
+        if held and not (token[:1].isascii() and token[:1].isalnum()):
+            async for audio_chunk in speak(buffer):
+                yield audio_chunk
+            buffer = ""
+        held = False
         buffer += token
 
         # Check if we have a full sentence
         if any(p in token for p in punctuation):
             if buffer[-1] in punctuation or len(buffer) > 50:
-                try:
-                    async for audio_chunk in tts_request(buffer):
-                        yield audio_chunk
-                except Exception:
-                    pass # Continue to next sentence even if one fails
+                if buffer[-1] == "." and buffer[-2:-1].isascii() and buffer[-2:-1].isalnum():
+                    # "3.14", "example.com": the next token decides
+                    held = True
+                    continue
+                async for audio_chunk in speak(buffer):
+                    yield audio_chunk
                 buffer = ""
 
     # Process remaining buffer
     if buffer:
-        try:
-            async for audio_chunk in tts_request(buffer):
-                yield audio_chunk
-        except Exception:
-            pass
+        async for audio_chunk in speak(buffer):
+            yield audio_chunk
@@ -0,0 +1,211 @@
+"""
+Text normalization between the sentence segmenter and TTS.
+
+LLM output is written for reading: markdown, list bullets, code, emoji and
+URLs. None of it should be spoken (or billed), and sentences that differ
+only in such noise or in punctuation width should share one `tts:` cache
+entry. Optionally, numbers and units are spelled out the way they are read
+in Chinese, so the provider does not have to guess.
+"""
+import re
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+# Chinese punctuation a space next to is never spoken
+_CJK_PUNCTUATION = "。，、；：！？…（）《》「」『』“”‘’【】"
+
+_FENCE = re.compile(r"```|~~~")
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_URL = re.compile(r"(?:https?://|www\.)[^\s" + _CJK + _CJK_PUNCTUATION + r"]+")
+# Known tags only, with well-formed attributes: "a<b 且 b>c" is a comparison
+_HTML_TAG = re.compile(
+    r"</?(?:a|abbr|b|blockquote|br|code|del|div|em|font|h[1-6]|hr|i|img|ins|kbd|li|mark|ol|p|pre|s|small"
+    r"|span|strong|sub|sup|table|tbody|td|th|thead|tr|u|ul)"
+    r"(?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'<>]+))?)*\s*/?>",
+    re.I
+)
+_RULE = re.compile(r"^[ \t]*([-*_])(?:[ \t]*\1){2,}[ \t]*$", re.M)
+_LINE_MARKUP = re.compile(r"^[ \t]*(?:#{1,6}[ \t]*|>[ \t]?|[-*+•][ \t]+)", re.M)
+_ORDERED_ITEM = re.compile(r"^[ \t]*(\d+)[.)][ \t]+", re.M)
+_EMPHASIS = re.compile(r"(\*\*|__|~~)(.+?)\1|(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])")
+_INLINE_CODE = re.compile(r"`+([^`]*)`+")
+# A "*" between operands is multiplication (2*3, 5 * 4), not emphasis
+_TIMES = re.compile(r"(?<=[0-9A-Za-z)])[ \t]*\*[ \t]*(?=[0-9A-Za-z(])")
+_TABLE = re.compile(r"^[ \t]*\|?(?:[ \t]*:?-{3,}:?[ \t]*\|)+[ \t]*:?-*:?[ \t]*$", re.M)
+_EMOJI = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U00002B00-\U00002BFF\uFE0E\uFE0F\u200D\u20E3]"
+)
+_NEWLINES = re.compile(r"[ \t]*\n[\s]*")
+_SPACES = re.compile(r"\s+")
+_SPACE_AROUND_CJK = re.compile(
+    r"(?<=[" + _CJK + _CJK_PUNCTUATION + r"]) | (?=[" + _CJK + _CJK_PUNCTUATION + r"])"
+)
+# ASCII punctuation written after Chinese text, in its full-width form
+_HALF_WIDTH_AFTER_CJK = re.compile(r"(?<=[" + _CJK + r"])\s*([,!?;:.()])")
+_TO_FULL_WIDTH = {",": "，", "!": "！", "?": "？", ";": "；", ":": "：", ".": "。", "(": "（", ")": "）"}
+_REPEATED_PUNCTUATION = re.compile(r"([。，、；：！？!?,;])\1+")
+_ELLIPSIS = re.compile(r"\.{3,}|…+")
+_LEADING_PUNCTUATION = re.compile(r"^[，、；：,;:\s]+")
+_TRAILING_PAUSE = re.compile(r"[，、,\s]+$")
+
+# Number expansion
+_DIGITS = "零一二三四五六七八九"
+_SMALL_UNITS = ("", "十", "百", "千")
+_LARGE_UNITS = ("", "万", "亿")
+_THOUSANDS = re.compile(r"(?<![\d.])\d{1,3}(?:,\d{3})+(?![\d])")
+_PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*[%％]")
+_YEAR = re.compile(r"(?<!\d)(\d{4})(?=\s*年)")
+_CLOCK = re.compile(r"(?<!\d)([01]?\d|2[0-3]):([0-5]\d)(?!\d)")
+_RANGE = re.compile(r"(?<=\d)\s*[-~～]\s*(?=\d)")
+# ASCII only: a minus sign directly after Chinese text (温度是-5℃) is still one
+_NEGATIVE = re.compile(r"(?<![\w.])-(?=\d)", re.ASCII)
+_UNIT = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(°C|℃|km/h|km|kg|cm|mm|ml|mL|m²|m|g|L|h|min|s)(?![a-zA-Z])"
+)
+_UNIT_NAMES = {
+    "°C": "摄氏度", "℃": "摄氏度", "km/h": "公里每小时", "km": "公里", "kg": "公斤",
+    "cm": "厘米", "mm": "毫米", "ml": "毫升", "mL": "毫升", "m²": "平方米", "m": "米",
+    "g": "克", "L": "升", "h": "小时", "min": "分钟", "s": "秒",
+}
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _below_10000(n):
+    spoken, zero = "", False
+    for position in (3, 2, 1, 0):
+        digit = n // 10 ** position % 10
+        if digit == 0:
+            zero = bool(spoken)
+            continue
+        if zero:
+            spoken += "零"
+            zero = False
+        spoken += _DIGITS[digit] + _SMALL_UNITS[position]
+    return spoken
+
+
+def integer_to_chinese(n):
+    """Reads an integer below 10^12 the Chinese way: 105 -> 一百零五, 20000 -> 二万."""
+    if n == 0:
+        return "零"
+    groups = []
+    while n:
+        groups.append(n % 10000)
+        n //= 10000
+
+    spoken = ""
+    for index in reversed(range(len(groups))):
+        group = groups[index]
+        if group == 0:
+            continue
+        # 一万零五, 一亿零五十万
+        if spoken and (group < 1000 or groups[index + 1] == 0):
+            spoken += "零"
+        spoken += _below_10000(group) + _LARGE_UNITS[index]
+    # 十五, not 一十五
+    return spoken[1:] if spoken.startswith("一十") else spoken
+
+
+def digits_to_chinese(digits):
+    """Digit by digit, for years, codes and phone numbers: 2024 -> 二零二四."""
+    return "".join(_DIGITS[int(d)] for d in digits)
+
+
+def number_to_chinese(text):
+    """"3.14" -> 三点一四; long or zero-padded integers are read digit by digit."""
+    integer, _, fraction = text.partition(".")
+    if len(integer) > 1 and integer.startswith("0") or len(integer) > 8:
+        spoken = digits_to_chinese(integer)
+    else:
+        spoken = integer_to_chinese(int(integer))
+    if fraction:
+        spoken += "点" + digits_to_chinese(fraction)
+    return spoken
+
+
+def expand_numbers(text):
+    """Spells out numbers, percentages, units, times and years for Chinese speech."""
+    text = _THOUSANDS.sub(lambda m: m.group(0).replace(",", ""), text)
+    # Before units and percentages, which take the digits the signs attach to
+    text = _RANGE.sub("到", text)
+    text = _NEGATIVE.sub("负", text)
+    text = _PERCENT.sub(lambda m: "百分之" + number_to_chinese(m.group(1)), text)
+    text = _YEAR.sub(lambda m: digits_to_chinese(m.group(1)), text)
+    text = _CLOCK.sub(
+        lambda m: number_to_chinese(m.group(1)) + "点" + ("" if m.group(2) == "00" else number_to_chinese(m.group(2)) + "分"),
+        text
+    )
+    text = _UNIT.sub(lambda m: number_to_chinese(m.group(1)) + _UNIT_NAMES[m.group(2)], text)
+    return _NUMBER.sub(lambda m: number_to_chinese(m.group(0)), text)
+
+
+def _to_half_width(text):
+    """Full-width letters, digits and spaces to ASCII; full-width punctuation is kept."""
+    out = []
+    for char in text:
+        code = ord(char)
+        if 0xFF10 <= code <= 0xFF19 or 0xFF21 <= code <= 0xFF3A or 0xFF41 <= code <= 0xFF5A:
+            char = chr(code - 0xFEE0)
+        elif code == 0x3000:
+            char = " "
+        out.append(char)
+    return "".join(out)
+
+
+def _join_lines(match):
+    # A line break after unpunctuated text (list items, headings) is a pause
+    before = match.string[match.start() - 1] if match.start() else ""
+    if not before or match.end() == len(match.string) or before in _CJK_PUNCTUATION or before in ",.!?;:":
+        return ""
+    return "，"
+
+
+class SpeechNormalizer:
+    """
+    Normalizes the sentences of one reply, in order. Keeps the state that
+    spans sentences: whether a code block is open.
+    """
+
+    def __init__(self, expand_numbers=False):
+        self.expand_numbers = expand_numbers
+        self.in_code = False
+
+    def _drop_code(self, text):
+        kept = []
+        for index, part in enumerate(_FENCE.split(text)):
+            if index:
+                self.in_code = not self.in_code
+            if not self.in_code:
+                kept.append(part)
+        return "".join(kept)
+
+    def normalize(self, text):
+        """The spoken form of `text`; may be empty if nothing in it is speakable."""
+        text = self._drop_code(text)
+        text = _IMAGE.sub("", text)
+        text = _LINK.sub(r"\1", text)
+        text = _URL.sub("", text)
+        text = _HTML_TAG.sub("", text)
+        text = _TABLE.sub("", text)
+        text = _RULE.sub("", text)
+        text = _ORDERED_ITEM.sub(r"\1、", text)
+        text = _LINE_MARKUP.sub("", text)
+        text = _EMPHASIS.sub(lambda m: m.group(2) if m.group(2) is not None else m.group(3), text)
+        text = _INLINE_CODE.sub(r"\1", text)
+        text = _TIMES.sub("乘", text)
+        # Left over from emphasis split across sentences
+        text = text.replace("|", "，").replace("*", "").replace("`", "")
+        text = _EMOJI.sub("", text)
+
+        text = _to_half_width(text)
+        text = _NEWLINES.sub(_join_lines, text)
+        text = _SPACES.sub(" ", text)
+        text = _ELLIPSIS.sub("…", text)
+        text = _HALF_WIDTH_AFTER_CJK.sub(lambda m: _TO_FULL_WIDTH[m.group(1)], text)
+        text = _SPACE_AROUND_CJK.sub("", text)
+        # After the spaces are settled, so digits between Latin words keep theirs
+        if self.expand_numbers:
+            text = expand_numbers(text)
+        text = _REPEATED_PUNCTUATION.sub(r"\1", text)
+        text = _LEADING_PUNCTUATION.sub("", text)
+        return _TRAILING_PAUSE.sub("", text)
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from config import settings
+from services import session_archive
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Enough for every signature below
+SNIFF_BYTES = 12
+# Multipart boundaries and part headers on top of the payload
+MULTIPART_OVERHEAD = 16 * 1024
+
+_END = object()
+
+
+class UploadRejected(Exception):
+    """The upload broke a limit; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_audio_container(head):
+    """
+    Identifies the audio container from its first bytes.
+
+    Returns:
+        str | None: "webm", "ogg", "wav", "mp3", or None if unsupported.
+    """
+    if head.startswith(b"\x1a\x45\xdf\xa3"): # EBML (WebM / Matroska)
+        return "webm"
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"ID3") or len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "mp3"
+    return None
+
+
+class StreamingUpload:
+    """
+    Reads a multipart/form-data request body incrementally.
+
+    Bytes of the audio file part are size-checked and sniffed as they arrive
+    and handed to `chunks()` right away, so a consumer (streaming ASR) can
+    work while the client is still uploading. The other parts are small
+    form fields collected into `fields`.
+    """
+
+    def __init__(self, request, file_field="audio", max_bytes=None, max_field_bytes=None):
+        self.request = request
+        self.file_field = file_field
+        self.max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+        self.max_field_bytes = max_field_bytes or settings.UPLOAD_MAX_FIELD_BYTES
+
+        self.container: str | None = None
+        self.fields: dict[str, str] = {}
+        self.audio_bytes = 0
+        self._audio_parts: list[bytes] = []
+        self._field_bytes = 0
+        self._head = b""
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._sniffed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        # Per-part parser state
+        self._header_field = b""
+        self._header_value = b""
+        self._part_name: str | None = None
+        self._part_is_file = False
+        self._part_data: list[bytes] = []
+        self._seen_file = False
+
+    async def start(self):
+        """
+        Starts reading the body and returns once the audio container is known.
+
+        Raises:
+            UploadRejected: Wrong content type, too large, unsupported or
+                missing audio.
+        """
+        content_type, params = parse_options_header(self.request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadRejected(400, "Expected a multipart/form-data upload.")
+
+        # Refuse oversized uploads before reading a single byte
+        declared = self.request.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes + self.max_field_bytes + MULTIPART_OVERHEAD:
+            raise UploadRejected(413, self._too_large())
+
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._append_header("_header_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append_header("_header_value", data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        self._task = asyncio.create_task(self._pump(parser))
+
+        sniffed = asyncio.create_task(self._sniffed.wait())
+        try:
+            await asyncio.wait({self._task, sniffed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sniffed.cancel()
+        if self._task.done():
+            # Raises UploadRejected, or checks the upload was complete
+            self._task.result()
+        return self
+
+    async def _pump(self, parser):
+        try:
+            async for data in self.request.stream():
+                if data:
+                    # Raw multipart body, re-sent as is by the replayer
+                    session_archive.capture("client", "body", data)
+                    parser.write(data)
+            parser.finalize()
+            if not self._seen_file:
+                raise UploadRejected(400, f"Missing '{self.file_field}' file.")
+            if self.container is None:
+                # Shorter than the sniff window
+                self._sniff(final=True)
+        except UploadRejected:
+            raise
+        except Exception as e:
+            raise UploadRejected(400, f"Malformed upload: {e}") from e
+        finally:
+            self._queue.put_nowait(_END)
+
+    def _append_header(self, attr, data):
+        setattr(self, attr, getattr(self, attr) + data)
+
+    def _on_part_begin(self):
+        self._part_name = None
+        self._part_is_file = False
+        self._part_data = []
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._part_name = options.get(b"name", b"").decode("utf-8", "replace")
+            self._part_is_file = self._part_name == self.file_field
+            self._seen_file = self._seen_file or self._part_is_file
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_part_data(self, data, start, end):
+        chunk = data[start:end]
+        if not self._part_is_file:
+            self._field_bytes += len(chunk)
+            if self._field_bytes > self.max_field_bytes:
+                raise UploadRejected(413, "Form fields too large.")
+            self._part_data.append(chunk)
+            return
+
+        self.audio_bytes += len(chunk)
+        if self.audio_bytes > self.max_bytes:
+            raise UploadRejected(413, self._too_large())
+        self._audio_parts.append(chunk)
+
+        if self.container is None:
+            self._head += chunk
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        else:
+            self._queue.put_nowait(chunk)
+
+    def _on_part_end(self):
+        if not self._part_is_file and self._part_name:
+            self.fields[self._part_name] = b"".join(self._part_data).decode("utf-8", "replace")
+        self._part_data = []
+
+    def _sniff(self, final=False):
+        self.container = sniff_audio_container(self._head)
+        if self.container is None:
+            raise UploadRejected(400, "Invalid file format. Supported formats: .webm, .mp3, .wav, .ogg")
+        if self._head:
+            self._queue.put_nowait(self._head)
+        self._head = b""
+        self._sniffed.set()
+
+    def _too_large(self):
+        return f"File too large. Max {self.max_bytes // (1024 * 1024)}MB."
+
+    async def chunks(self):
+        """Audio bytes as they arrive; raises UploadRejected if the upload fails midway."""
+        while True:
+            chunk = await self._queue.get()
+            if chunk is _END:
+                break
+            yield chunk
+        await self.complete()
+
+    async def complete(self):
+        """Waits for the whole body. Returns the form fields."""
+        await self._task
+        return self.fields
+
+    def body(self):
+        """The complete audio file (after `complete()`)."""
+        return b"".join(self._audio_parts)
+
+    async def abort(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, UploadRejected):
+                pass
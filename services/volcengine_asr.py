@@ -6,22 +6,84 @@ import gzip
 import struct
 import asyncio
 from config import settings
+from services.concurrency import get_limiter, ProviderBusyError
+from services import session_archive
+from services.metering import usage_meter
+from log_context import sampled
 
 logger = logging.getLogger(__name__)
 
+VOLC_ASR_URL = "wss://openspeech.bytedance.com/api/v3/sauc/bigmodel"
+
+# Container -> (format, codec) in the full client request
+VOLC_AUDIO_FORMATS = {
+    "webm": ("webm", "opus"),
+    "ogg": ("ogg", "opus"),
+    "wav": ("wav", "raw"),
+    "mp3": ("mp3", "raw"),
+}
+# Enough for a WAV header whose fmt chunk follows a short LIST chunk
+WAV_HEADER_BYTES = 256
+
+
+def wav_format(head):
+    """
+    Reads the stream parameters from the start of a WAV file.
+
+    Returns:
+        tuple | None: (rate, bits, channels), None if `head` holds no fmt chunk.
+    """
+    offset = 12
+    while offset + 8 <= len(head):
+        chunk_id = head[offset:offset + 4]
+        size = struct.unpack("<I", head[offset + 4:offset + 8])[0]
+        if chunk_id == b"fmt ":
+            if size < 16 or offset + 24 > len(head):
+                return None
+            channels, rate = struct.unpack("<HI", head[offset + 10:offset + 16])
+            bits = struct.unpack("<H", head[offset + 22:offset + 24])[0]
+            return rate, bits, channels
+        # Chunks are padded to an even size
+        offset += 8 + size + size % 2
+    return None
+
+
+async def peek(audio_generator, size):
+    """
+    Reads at least `size` bytes (less if the audio is shorter) ahead.
+
+    Returns:
+        tuple: (head, generator yielding the head and then the rest).
+    """
+    head = b""
+    async for chunk in audio_generator:
+        head += chunk
+        if len(head) >= size:
+            break
+
+    async def replay():
+        yield head
+        async for chunk in audio_generator:
+            yield chunk
+
+    return head, replay()
+
+
 class VolcengineASRService:
     def __init__(self):
-        self.url = "wss://openspeech.bytedance.com/api/v3/sauc/bigmodel"
+        self.url = VOLC_ASR_URL
         self.app_id = settings.VOLC_APPID
         self.access_token = settings.VOLC_TOKEN
         # Resource ID for streaming ASR
         self.resource_id = "volc.bigasr.sauc.duration" # Using duration based billing resource id
 
-    async def transcribe_stream(self, audio_generator):
+    async def transcribe_stream(self, audio_generator, container="webm"):
         """
         Connects to Volcengine WebSocket and yields transcribed text.
         audio_generator: An async generator yielding audio bytes (chunks).
+        container: Audio container of the chunks, see VOLC_AUDIO_FORMATS.
         """
+        audio_format, codec = VOLC_AUDIO_FORMATS[container]
         headers = {
             "X-Api-App-Key": self.app_id,
             "X-Api-Access-Key": self.access_token,
@@ -29,8 +91,18 @@ class VolcengineASRService:
             "X-Api-Connect-Id": str(uuid.uuid4())
         }
 
+        upstream = session_archive.upstream("asr", container=container)
+        # Audio duration Volcengine has processed (and bills)
+        audio_ms = 0
+        rate, bits, channels = 16000, 16, 1
         try:
-            async with websockets.connect(self.url, additional_headers=headers) as ws:
+            if container == "wav":
+                # PCM is only understood with the file's own parameters
+                head, audio_generator = await peek(audio_generator, WAV_HEADER_BYTES)
+                rate, bits, channels = wav_format(head) or (rate, bits, channels)
+            # Hold a Volcengine slot for the lifetime of the socket
+            async with get_limiter("volcengine").acquire(), \
+                    websockets.connect(self.url, additional_headers=headers) as ws:
                 # 1. Send Full Client Request (Handshake)
                 req_id = str(uuid.uuid4())
                 payload = {
@@ -38,17 +110,19 @@ class VolcengineASRService:
                         "uid": "user_1" # In production, use actual user ID
                     },
                     "audio": {
-                        "format": "webm", # Frontend sends webm
-                        "rate": 16000,
-                        "bits": 16,
-                        "channel": 1,
+                        "format": audio_format, # Frontend sends webm
+                        "rate": rate,
+                        "bits": bits,
+                        "channel": channels,
                         "language": "zh-CN",
-                        "codec": "opus" # WebM usually contains Opus
+                        "codec": codec # WebM usually contains Opus
                     },
                     "request": {
                         "model_name": "bigmodel",
                         "enable_itn": True,
                         "enable_punc": True,
+                        # Utterances carry the "definite" flag used for endpointing
+                        "show_utterances": True,
                         "result_type": "full"
                     }
                 }
@@ -68,12 +142,14 @@ class VolcengineASRService:
                 # Header + Payload Size (4 bytes big-endian) + Payload
                 full_msg = header_byte + struct.pack('>I', payload_size) + compressed_data
                 await ws.send(full_msg)
+                usage_meter.add("asr_streams", 1)
 
                 # Start a task to receive responses
                 async def receive_loop():
+                    nonlocal audio_ms
                     full_text = ""
                     try:
-                        async for message in ws:
+                        async for message in upstream.tap(ws):
                             # Parse Message
                             # Header is 4 bytes
                             if len(message) < 8:
@@ -87,8 +163,13 @@ class VolcengineASRService:
                             msg_flags = header[1] & 0x0F
 
                             if msg_type == 0b1111: # Error
-                                logger.error("Volcengine Error Response")
-                                continue
+                                # Error code (4 bytes) | Message size (4 bytes) | Message
+                                code = struct.unpack('>I', message[4:8])[0]
+                                size = struct.unpack('>I', message[8:12])[0] if len(message) >= 12 else 0
+                                detail = message[12:12 + size].decode('utf-8', 'replace')
+                                logger.error(f"Volcengine Error Response {code}: {detail}")
+                                yield {"type": "error", "text": f"Speech recognition failed ({code})"}
+                                return
 
                             payload_size = struct.unpack('>I', message[4:8])[0]
                             payload = message[8:8+payload_size]
@@ -99,30 +180,42 @@ class VolcengineASRService:
                                 try:
                                     payload = gzip.decompress(payload)
                                 except Exception as e:
-                                    logger.error(f"Gzip Decompress Error: {e}")
+                                    if (suppressed := sampled("asr_gzip_error")) is not None:
+                                        logger.error(f"Gzip Decompress Error: {e} (+{suppressed} suppressed)")
                                     continue
 
                             try:
                                 resp_json = json.loads(payload.decode('utf-8'))
+                                audio_ms = max(audio_ms, (resp_json.get('audio_info') or {}).get('duration') or 0)
                                 if 'result' in resp_json:
                                     # For full result type, text is the full text so far?
                                     # Or we check 'result_type' in request.
                                     # Documentation says "full" returns full text.
                                     # "single" returns incremental.
                                     # We requested "full", so we just update current state.
-                                    current_text = resp_json['result'][0]['text']
+                                    result = resp_json['result']
+                                    if isinstance(result, list):
+                                        result = result[0]
+                                    current_text = result['text']
+                                    # The last utterance is definite once Volcengine heard it end
+                                    utterances = result.get('utterances') or []
+                                    definite = bool(utterances) and bool(utterances[-1].get('definite'))
                                     # We yield the DIFF or just the full text?
                                     # For ASR->LLM, we usually wait for "definite" sentence or end of speech.
                                     # But for now, let's just yield the final text at the end for simplicity in Phase 1,
                                     # OR yield partials if we want real-time display.
                                     # Let's yield partials with a flag.
-                                    yield {"type": "partial", "text": current_text}
+                                    yield {"type": "partial", "text": current_text, "definite": definite}
                                     full_text = current_text
                             except Exception as e:
-                                logger.error(f"JSON Parse Error: {e}")
+                                if (suppressed := sampled("asr_json_error")) is not None:
+                                    logger.error(f"JSON Parse Error: {e} (+{suppressed} suppressed)")
 
                     except Exception as e:
                         logger.error(f"Receive Loop Error: {e}")
+                        # The text so far may be missing the end of the utterance
+                        yield {"type": "error", "text": "Speech recognition failed"}
+                        return
                     yield {"type": "final", "text": full_text}
 
                 # Start sending audio in background
@@ -150,6 +243,8 @@ class VolcengineASRService:
                         header_end = b'\x11\x22\x01\x00'
                         empty_gz = gzip.compress(b'')
                         await ws.send(header_end + struct.pack('>I', len(empty_gz)) + empty_gz)
+                        # The replayer holds the final results until its last packet
+                        upstream.record("eos")
 
                     except Exception as e:
                         logger.error(f"Send Loop Error: {e}")
@@ -158,11 +253,19 @@ class VolcengineASRService:
                 send_task = asyncio.create_task(send_loop())
 
                 # Yield results from receive loop
-                async for result in receive_loop():
-                    yield result
-
-                await send_task
+                try:
+                    async for result in receive_loop():
+                        yield result
+                    await send_task
+                finally:
+                    # Stops reading the audio after an error
+                    send_task.cancel()
 
+        except ProviderBusyError as e:
+            logger.warning(f"Volcengine busy: {e}")
+            yield {"type": "error", "text": "Speech recognition is busy, please retry"}
         except Exception as e:
             logger.error(f"Volcengine WS connection failed: {e}")
             yield {"type": "error", "text": str(e)}
+        finally:
+            usage_meter.add("asr_ms", audio_ms)
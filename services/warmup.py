@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+from sqlalchemy import text
+from config import settings
+from services import llm_service, tts_service, asr_service
+from services.volcengine_asr import VOLC_ASR_URL
+from services.metrics import WARMUP_DURATION, WARMUP_OK
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Process readiness as reported by /readyz."""
+
+    def __init__(self):
+        self.warmed_up = False
+        # Set by the drainer: the load balancer should stop routing here
+        self.draining = False
+        self.results: dict[str, dict] = {}
+
+    @property
+    def ready(self):
+        return self.warmed_up and not self.draining
+
+    @property
+    def degraded(self):
+        return sorted(name for name, r in self.results.items() if not r["ok"])
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "degraded": self.degraded,
+            "dependencies": self.results
+        }
+
+
+readiness = Readiness()
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    scheme = "https" if parts.scheme in ("https", "wss") else "http"
+    return f"{scheme}://{parts.netloc}/"
+
+
+async def _timed(name, coro, timeout):
+    start = time.monotonic()
+    error = None
+    try:
+        await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        error = f"timed out after {timeout}s"
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    duration = time.monotonic() - start
+
+    readiness.results[name] = {"ok": error is None, "duration": round(duration, 4), "error": error}
+    WARMUP_DURATION.labels(name).set(duration)
+    WARMUP_OK.labels(name).set(0 if error else 1)
+    if error:
+        logger.warning(f"Warm-up {name} failed after {duration:.3f}s: {error}")
+    else:
+        logger.info(f"Warm-up {name} done in {duration:.3f}s")
+
+
+async def _ping_redis(clients):
+    await asyncio.gather(*(client.ping() for client in clients))
+
+
+async def _open_db_connections(engine, count):
+    # Hold `count` connections at once so the pool really opens that many
+    barrier = asyncio.Barrier(count)
+
+    async def one():
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                await barrier.wait()
+        except BaseException:
+            await barrier.abort()
+            raise
+
+    await asyncio.gather(*(one() for _ in range(count)))
+
+
+async def _resolve(host):
+    loop = asyncio.get_running_loop()
+    await loop.getaddrinfo(host, 443)
+
+
+async def _connect_pool(get_client, origins):
+    # Any HTTP answer (even 404) leaves a TLS connection in the client's pool
+    client = await get_client()
+    await asyncio.gather(*(client.head(origin) for origin in origins))
+
+
+async def warm_up(redis_clients, engine, timeout=None):
+    """
+    Warms up every upstream dependency concurrently, then marks the process ready.
+
+    Each dependency gets `timeout` seconds (WARMUP_TIMEOUT); failures are
+    recorded as degraded instead of holding readiness back forever.
+    """
+    timeout = timeout or settings.WARMUP_TIMEOUT
+    llm_origins = sorted({_origin(e.url) for e in settings.LLM_ENDPOINTS})
+    tts_origins = sorted({_origin(e.url) for e in settings.TTS_ENDPOINTS})
+    asr_origins = [_origin(asr_service.ASR_URL)]
+    hosts = sorted({urlsplit(o).hostname for o in llm_origins + tts_origins + asr_origins + [_origin(VOLC_ASR_URL)]})
+
+    # Single-connection pools (e.g. in-memory SQLite) cannot hold more than one
+    pool_size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    checks = {
+        "redis": _ping_redis(redis_clients),
+        "database": _open_db_connections(engine, max(1, min(settings.WARMUP_DB_CONNECTIONS, pool_size))),
+        "llm_pool": _connect_pool(llm_service.get_httpx_client, llm_origins),
+        "tts_pool": _connect_pool(tts_service.get_httpx_client, tts_origins),
+        "asr_pool": _connect_pool(asr_service.get_httpx_client, asr_origins),
+    }
+    for host in hosts:
+        checks[f"dns:{host}"] = _resolve(host)
+
+    start = time.monotonic()
+    await asyncio.gather(*(_timed(name, coro, timeout) for name, coro in checks.items()))
+    readiness.warmed_up = True
+    logger.info(f"Warm-up finished in {time.monotonic() - start:.3f}s, degraded: {readiness.degraded or 'none'}")
+    return readiness
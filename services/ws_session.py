@@ -0,0 +1,796 @@
+import asyncio
+import collections
+import json
+import logging
+import time
+from services.metrics import (
+    WS_BUFFERED_BYTES,
+    WS_HIBERNATED_SESSIONS,
+    WS_IDLE_SESSIONS,
+    WS_SESSION_BUFFERED_BYTES,
+    WS_AUDIO_OVERFLOWS,
+    WS_SLOW_CONSUMERS,
+    WS_SESSION_RESUMES,
+    WS_TOKEN_FRAMES_PER_TURN,
+    WS_TOKENS_PER_FRAME
+)
+from services import flight_recorder
+
+logger = logging.getLogger(__name__)
+
+# 1013 "Try Again Later", 1012 "Service Restart" (RFC 6455 registry)
+WS_CLOSE_OVERLOADED = 1013
+WS_CLOSE_SERVICE_RESTART = 1012
+# Application close codes (4000-4999 are reserved for private use)
+WS_CLOSE_SLOW_CONSUMER = 4009
+WS_CLOSE_AUDIO_OVERFLOW = 4010
+# Sent to a stale socket when its session was resumed on a new one
+WS_CLOSE_RESUMED = 4011
+WS_CLOSE_QUOTA_EXCEEDED = 4012
+WS_CLOSE_IDLE_TIMEOUT = 4013
+
+# Returned by AudioInbox.get() once the session is over
+CLOSED = object()
+
+OVERFLOW_POLICIES = ("block", "drop", "disconnect")
+
+
+class AudioOverflowError(Exception):
+    """Raised when inbound audio cannot be buffered under the configured policy."""
+
+
+class SessionClosedError(Exception):
+    """Raised when sending on a session whose writer has shut down."""
+
+
+class AudioInbox:
+    """
+    Bounded buffer between the socket reader and the ASR stage.
+
+    Items are audio chunks (bytes), None for "end of utterance", or CLOSED
+    once the session is over. Markers are never subject to the limits so a
+    full buffer can always be terminated.
+    """
+
+    def __init__(self, max_chunks, max_bytes, policy="block", overflow_timeout=5.0):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.max_chunks = max_chunks
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.overflow_timeout = overflow_timeout
+
+        self.buffered_bytes = 0
+        self.buffered_chunks = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._closed = False
+        # Audio received just after a server-side endpoint, see end_utterance()
+        self._tail: list[bytes] | None = None
+        self._tail_until = 0.0
+
+    def _has_room(self, size):
+        if self.buffered_chunks >= self.max_chunks:
+            return False
+        # A single oversized chunk is still accepted into an empty buffer
+        return self.buffered_chunks == 0 or self.buffered_bytes + size <= self.max_bytes
+
+    def _push(self, chunk):
+        self.buffered_bytes += len(chunk)
+        self.buffered_chunks += 1
+        WS_BUFFERED_BYTES.labels("inbound").inc(len(chunk))
+        WS_SESSION_BUFFERED_BYTES.labels("inbound").observe(self.buffered_bytes)
+        self._queue.put_nowait(chunk)
+
+    async def put(self, chunk):
+        """
+        Buffers an audio chunk.
+
+        Returns:
+            bool: False if the chunk was dropped.
+
+        Raises:
+            AudioOverflowError: under the "disconnect" policy, or when the
+                "block" policy waited longer than the overflow timeout.
+        """
+        if self._closed:
+            return False
+
+        if self._tail is not None:
+            if time.monotonic() < self._tail_until:
+                self._tail.append(chunk)
+                return True
+            # Nobody ended it: the client is still talking, it opens the next utterance
+            held, self._tail = self._tail, None
+            for item in held:
+                self._push(item)
+
+        if self._has_room(len(chunk)):
+            self._push(chunk)
+            return True
+
+        WS_AUDIO_OVERFLOWS.labels(self.policy).inc()
+        if self.policy == "drop":
+            # Dropping damages the container stream, ASR may lose a few words
+            return False
+        if self.policy == "disconnect":
+            raise AudioOverflowError("Audio buffer full")
+
+        try:
+            async with self._space:
+                await asyncio.wait_for(
+                    self._space.wait_for(lambda: self._closed or self._has_room(len(chunk))),
+                    timeout=self.overflow_timeout
+                )
+        except asyncio.TimeoutError:
+            raise AudioOverflowError(f"Audio buffer full for {self.overflow_timeout}s")
+
+        if self._closed:
+            return False
+        self._push(chunk)
+        return True
+
+    def end_utterance(self, tail=0.0):
+        """
+        Ends the utterance. A server-side endpoint passes `tail`: audio
+        received in the next `tail` seconds is held back, and dropped as the
+        rest of the utterance if the client ends it as well (finish_speaking).
+        Otherwise it is passed on ahead of the first chunk received later.
+        """
+        if self._closed:
+            return
+        if tail > 0:
+            self._tail, self._tail_until = [], time.monotonic() + tail
+            self._queue.put_nowait(None)
+        elif self._tail is not None:
+            # The client's own end of the utterance the server already ended
+            self._tail = None
+        else:
+            self._queue.put_nowait(None)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._tail = None
+            self._queue.put_nowait(CLOSED)
+
+    def empty(self):
+        return self._queue.empty()
+
+    async def get(self):
+        """Returns the next chunk, None at the end of an utterance, or CLOSED."""
+        if self._closed and self._queue.empty():
+            return CLOSED
+
+        item = await self._queue.get()
+        if isinstance(item, bytes):
+            self.buffered_bytes -= len(item)
+            self.buffered_chunks -= 1
+            WS_BUFFERED_BYTES.labels("inbound").dec(len(item))
+            async with self._space:
+                self._space.notify_all()
+        return item
+
+    def discard(self):
+        """Drops everything still buffered (used on session teardown)."""
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if isinstance(item, bytes):
+                WS_BUFFERED_BYTES.labels("inbound").dec(len(item))
+        self.buffered_bytes = 0
+        self.buffered_chunks = 0
+
+
+class OutboundWriter:
+    """
+    Per-session writer task that owns all socket sends.
+
+    Pipeline stages enqueue frames and continue producing; the writer drains
+    them to the client. When the client stops reading, the queue fills up and
+    producers wait; if that lasts longer than the slow consumer timeout the
+    session is closed instead of holding upstream streams open.
+
+    Frames are numbered from 1: JSON frames carry their number as "seq",
+    binary frames are numbered implicitly (clients count them). With
+    `replay_bytes` > 0 the writer is resumable: up to that many bytes of sent
+    frames are kept, a failed socket only detaches the writer while producers
+    carry on, and `attach()` continues on a new socket after the last frame
+    the client saw.
+    """
+
+    def __init__(self, websocket, max_bytes, slow_consumer_timeout=10.0, replay_bytes=0):
+        self.websocket = websocket
+        self.max_bytes = max_bytes
+        self.slow_consumer_timeout = slow_consumer_timeout
+        self.replay_bytes = replay_bytes
+
+        # Last frame numbered / handed to the socket
+        self.seq = 0
+        self.sent_seq = 0
+        # Bytes not sent yet / sent but kept for replay
+        self.buffered_bytes = 0
+        self.retained_bytes = 0
+        self.closed = False
+        # (seq, message, size, flight recorder fields), oldest first
+        self._frames: collections.deque = collections.deque()
+        self._changed = asyncio.Condition()
+        self._stopping = False
+        # Bumped whenever the socket changes, so a send on the old one is ignored
+        self._generation = 0
+        self._inflight: asyncio.Future | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def resumable(self):
+        return self.replay_bytes > 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def send_json(self, data, turn=None):
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        await self._wait_for_room(len(text))
+        seq = self.seq + 1
+        text = f'{text[:-1]}{"," if len(text) > 2 else ""}"seq":{seq}}}'
+        self._append({"type": "websocket.send", "text": text}, len(text), self._label(data.get("type"), turn))
+        await self._notify_all()
+
+    async def send_bytes(self, data, turn=None, frame="audio"):
+        await self._wait_for_room(len(data))
+        self._append({"type": "websocket.send", "bytes": data}, len(data), self._label(frame, turn))
+        await self._notify_all()
+
+    @staticmethod
+    def _label(frame, turn):
+        return {"frame": frame} if turn is None else {"frame": frame, "turn": turn}
+
+    async def drain(self):
+        """Waits until every frame queued so far has been handed to the socket."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.closed or self.buffered_bytes == 0)
+
+    async def _wait_for_room(self, size):
+        if self.closed:
+            raise SessionClosedError("Session writer is closed")
+
+        def fits():
+            return self.closed or self.buffered_bytes + size <= self.max_bytes
+
+        if self.buffered_bytes > 0 and not fits():
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait_for(fits), timeout=self.slow_consumer_timeout)
+            except asyncio.TimeoutError:
+                await self._slow_consumer()
+                # Still here: resumable and detached, wait for a new socket or the end
+                async with self._changed:
+                    await self._changed.wait_for(fits)
+            if self.closed:
+                raise SessionClosedError("Session writer is closed")
+
+    def _append(self, message, size, frame):
+        # No await since _wait_for_room(), so numbering follows queue order
+        self.seq += 1
+        self._frames.append((self.seq, message, size, frame))
+        self.buffered_bytes += size
+        WS_BUFFERED_BYTES.labels("outbound").inc(size)
+        WS_SESSION_BUFFERED_BYTES.labels("outbound").observe(self.buffered_bytes)
+
+    async def _notify_all(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _ready(self):
+        if self.closed:
+            return True
+        if self.websocket is None:
+            return self._stopping
+        return self.sent_seq < self.seq or self._stopping
+
+    async def _run(self):
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(self._ready)
+                if self.closed or self.websocket is None or self.sent_seq == self.seq:
+                    # Closed, or stopping with nothing left we can send
+                    break
+
+                websocket, generation = self.websocket, self._generation
+                seq, message, size, frame = self._frames[self.sent_seq + 1 - self._frames[0][0]]
+                send = asyncio.ensure_future(websocket.send(message))
+                self._inflight = send
+                try:
+                    await asyncio.wait({send}, timeout=self.slow_consumer_timeout)
+                finally:
+                    self._inflight = None
+                    if not send.done():
+                        send.cancel()
+
+                if generation != self._generation:
+                    # Detached or re-attached meanwhile; attach() decided where to resume
+                    continue
+                if not send.done() or send.cancelled():
+                    await self._slow_consumer()
+                    continue
+                if send.exception() is not None:
+                    if not self.resumable:
+                        raise send.exception()
+                    logger.info(f"Socket lost, holding frames for resume: {send.exception()}")
+                    await self.detach()
+                    continue
+
+                self.sent_seq = seq
+                self.buffered_bytes -= size
+                self.retained_bytes += size
+                WS_BUFFERED_BYTES.labels("outbound").dec(size)
+                WS_BUFFERED_BYTES.labels("replay").inc(size)
+                self._trim()
+                flight_recorder.record("frame_sent", **frame, bytes=size)
+                await self._notify_all()
+        except SessionClosedError:
+            pass
+        except Exception as e:
+            logger.info(f"Writer stopped: {e}")
+        finally:
+            await self._shutdown()
+
+    def _trim(self, keep=None):
+        keep = self.replay_bytes if keep is None else keep
+        while self._frames and self._frames[0][0] <= self.sent_seq and self.retained_bytes > keep:
+            size = self._frames.popleft()[2]
+            self.retained_bytes -= size
+            WS_BUFFERED_BYTES.labels("replay").dec(size)
+
+    def release_replay(self):
+        """Drops every sent frame; a client that saw them all can still resume."""
+        self._trim(keep=0)
+
+    async def detach(self):
+        """Drops the socket; frames keep queueing until attach() or close()."""
+        self.websocket = None
+        self._generation += 1
+        if self._inflight is not None:
+            self._inflight.cancel()
+        await self._notify_all()
+
+    def can_resume(self, last_seq):
+        """Whether every frame after `last_seq` is still buffered."""
+        first = self._frames[0][0] if self._frames else self.seq + 1
+        return not self.closed and first - 1 <= last_seq <= self.seq
+
+    async def attach(self, websocket, last_seq):
+        """
+        Continues on `websocket` with the frame after `last_seq`.
+
+        Returns:
+            bool: False if the writer is closed or frames after `last_seq`
+            are no longer buffered.
+        """
+        if not self.can_resume(last_seq):
+            return False
+
+        await self.detach()
+        # Frames the client missed go back to unsent, ones it got past sent_seq count as sent
+        moved = 0
+        for seq, _, size, _ in self._frames:
+            if last_seq < seq <= self.sent_seq:
+                moved += size
+            elif self.sent_seq < seq <= last_seq:
+                moved -= size
+        self.buffered_bytes += moved
+        self.retained_bytes -= moved
+        WS_BUFFERED_BYTES.labels("outbound").inc(moved)
+        WS_BUFFERED_BYTES.labels("replay").dec(moved)
+        self.sent_seq = last_seq
+        self._trim()
+
+        self.websocket = websocket
+        await self._notify_all()
+        return True
+
+    async def _slow_consumer(self):
+        if self.closed:
+            raise SessionClosedError("Session writer is closed")
+        websocket = self.websocket
+        if websocket is None:
+            # Already detached, nobody to disconnect
+            return
+        logger.warning(f"Slow consumer, closing {'socket' if self.resumable else 'session'} "
+                       f"({self.buffered_bytes} bytes pending)")
+        WS_SLOW_CONSUMERS.inc()
+        if self.resumable:
+            await self.detach()
+        else:
+            await self._shutdown()
+        try:
+            await websocket.close(code=WS_CLOSE_SLOW_CONSUMER, reason="Slow Consumer")
+        except Exception:
+            pass
+        if not self.resumable:
+            raise SessionClosedError("Client is not reading")
+
+    async def _shutdown(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Release everything still held so the gauges stay accurate
+        WS_BUFFERED_BYTES.labels("outbound").dec(self.buffered_bytes)
+        WS_BUFFERED_BYTES.labels("replay").dec(self.retained_bytes)
+        self.buffered_bytes = 0
+        self.retained_bytes = 0
+        self._frames.clear()
+        await self._notify_all()
+
+    async def close(self, timeout=5.0):
+        """Flushes pending frames (up to `timeout`) and stops the writer."""
+        if self._task is None:
+            await self._shutdown()
+            return
+        self._stopping = True
+        await self._notify_all()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except Exception:
+            self._task.cancel()
+            await self._shutdown()
+
+
+class ResumableSession:
+    """
+    Session state that outlives a single socket: the writer, the audio inbox
+    and the pipeline task.
+
+    Each socket that attaches gets a connection number; only the current one
+    may detach the session, so a stale handler of a half-open socket cannot
+    interfere with a client that already reconnected.
+
+    An idle session can hibernate: its pipeline task is stopped and the
+    frames kept for replay are dropped until the client's next message
+    wakes it, which starts a new pipeline from `pipeline_factory`.
+    """
+
+    def __init__(self, registry, session_id, user, writer, inbox, grace):
+        self.registry = registry
+        self.session_id = session_id
+        self.user = user
+        self.writer = writer
+        self.inbox = inbox
+        self.grace = grace
+
+        self.pipeline: asyncio.Task | None = None
+        # Creates the pipeline coroutine, again after each hibernation
+        self.pipeline_factory = None
+        # Turns started, and the sequencer of the running pipeline
+        self.turns = 0
+        self.sequencer: "TurnSequencer | None" = None
+        self.last_activity = time.monotonic()
+        self.hibernated = False
+        # Resolved by the first client message while hibernated
+        self.wakeup: asyncio.Future | None = None
+        self.recorder = None
+        self.archive = None
+        self.connection = 0
+        self.received_bytes = 0
+        self.closed = False
+        # Last frame before the socket is closed with 1012, set by drain()
+        self.farewell: dict | None = None
+        self._expiry: asyncio.TimerHandle | None = None
+        self._closing: asyncio.Task | None = None
+
+    @property
+    def resumable(self):
+        return self.grace > 0 and self.writer.resumable
+
+    def connect(self):
+        """Makes a newly attached socket the current one; returns its connection number."""
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        self.connection += 1
+        self.last_activity = time.monotonic()
+        return self.connection
+
+    def is_current(self, connection):
+        return not self.closed and connection == self.connection
+
+    def start_pipeline(self, factory):
+        self.pipeline_factory = factory
+        self.pipeline = asyncio.create_task(factory())
+
+    def touch(self):
+        """The client sent something: the idle time starts over, a hibernated session wakes up."""
+        self.last_activity = time.monotonic()
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+
+    @property
+    def idle(self):
+        """No turn in progress and nothing buffered in either direction."""
+        if not self.inbox.empty() or self.writer.buffered_bytes:
+            return False
+        return self.sequencer is None or self.sequencer.current > self.turns
+
+    async def hibernate(self):
+        """
+        Stops the pipeline of an idle session and releases what it holds.
+
+        Returns:
+            bool: False if the session is not idle (or already hibernated).
+        """
+        if self.hibernated or self.closed or not self.idle:
+            return False
+        self.hibernated = True
+        # Created first: a message arriving while the pipeline stops wakes it right away
+        self.wakeup = asyncio.get_running_loop().create_future()
+        pipeline, self.pipeline = self.pipeline, None
+        if pipeline is not None:
+            pipeline.cancel()
+            await asyncio.gather(pipeline, return_exceptions=True)
+        self.sequencer = None
+        self.writer.release_replay()
+        if self.recorder is not None:
+            # Every turn has finished, its timeline was judged already
+            self.recorder.events.clear()
+        WS_IDLE_SESSIONS.labels("hibernated").inc()
+        WS_HIBERNATED_SESSIONS.inc()
+        return True
+
+    def wake(self):
+        """Starts the pipeline of a hibernated session again."""
+        if not self.hibernated:
+            return
+        self.hibernated = False
+        self.wakeup = None
+        WS_IDLE_SESSIONS.labels("woken").inc()
+        WS_HIBERNATED_SESSIONS.dec()
+        if not self.closed:
+            self.pipeline = asyncio.create_task(self.pipeline_factory())
+
+    async def disconnect(self, connection):
+        """The socket of `connection` is gone: keep running for the grace period."""
+        if not self.is_current(connection):
+            return
+        await self.writer.detach()
+        self._expiry = asyncio.get_running_loop().call_later(self.grace, self._expire)
+
+    def _expire(self):
+        logger.info(f"Session {self.session_id} not resumed within {self.grace}s, closing")
+        WS_SESSION_RESUMES.labels("expired").inc()
+        self._closing = asyncio.create_task(self.close())
+
+    def drain(self, reconnect_after):
+        """
+        Takes no new turns: audio already received is still transcribed and
+        answered, then the pipeline ends. Whoever closes the session tells the
+        client to reconnect after `reconnect_after` seconds.
+        """
+        self.farewell = {"type": "reconnect", "after": reconnect_after}
+        self.inbox.close()
+
+    async def close(self):
+        """Stops the pipeline and the writer; the session can no longer be resumed."""
+        if self.closed:
+            return
+        self.closed = True
+        self.registry.remove(self)
+        if self._expiry is not None:
+            self._expiry.cancel()
+        if self.hibernated:
+            self.hibernated = False
+            WS_HIBERNATED_SESSIONS.dec()
+        self.inbox.close()
+        if self.pipeline is not None and not self.pipeline.done():
+            self.pipeline.cancel()
+        if self.pipeline is not None:
+            await asyncio.gather(self.pipeline, return_exceptions=True)
+        self.inbox.discard()
+        websocket = self.writer.websocket
+        if self.farewell is not None:
+            try:
+                await self.writer.send_json(self.farewell)
+            except SessionClosedError:
+                pass
+        await self.writer.close()
+        if self.farewell is not None and websocket is not None:
+            try:
+                await websocket.close(code=WS_CLOSE_SERVICE_RESTART, reason="Service Restart")
+            except Exception:
+                pass
+        if self.archive is not None:
+            await self.archive.save()
+
+
+class SessionRegistry:
+    """Open websocket sessions by id, for clients reconnecting after a drop."""
+
+    def __init__(self):
+        self._sessions: dict[str, ResumableSession] = {}
+
+    def open(self, session_id, user, writer, inbox, grace):
+        session = ResumableSession(self, session_id, user, writer, inbox, grace)
+        self._sessions[session_id] = session
+        return session
+
+    def get(self, session_id, user):
+        """Returns the session if it is still open and belongs to `user`."""
+        session = self._sessions.get(session_id)
+        if session is None or session.closed or session.user != user:
+            return None
+        return session
+
+    def all(self):
+        return list(self._sessions.values())
+
+    def remove(self, session):
+        if self._sessions.get(session.session_id) is session:
+            del self._sessions[session.session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionRegistry()
+
+
+class TurnSequencer:
+    """
+    Keeps outbound frames in turn order while the pipeline stages of
+    different turns run concurrently.
+
+    Frames of the turn being delivered go straight to the writer. Frames of
+    later turns are held (up to `max_held_bytes`, then their producers wait)
+    until every earlier turn has ended, so a client still sees each turn's
+    frames as one contiguous block ending with its turn_end.
+    """
+
+    def __init__(self, writer, max_held_bytes, first_turn=1):
+        self.writer = writer
+        self.max_held_bytes = max_held_bytes
+        self.current = first_turn
+
+        self.held_bytes = 0
+        self._held: dict[int, collections.deque] = {}
+        self._ended: set[int] = set()
+        self._changed = asyncio.Condition()
+        # Turns are released one end() at a time so held frames cannot interleave
+        self._releasing = asyncio.Lock()
+
+    def lane(self, turn_id):
+        return TurnLane(self, turn_id)
+
+    async def send(self, turn_id, data, frame=None):
+        if turn_id == self.current and turn_id not in self._held:
+            await self._deliver(turn_id, data, frame)
+            return
+
+        size = len(data) if isinstance(data, bytes) else len(json.dumps(data, ensure_ascii=False))
+        if turn_id != self.current and self.held_bytes > 0:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: turn_id == self.current or self.held_bytes + size <= self.max_held_bytes
+                )
+            if turn_id == self.current and turn_id not in self._held:
+                await self._deliver(turn_id, data, frame)
+                return
+
+        self._held.setdefault(turn_id, collections.deque()).append((data, size, frame))
+        self.held_bytes += size
+
+    async def _deliver(self, turn_id, data, frame=None):
+        if isinstance(data, bytes):
+            await self.writer.send_bytes(data, turn=turn_id, frame=frame or "audio")
+        else:
+            await self.writer.send_json(data, turn=turn_id)
+
+    async def end(self, turn_id):
+        """Marks `turn_id` complete and releases the turns held behind it."""
+        self._ended.add(turn_id)
+        async with self._releasing:
+            while self.current in self._ended:
+                self._ended.discard(self.current)
+                self.current += 1
+                held = self._held.get(self.current)
+                # Popped only once delivered: frames sent meanwhile queue up behind
+                while held:
+                    data, size, frame = held[0]
+                    await self._deliver(self.current, data, frame)
+                    held.popleft()
+                    self.held_bytes -= size
+                self._held.pop(self.current, None)
+                async with self._changed:
+                    self._changed.notify_all()
+
+
+class TurnLane:
+    """One turn's view of a TurnSequencer, with the writer's send API."""
+
+    def __init__(self, sequencer, turn_id):
+        self.sequencer = sequencer
+        self.turn_id = turn_id
+
+    async def send_json(self, data):
+        await self.sequencer.send(self.turn_id, data)
+
+    async def send_bytes(self, data, frame="audio"):
+        await self.sequencer.send(self.turn_id, data, frame)
+
+    @property
+    def is_current(self):
+        """Whether this turn's frames go straight to the client (no earlier turn still open)."""
+        return self.sequencer.current == self.turn_id
+
+    async def end(self):
+        await self.sequencer.end(self.turn_id)
+
+
+class TokenBatcher:
+    """
+    Coalesces LLM tokens into fewer llm_token frames.
+
+    Text is flushed `flush_ms` after the first token of a batch or as soon as
+    `flush_chars` characters are pending, whichever comes first. With
+    `flush_ms=0` every token is sent on its own, as before.
+    """
+
+    def __init__(self, writer, flush_ms, flush_chars):
+        self.writer = writer
+        self.flush_ms = max(0, flush_ms)
+        self.flush_chars = max(1, flush_chars)
+
+        self.frames = 0
+        self._pending: list[str] = []
+        self._pending_chars = 0
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_flush: asyncio.Task | None = None
+
+    async def add(self, token):
+        if not token:
+            return
+        self._pending.append(token)
+        self._pending_chars += len(token)
+
+        if self.flush_ms == 0 or self._pending_chars >= self.flush_chars:
+            await self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_ms / 1000, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_flush = asyncio.create_task(self._flush_on_timer())
+
+    async def _flush_on_timer(self):
+        try:
+            await self.flush()
+        except SessionClosedError:
+            # The pipeline sees the closed session on its next send
+            pass
+
+    async def flush(self):
+        # The lock keeps frames in token order between timer and size flushes
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            text = "".join(self._pending)
+            WS_TOKENS_PER_FRAME.observe(len(self._pending))
+            self._pending.clear()
+            self._pending_chars = 0
+            self.frames += 1
+            await self.writer.send_json({"type": "llm_token", "text": text})
+
+    async def close(self):
+        """Sends whatever is pending and reports the turn's frame count."""
+        try:
+            await self.flush()
+        finally:
+            if self._timer_flush is not None and not self._timer_flush.done():
+                self._timer_flush.cancel()
+            self._pending.clear()
+            WS_TOKEN_FRAMES_PER_TURN.observe(self.frames)
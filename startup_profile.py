@@ -0,0 +1,98 @@
+"""
+Where the time to start the server goes.
+
+Imports `main` in a fresh interpreter with `-X importtime` and prints the
+import time by package and the slowest modules, then times a second fresh
+interpreter through the import and the startup hooks (boot).
+
+    python main.py --profile-startup
+    python startup_profile.py --top 40
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Runs in the fresh interpreter; the warm-up keeps going in the background
+# after startup (as it does in the server), so it is not part of the boot
+BOOT_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+
+async def boot():
+    async with {module}.app.router.lifespan_context({module}.app):
+        return time.perf_counter()
+
+booted = asyncio.run(boot())
+print(json.dumps({{"import": imported - start, "boot": booted - start}}))
+"""
+
+
+def import_times(module="main", env=None):
+    """(self seconds, cumulative seconds, depth, module name) for every module `import module` loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=ROOT, env=env, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us) / 1e6, int(cumulative_us) / 1e6, len(indent) // 2, name))
+    return rows
+
+
+def by_package(rows):
+    """Import time (self, so nothing is counted twice) by top-level package, slowest first."""
+    totals = defaultdict(float)
+    for self_s, _, _, name in rows:
+        totals[name.split(".")[0]] += self_s
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure_boot(module="main", env=None):
+    """Seconds a fresh interpreter takes to import `module` ("import") and to finish its startup hooks ("boot")."""
+    result = subprocess.run(
+        [sys.executable, "-c", BOOT_SCRIPT.format(module=module)],
+        capture_output=True, text=True, cwd=ROOT, env=env, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def print_report(rows, boot, top=25):
+    total = rows[-1][1] if rows else 0.0
+    print(f"import {rows[-1][3] if rows else '?'}: {total:.3f}s (-X importtime)")
+    print(f"fresh interpreter: import {boot['import']:.3f}s, import + startup hooks {boot['boot']:.3f}s\n")
+
+    print(f"{'package':<40} {'self':>8} {'share':>6}")
+    for package, seconds in by_package(rows)[:top]:
+        print(f"{package:<40} {seconds:>7.3f}s {seconds / total if total else 0:>6.1%}")
+
+    print(f"\n{'slowest modules (cumulative)':<60} {'cumul.':>8} {'self':>8}")
+    # Top-level imports of the profiled module only, deeper ones are part of them
+    direct = [row for row in rows if row[2] == 1]
+    for self_s, cumulative_s, _, name in sorted(direct, key=lambda row: row[1], reverse=True)[:top]:
+        print(f"{name:<60} {cumulative_s:>7.3f}s {self_s:>7.3f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profiles the server's import and boot time")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="rows per table")
+    args = parser.parse_args(argv)
+
+    print_report(import_times(args.module), measure_boot(args.module), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,16 @@ document.addEventListener('DOMContentLoaded', () => {
     let audioQueue = [];
     let isPlaying = false;
     let currentAiMessageDiv = null;
+    let playbackCtx = null;
+    // Output format announced by the server in the "session" message
+    let sessionAudio = { format: 'mp3', sample_rate: 32000, channel: 1 };
+    // Resumption: JSON frames carry "seq", binary frames count implicitly
+    let sessionId = null;
+    let lastSeq = 0;
+    // Seconds to wait before reconnecting, from a draining server's "reconnect" frame
+    let reconnectAfter = null;
+    // Optional ?audio_format=pcm|mp3_low|... on the page URL is forwarded to the server
+    const requestedAudioFormat = new URLSearchParams(window.location.search).get('audio_format');
 
     // Check Auth
     if (jwtToken) {
@@ -87,7 +97,15 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function initWebSocket() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/chat?token=${jwtToken}`;
+        // The server ends a turn when the user stops talking, before the button is released
+        let wsUrl = `${protocol}//${window.location.host}/ws/chat?token=${jwtToken}&endpointing=true`;
+        if (requestedAudioFormat) {
+            wsUrl += `&audio_format=${encodeURIComponent(requestedAudioFormat)}`;
+        }
+        if (sessionId) {
+            // Continue where the dropped connection stopped
+            wsUrl += `&session_id=${sessionId}&last_seq=${lastSeq}`;
+        }
 
         ws = new WebSocket(wsUrl);
 
@@ -99,12 +117,18 @@ document.addEventListener('DOMContentLoaded', () => {
         ws.onclose = () => {
             console.log("WebSocket Disconnected");
             statusDiv.textContent = "连接断开，尝试重连...";
-            setTimeout(initWebSocket, 3000);
+            let delay = sessionId ? 500 : 3000;
+            if (reconnectAfter !== null) {
+                delay = reconnectAfter * 1000;
+                reconnectAfter = null;
+            }
+            setTimeout(initWebSocket, delay);
         };
 
         ws.onmessage = async (event) => {
             // Handle binary audio (TTS)
             if (event.data instanceof Blob) {
+                lastSeq += 1;
                 const arrayBuffer = await event.data.arrayBuffer();
                 audioQueue.push(arrayBuffer);
                 if (!isPlaying) {
@@ -116,6 +140,7 @@ document.addEventListener('DOMContentLoaded', () => {
             // Handle text/json
             try {
                 const data = JSON.parse(event.data);
+                if (data.seq) lastSeq = data.seq;
                 handleWsMessage(data);
             } catch (e) {
                 console.error("WS Parse Error", e);
@@ -124,7 +149,21 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function handleWsMessage(data) {
-        if (data.type === 'asr_partial') {
+        if (data.type === 'session') {
+            // A new session (also when resuming was no longer possible)
+            sessionId = data.session_id;
+            lastSeq = data.seq;
+            sessionAudio = data.audio;
+        } else if (data.type === 'reconnect') {
+            // The server is restarting: its session ends here, start a new one elsewhere
+            sessionId = null;
+            reconnectAfter = data.after;
+        } else if (data.type === 'resumed') {
+            console.log(`Session resumed after frame ${data.last_seq}`);
+        } else if (data.type === 'endpoint') {
+            // End of speech detected by the server; stopping sends finish_speaking
+            stopRecording();
+        } else if (data.type === 'asr_partial') {
             statusDiv.textContent = `听: ${data.text}`;
         } else if (data.type === 'asr_final') {
             addMessage(data.text, 'user');
@@ -155,21 +194,31 @@ document.addEventListener('DOMContentLoaded', () => {
         isPlaying = true;
         const chunk = audioQueue.shift();
 
-        // Use AudioContext to play raw PCM/MP3 chunks seamlessly?
-        // Simple HTML5 Audio with Blob URL for now (might have gaps)
-        // Better: SourceBuffer with MediaSource Extensions (MSE) for streaming.
-        // Or decodeAudioData with AudioContext (best for seamless chunks).
+        if (!playbackCtx) playbackCtx = new (window.AudioContext || window.webkitAudioContext)();
 
-        const audioCtx = new (window.AudioContext || window.webkitAudioContext)();
-        audioCtx.decodeAudioData(chunk, (buffer) => {
-            const source = audioCtx.createBufferSource();
+        const playBuffer = (buffer) => {
+            const source = playbackCtx.createBufferSource();
             source.buffer = buffer;
-            source.connect(audioCtx.destination);
+            source.connect(playbackCtx.destination);
             source.onended = () => {
                 playNextAudioChunk();
             };
             source.start(0);
-        }, (e) => {
+        };
+
+        if (sessionAudio.format === 'pcm') {
+            // Raw 16 bit little-endian samples: no decode step needed
+            const samples = new Int16Array(chunk, 0, Math.floor(chunk.byteLength / 2));
+            const buffer = playbackCtx.createBuffer(1, samples.length, sessionAudio.sample_rate);
+            const channel = buffer.getChannelData(0);
+            for (let i = 0; i < samples.length; i++) {
+                channel[i] = samples[i] / 32768;
+            }
+            playBuffer(buffer);
+            return;
+        }
+
+        playbackCtx.decodeAudioData(chunk, playBuffer, (e) => {
             console.error("Audio Decode Error", e);
             playNextAudioChunk();
         });
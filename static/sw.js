@@ -1,21 +1,35 @@
-const CACHE_NAME = 'voice-assistant-v1';
-const urlsToCache = [
-  '/',
-  '/static/style.css',
-  '/static/script.js',
-  '/static/manifest.json'
-];
+// Template: CACHE_VERSION and PRECACHE_URLS are prepended by static_assets.py
+// when it serves this file as /sw.js.
+const CACHE_PREFIX = 'voice-assistant-';
+const CACHE_NAME = CACHE_PREFIX + CACHE_VERSION;
 
 self.addEventListener('install', event => {
   event.waitUntil(
     caches.open(CACHE_NAME)
       .then(cache => {
-        return cache.addAll(urlsToCache);
+        return cache.addAll(PRECACHE_URLS);
       })
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  // Drop caches of previous asset versions
+  event.waitUntil(
+    caches.keys()
+      .then(names => Promise.all(
+        names
+          .filter(name => name.startsWith(CACHE_PREFIX) && name !== CACHE_NAME)
+          .map(name => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
   );
 });
 
 self.addEventListener('fetch', event => {
+  if (event.request.method !== 'GET') {
+    return;
+  }
   event.respondWith(
     caches.match(event.request)
       .then(response => {
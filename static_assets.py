@@ -0,0 +1,249 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+from config import settings
+
+try:
+    import brotli
+except ImportError: # Optional, gzip variants are always built
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_PREFIX = "/static/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = (".js", ".css", ".json", ".html", ".svg", ".txt", ".map")
+# Built into /sw.js from the manifest instead of being served as an asset
+SERVICE_WORKER_TEMPLATE = "sw.js"
+
+
+class AssetManifest:
+    """Maps logical asset names (style.css) to fingerprinted ones (style.3f2a9c1b04de.css)."""
+
+    def __init__(self):
+        self.files: dict[str, str] = {}
+        self.version = "dev"
+        self.service_worker = ""
+        self._hashed: set[str] = set()
+
+    def update(self, files, version, service_worker):
+        self.files = files
+        self.version = version
+        self.service_worker = service_worker
+        self._hashed = set(files.values())
+
+    def url(self, name):
+        return STATIC_PREFIX + self.files.get(name, name)
+
+    def is_fingerprinted(self, filename):
+        return filename in self._hashed
+
+
+asset_manifest = AssetManifest()
+
+
+def static_url(name):
+    """Jinja helper: URL of the current fingerprinted build of `name`."""
+    return asset_manifest.url(name)
+
+
+def _fingerprint(name, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_variants(out_dir, filename, content):
+    with open(os.path.join(out_dir, filename), "wb") as f:
+        f.write(content)
+    if not filename.endswith(COMPRESSIBLE):
+        return
+    with open(os.path.join(out_dir, filename + ".gz"), "wb") as f:
+        # mtime=0 keeps the output byte-identical across builds
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(os.path.join(out_dir, filename + ".br"), "wb") as f:
+            f.write(brotli.compress(content, quality=11))
+
+
+def _list_sources(src_dir):
+    names = sorted(
+        n for n in os.listdir(src_dir)
+        if os.path.isfile(os.path.join(src_dir, n)) and n != SERVICE_WORKER_TEMPLATE
+    )
+    # Binary assets first so text assets can reference their hashed names
+    names.sort(key=lambda n: n.endswith(COMPRESSIBLE))
+    return names
+
+
+def _source_hash(src_dir, template_path):
+    digest = hashlib.sha256()
+    paths = [os.path.join(src_dir, n) for n in sorted(os.listdir(src_dir))]
+    for path in paths + [template_path]:
+        if os.path.isfile(path):
+            digest.update(path.encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_static_assets(src_dir=None, out_dir=None, template_path="templates/index.html"):
+    """
+    Builds the served static tree.
+
+    Every asset is copied under its original name and a content-hashed name,
+    with gzip (and brotli, if installed) variants for text assets. References
+    to other assets inside text files are rewritten to hashed URLs. The
+    service worker is generated from the same manifest so its cache list and
+    version always match what the page references.
+
+    Returns:
+        AssetManifest: The populated module-level manifest.
+    """
+    src_dir = src_dir or settings.STATIC_SOURCE_DIR
+    out_dir = out_dir or settings.STATIC_BUILD_DIR
+
+    tmp_dir = f"{out_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    files = {}
+    for name in _list_sources(src_dir):
+        with open(os.path.join(src_dir, name), "rb") as f:
+            content = f.read()
+        if name.endswith(COMPRESSIBLE):
+            text = content.decode("utf-8")
+            for original, hashed in files.items():
+                text = text.replace(STATIC_PREFIX + original, STATIC_PREFIX + hashed)
+            content = text.encode("utf-8")
+
+        hashed = _fingerprint(name, content)
+        files[name] = hashed
+        _write_variants(tmp_dir, name, content)
+        _write_variants(tmp_dir, hashed, content)
+
+    # The page itself is precached, so template changes must bump the version too
+    version_source = json.dumps(files, sort_keys=True).encode()
+    if os.path.exists(template_path):
+        with open(template_path, "rb") as f:
+            version_source += f.read()
+    version = hashlib.sha256(version_source).hexdigest()[:12]
+
+    with open(os.path.join(tmp_dir, "asset-manifest.json"), "w") as f:
+        json.dump({
+            "version": version,
+            "source_hash": _source_hash(src_dir, template_path),
+            "files": files
+        }, f, indent=2, sort_keys=True)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(out_dir)), exist_ok=True)
+    os.rename(tmp_dir, out_dir)
+
+    asset_manifest.update(files, version, _render_service_worker(src_dir, version, files))
+    logger.info(f"Built {len(files)} static assets, version {version}")
+    return asset_manifest
+
+
+def load_static_assets(src_dir=None, out_dir=None, template_path="templates/index.html"):
+    """
+    Loads the manifest of an existing build (e.g. from the Docker image),
+    rebuilding only when the sources changed since.
+    """
+    src_dir = src_dir or settings.STATIC_SOURCE_DIR
+    out_dir = out_dir or settings.STATIC_BUILD_DIR
+
+    try:
+        with open(os.path.join(out_dir, "asset-manifest.json")) as f:
+            built = json.load(f)
+    except (OSError, ValueError):
+        built = None
+
+    if not built or built.get("source_hash") != _source_hash(src_dir, template_path):
+        return build_static_assets(src_dir, out_dir, template_path)
+
+    asset_manifest.update(
+        built["files"],
+        built["version"],
+        _render_service_worker(src_dir, built["version"], built["files"])
+    )
+    return asset_manifest
+
+
+def _render_service_worker(src_dir, version, files):
+    with open(os.path.join(src_dir, SERVICE_WORKER_TEMPLATE), encoding="utf-8") as f:
+        template = f.read()
+    urls = ["/"] + [STATIC_PREFIX + hashed for _, hashed in sorted(files.items())]
+    header = (
+        "// Generated by static_assets.py from the asset manifest, do not edit.\n"
+        f"const CACHE_VERSION = {json.dumps(version)};\n"
+        f"const PRECACHE_URLS = {json.dumps(urls, indent=2)};\n\n"
+    )
+    return header + template
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Serves the built asset tree, preferring precompressed variants.
+
+    Fingerprinted files get a year-long immutable Cache-Control; files under
+    their original names must be revalidated.
+    """
+
+    def __init__(self, *args, manifest=asset_manifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        accepted = {
+            token.split(";")[0].strip()
+            for token in request_headers.get("accept-encoding", "").split(",")
+        }
+
+        filename = os.path.basename(full_path)
+        headers = {
+            "Vary": "Accept-Encoding",
+            "Cache-Control": IMMUTABLE if self.manifest.is_fingerprinted(filename) else "no-cache"
+        }
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        response = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            variant = str(full_path) + suffix
+            try:
+                variant_stat = os.stat(variant)
+            except OSError:
+                continue
+            response = FileResponse(
+                variant,
+                status_code=status_code,
+                stat_result=variant_stat,
+                media_type=media_type,
+                headers={**headers, "Content-Encoding": encoding}
+            )
+            break
+
+        if response is None:
+            response = FileResponse(
+                full_path, status_code=status_code, stat_result=stat_result, media_type=media_type, headers=headers
+            )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    # Build-time entry point (see Dockerfile)
+    manifest = build_static_assets()
+    print(json.dumps({"version": manifest.version, "files": manifest.files}, indent=2))
@@ -0,0 +1,17 @@
+from services.audio_format import negotiate_audio_format, PRESETS, DEFAULT_AUDIO_FORMAT
+
+def test_negotiation_prefers_first_supported_format():
+    # Opus is not offered by the configured TTS provider, so it is skipped
+    assert negotiate_audio_format("opus,mp3_low") == PRESETS["mp3_low"]
+    assert negotiate_audio_format("pcm") == PRESETS["pcm"]
+    assert negotiate_audio_format("nonsense") == DEFAULT_AUDIO_FORMAT
+    assert negotiate_audio_format(None) == DEFAULT_AUDIO_FORMAT
+
+def test_sample_rate_override_and_cache_key():
+    fmt = negotiate_audio_format("pcm", sample_rate=24000)
+    assert fmt.sample_rate == 24000
+    assert fmt.pcm_duration(48000) == 1.0
+    # Unsupported rates are ignored
+    assert negotiate_audio_format("pcm", sample_rate=12345).sample_rate == 16000
+    assert PRESETS["mp3"].key != PRESETS["mp3_low"].key
+    assert PRESETS["mp3"].audio_setting() == {"sample_rate": 32000, "format": "mp3", "channel": 1, "bitrate": 128000}
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import pytest
+from httpx import AsyncClient
+from auth import create_access_token
+from services import batch_transcribe
+from services.batch_transcribe import BatchItem, transcribe_batch
+from transcribe_cli import collect_paths
+
+def wav(tag):
+    return b"RIFF\x24\x00\x00\x00WAVE" + tag.encode()
+
+def item(index, content):
+    async def read():
+        return content
+    return BatchItem(index, f"note{index}.wav", read)
+
+@pytest.fixture
+def fake_asr(monkeypatch):
+    state = {"calls": [], "active": 0, "peak": 0, "fail_once": set()}
+
+    async def transcribe(audio, container="webm"):
+        tag = audio[12:].decode()
+        state["calls"].append(tag)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(0.1 if tag == "slow" else 0.01)
+        finally:
+            state["active"] -= 1
+        if tag in state["fail_once"]:
+            state["fail_once"].discard(tag)
+            return None
+        return f"text:{tag}"
+
+    monkeypatch.setattr(batch_transcribe, "transcribe_audio", transcribe)
+    return state
+
+@pytest.mark.asyncio
+async def test_batch_completion_order_dedup_and_retries(fake_asr):
+    fake_asr["fail_once"].add("flaky")
+    items = [
+        item(0, wav("slow")),
+        item(1, wav("a")),
+        item(2, wav("a")),
+        item(3, wav("flaky")),
+        item(4, b"not audio at all"),
+    ]
+
+    results = [r async for r in transcribe_batch(items, concurrency=2, backoff=0)]
+
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3, 4]
+    # Completion order, not request order
+    assert results[-1]["index"] == 0
+    by_index = {r["index"]: r for r in results}
+
+    # Identical content is transcribed once
+    assert fake_asr["calls"].count("a") == 1
+    assert by_index[2]["text"] == "text:a"
+    assert by_index[2]["duplicate_of"] == 1
+    assert by_index[2]["sha256"] == by_index[1]["sha256"]
+
+    assert by_index[3] == {**by_index[3], "text": "text:flaky", "attempts": 2}
+    assert by_index[4]["error"] == "Unsupported audio format"
+    assert fake_asr["peak"] <= 2
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_streams_ndjson(client: AsyncClient, fake_asr):
+    files = [("files", (f"n{i}.wav", wav(tag), "audio/wav")) for i, tag in enumerate(["x", "y", "x"])]
+    assert (await client.post("/api/transcribe_batch", files=files)).status_code == 401
+
+    token = create_access_token({"sub": "alice"})
+    response = await client.post("/api/transcribe_batch", files=files, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    assert {r["name"] for r in results} == {"n0.wav", "n1.wav", "n2.wav"}
+    assert sorted(fake_asr["calls"]) == ["x", "y"]
+
+def test_cli_collects_manifest_and_directories(tmp_path):
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "b.wav").write_bytes(b"")
+    (tmp_path / "notes" / "readme.txt").write_text("")
+    (tmp_path / "one.mp3").write_bytes(b"")
+    manifest = tmp_path / "backlog.txt"
+    manifest.write_text("# voice notes\none.mp3\n\n")
+
+    paths = collect_paths([str(tmp_path / "notes")], manifest=str(manifest))
+    assert paths == [str(tmp_path / "one.mp3"), str(tmp_path / "notes" / "b.wav")]
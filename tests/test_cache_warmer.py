@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+import pytest
+from models import ChatHistory, User
+from services import cache_warmer, llm_service
+from services.audio_format import DEFAULT_AUDIO_FORMAT
+from services.cache_warmer import warm_caches
+from services.chat_history import FrequentUtterance, frequent_utterances, normalize_utterance
+
+class FakeRedis:
+    def __init__(self, keys=()):
+        self.keys = dict.fromkeys(keys, None)
+
+    async def exists(self, key):
+        return int(key in self.keys)
+
+    async def expire(self, key, ttl):
+        self.keys[key] = ttl
+
+def test_normalize_utterance():
+    assert normalize_utterance(" 今天 天气  怎么样？") == "今天 天气 怎么样"
+    assert normalize_utterance("Hello!") == normalize_utterance("hello")
+
+@pytest.mark.asyncio
+async def test_frequent_utterances_groups_variants(db_session):
+    user = User(username="alice", email="a@example.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    old = datetime.utcnow() - timedelta(days=90)
+    texts = ["你好。", "你好。", "你好", "几点了？", "讲个笑话"]
+    db_session.add_all([ChatHistory(user_id=user.id, role="user", content=t) for t in texts])
+    db_session.add_all([
+        ChatHistory(user_id=user.id, role="assistant", content="你好！"),
+        ChatHistory(user_id=user.id, role="user", content="讲个笑话", timestamp=old),
+    ])
+    await db_session.flush()
+
+    utterances, total = await frequent_utterances(db_session, days=30, limit=2)
+    assert total == 5
+    assert utterances[0] == FrequentUtterance("你好。", count=2, group_count=3)
+    assert len(utterances) == 2
+
+@pytest.mark.asyncio
+async def test_warm_caches_reports_projected_hit_rate(monkeypatch):
+    redis = FakeRedis(keys=[llm_service.llm_cache_key("几点了？")])
+    synthesized = []
+
+    async def chat(text, history=[]):
+        if text == "讲个笑话":
+            # Provider down: fallback answer, nothing cached
+            yield "抱歉，服务暂时不可用。"
+            return
+        redis.keys[llm_service.llm_cache_key(text)] = None
+        yield text
+        yield "。"
+
+    async def tts(text_iterator, audio_format=None):
+        text = "".join([t async for t in text_iterator])
+        synthesized.append((text, audio_format.key))
+        yield b"a" * 10
+
+    monkeypatch.setattr(llm_service, "redis_client", redis)
+    monkeypatch.setattr(cache_warmer, "chat_with_llm", chat)
+    monkeypatch.setattr(cache_warmer, "text_to_speech_stream", tts)
+
+    utterances = [FrequentUtterance("你好。", 5, 6), FrequentUtterance("几点了？", 3, 3), FrequentUtterance("讲个笑话", 2, 2)]
+    report = await warm_caches(utterances, total=20, audio_formats=[DEFAULT_AUDIO_FORMAT], concurrency=2, ttl=7200)
+
+    assert report["hit_rate_before"] == 0.15
+    assert report["hit_rate_after"] == 0.4
+    assert (report["warmed"], report["failed"], report["already_cached"]) == (2, 1, 1)
+    assert sorted(synthesized) == [("你好。。", DEFAULT_AUDIO_FORMAT.key), ("几点了？。", DEFAULT_AUDIO_FORMAT.key)]
+    # Warmed answers outlive the regular LLM TTL
+    assert redis.keys[llm_service.llm_cache_key("你好。")] == 7200
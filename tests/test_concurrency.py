@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from httpx import AsyncClient
+import main
+from auth import create_access_token
+from routers import transcribe_router
+from services.drain import Drainer
+from services.concurrency import ProviderLimiter, ProviderBusyError
+
+@pytest.mark.asyncio
+async def test_limiter_caps_concurrency_and_times_out():
+    limiter = ProviderLimiter("test", max_concurrency=1, queue_timeout=0.05)
+
+    async with limiter.acquire():
+        assert limiter.active == 1
+        with pytest.raises(ProviderBusyError):
+            async with limiter.acquire():
+                pass
+        assert limiter.waiting == 0
+
+    # Slot is released afterwards
+    async with limiter.acquire():
+        assert limiter.active == 1
+    assert limiter.active == 0
+
+@pytest.mark.asyncio
+async def test_process_audio_rejected_when_overloaded(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(main, "is_overloaded", lambda: True)
+
+    files = {"audio": ("test.wav", b"RIFF", "audio/wav")}
+    response = await client.post("/api/process_audio", files=files)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+@pytest.mark.asyncio
+async def test_transcribe_batch_rejected_when_overloaded_or_draining(client: AsyncClient, monkeypatch):
+    files = [("files", ("a.wav", b"RIFF", "audio/wav"))]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'alice'})}"}
+
+    monkeypatch.setattr(transcribe_router, "is_overloaded", lambda: True)
+    response = await client.post("/api/transcribe_batch", files=files, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+    drainer = Drainer(timeout=5.0, reconnect_spread=2.0)
+    drainer.draining = True
+    monkeypatch.setattr(transcribe_router, "drainer", drainer)
+    response = await client.post("/api/transcribe_batch", files=files, headers=headers)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Server restarting, please retry."
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import signal
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+import main
+from auth import create_access_token
+from routers import admin_router, ws_router
+from services import drain, warmup
+from services.drain import Drainer
+from services.ws_session import AudioInbox, OutboundWriter, SessionRegistry, WS_CLOSE_SERVICE_RESTART
+from tests.test_ws_resume import receive_frame, slow_pipeline
+from tests.test_ws_session import FakeWebSocket
+
+@pytest.fixture
+def fresh_drainer(monkeypatch):
+    drainer = Drainer(timeout=5.0, reconnect_spread=2.0)
+    for module in (main, ws_router, admin_router):
+        monkeypatch.setattr(module, "drainer", drainer)
+    readiness = warmup.Readiness()
+    readiness.warmed_up = True
+    monkeypatch.setattr(warmup, "readiness", readiness)
+    return drainer
+
+def test_drain_finishes_the_turn_then_sends_a_reconnect_hint(slow_pipeline, fresh_drainer, monkeypatch):
+    monkeypatch.setattr(ws_router.settings, "ADMIN_USERS", ["root"])
+    token = create_access_token({"sub": "alice"})
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': 'root'})}"}
+    with TestClient(main.app) as client:
+        assert client.get("/readyz").status_code == 200
+        with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+            frame, last_seq = receive_frame(ws, 0)
+            assert frame["type"] == "session"
+            ws.send_bytes(b"a" * 100)
+            ws.send_text(json.dumps({"action": "finish_speaking"}))
+            while not (isinstance(frame, dict) and frame["type"] == "asr_final"):
+                frame, last_seq = receive_frame(ws, last_seq)
+
+            # The answer is still being generated
+            response = client.post("/admin/drain", headers=admin)
+            assert response.status_code == 200
+            assert response.json()["draining"]
+
+            readyz = client.get("/readyz")
+            assert readyz.status_code == 503
+            assert readyz.json()["draining"]
+            with pytest.raises(WebSocketDisconnect) as refused:
+                with client.websocket_connect(f"/ws/chat?token={token}") as other:
+                    other.receive()
+            assert refused.value.code == WS_CLOSE_SERVICE_RESTART
+
+            tokens, frames = "", []
+            while True:
+                frame, last_seq = receive_frame(ws, last_seq)
+                frames.append(frame if isinstance(frame, bytes) else frame["type"])
+                if isinstance(frame, dict) and frame["type"] == "llm_token":
+                    tokens += frame["text"]
+                if frames[-1] == "reconnect":
+                    break
+            assert tokens == "你好！再见。"
+            assert frames[-2:] == ["turn_end", "reconnect"]
+            assert 0 <= frame["after"] <= 2.0
+            with pytest.raises(WebSocketDisconnect) as closed:
+                ws.receive_text()
+            assert closed.value.code == WS_CLOSE_SERVICE_RESTART
+
+        report = client.get("/admin/drain", headers=admin).json()
+        assert report["sessions"] == {"completed": 1, "timed_out": 0}
+        assert report["open_sessions"] == 0
+
+@pytest.mark.asyncio
+async def test_drain_closes_detached_sessions_at_the_deadline(monkeypatch):
+    registry = SessionRegistry()
+    monkeypatch.setattr(drain, "sessions", registry)
+    writer = OutboundWriter(None, max_bytes=1024, replay_bytes=1024).start()
+    inbox = AudioInbox(max_chunks=10, max_bytes=1024)
+    session = registry.open("s1", "alice", writer, inbox, grace=30)
+
+    async def stuck_turn():
+        await asyncio.sleep(60)
+    session.pipeline = asyncio.create_task(stuck_turn())
+
+    drainer = Drainer(timeout=0.05, reconnect_spread=1.0)
+    await drainer.start("test")
+    assert session.closed
+    assert session.pipeline.cancelled()
+    assert drainer.outcomes == {"completed": 0, "timed_out": 1}
+    assert len(registry) == 0
+
+@pytest.mark.asyncio
+async def test_session_close_after_drain_sends_the_farewell_and_1012():
+    websocket = FakeWebSocket()
+    writer = OutboundWriter(websocket, max_bytes=1024).start()
+    session = SessionRegistry().open("s1", "alice", writer, AudioInbox(10, 1024), grace=0)
+    session.drain(3.5)
+    assert not await session.inbox.put(b"late audio")
+
+    await session.close()
+    assert json.loads(websocket.sent[-1]["text"]) == {"type": "reconnect", "after": 3.5, "seq": 1}
+    assert websocket.close_code == WS_CLOSE_SERVICE_RESTART
+
+@pytest.mark.asyncio
+async def test_sigterm_drains_before_the_previous_handler_runs(monkeypatch):
+    monkeypatch.setattr(drain, "sessions", SessionRegistry())
+    exited = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    drainer = Drainer(timeout=1.0)
+
+    def previous(signum, frame):
+        assert drainer.finished is not None
+        loop.call_soon(exited.set)
+
+    original = signal.signal(signal.SIGTERM, previous)
+    try:
+        assert drainer.install_signal_handler()
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(exited.wait(), timeout=2.0)
+        assert drainer.reason == "SIGTERM"
+    finally:
+        signal.signal(signal.SIGTERM, original)
@@ -12,9 +12,10 @@ async def test_process_audio_e2e(client: AsyncClient, monkeypatch):
     wav_header = b'RIFF\x24\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00\x44\xac\x00\x00\x88\x58\x01\x00\x02\x00\x10\x00data\x00\x00\x00\x00'
     dummy_audio = wav_header + b'\x00' * 100
 
-    # Mock ASR
+    # Mock ASR (whole-file path, streaming ASR is covered in test_upload_ingest.py)
     async def mock_transcribe(*args, **kwargs):
         return "你好"
+    monkeypatch.setattr(main.settings, "UPLOAD_STREAMING_ASR", False)
 
     # Patch BOTH source and destination to be safe
     monkeypatch.setattr(services.asr_service, "transcribe_audio", mock_transcribe)
@@ -29,7 +30,7 @@ async def test_process_audio_e2e(client: AsyncClient, monkeypatch):
     monkeypatch.setattr(main, "chat_with_llm", mock_chat)
 
     # Mock TTS
-    async def mock_tts_stream(text_iterator):
+    async def mock_tts_stream(text_iterator, audio_format=None):
         if hasattr(text_iterator, "__aiter__"):
                 async for _ in text_iterator:
                     pass
@@ -0,0 +1,53 @@
+from config import EndpointConfig, settings
+from services.endpoint_router import EndpointRouter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_router(clock):
+    endpoints = [
+        EndpointConfig(name="a", url="http://a", model="m"),
+        EndpointConfig(name="b", url="http://b", model="m"),
+    ]
+    return EndpointRouter("llm", endpoints, alpha=0.5, clock=clock)
+
+def test_routes_to_fastest_endpoint():
+    router = make_router(FakeClock())
+    # Unmeasured endpoints are explored first
+    assert router.pick().name == "a"
+    router.record_success("a", ttft=0.8)
+    assert router.pick().name == "b"
+    router.record_success("b", ttft=0.3)
+
+    assert router.pick().name == "b"
+    assert router.pick(exclude=["b"]).name == "a"
+
+def test_outlier_ejection_and_probe_readmission():
+    clock = FakeClock()
+    router = make_router(clock)
+    router.record_success("a", ttft=0.1)
+    router.record_success("b", ttft=0.5)
+
+    for _ in range(settings.ROUTER_EJECT_CONSECUTIVE_FAILURES):
+        router.record_failure("a")
+    assert router.stats["a"].probation
+    assert router.pick().name == "b"
+
+    # Ejection expires: a single probe goes to "a", others stay on "b"
+    clock.now += settings.ROUTER_EJECT_BASE_SECONDS + 1
+    assert router.pick().name == "a"
+    assert router.pick().name == "b"
+
+    # Failed probe doubles the ejection
+    router.record_failure("a")
+    assert router.stats["a"].ejected_until == clock.now + 2 * settings.ROUTER_EJECT_BASE_SECONDS
+
+    clock.now += 2 * settings.ROUTER_EJECT_BASE_SECONDS + 1
+    assert router.pick().name == "a"
+    router.record_success("a", ttft=0.1)
+    assert not router.stats["a"].probation
+    assert router.pick().name == "a"
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+import main
+from auth import create_access_token
+from routers import ws_router
+from services.endpointing import CLUSTER_ID, EBML_MAGIC, Endpointer, WebmContinuation
+
+@pytest.mark.asyncio
+async def test_definite_utterance_ends_the_turn():
+    ended = []
+    endpointer = Endpointer(ended.append, silence=1.0, on_definite=True)
+    endpointer.observe({"text": "", "definite": True})
+    assert not ended
+    endpointer.observe({"text": "今天天气", "definite": False})
+    endpointer.observe({"text": "今天天气怎么样", "definite": True})
+    endpointer.observe({"text": "今天天气怎么样", "definite": True})
+    assert ended == ["definite"] and endpointer.fired
+
+@pytest.mark.asyncio
+async def test_stable_transcript_ends_the_turn_after_the_silence():
+    ended = []
+    endpointer = Endpointer(ended.append, silence=0.05, on_definite=False)
+    endpointer.observe({"text": "你好", "definite": True})
+    await asyncio.sleep(0.03)
+    # Still talking: the timer starts over
+    endpointer.observe({"text": "你好吗", "definite": False})
+    await asyncio.sleep(0.03)
+    endpointer.observe({"text": "你好吗", "definite": False})
+    assert ended == []
+    await asyncio.sleep(0.05)
+    assert ended == ["silence"]
+
+@pytest.mark.asyncio
+async def test_client_end_of_speech_disarms_it():
+    ended = []
+    endpointer = Endpointer(ended.append, silence=0.01)
+    endpointer.observe({"text": "你好"})
+    endpointer.client_ended()
+    await asyncio.sleep(0.03)
+    assert ended == [] and endpointer.reason == "client" and not endpointer.fired
+
+def test_server_ends_the_turn_and_drops_the_rest_of_the_utterance(monkeypatch):
+    async def allow(user):
+        return True
+
+    heard = []
+
+    class FakeASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            chunks = []
+
+            async def consume():
+                async for chunk in audio_generator:
+                    chunks.append(chunk)
+
+            consumer = asyncio.create_task(consume())
+            if not heard:
+                yield {"type": "partial", "text": "你好", "definite": False}
+            # Without finish_speaking, only the endpoint ends the audio
+            await consumer
+            heard.append(chunks)
+            yield {"type": "final", "text": "你好" if len(heard) == 1 else "再见"}
+
+    async def chat(text, history=[], **kwargs):
+        yield "嗯"
+
+    async def tts(text_iterator, audio_format=None):
+        async for token in text_iterator:
+            yield token.encode()
+
+    monkeypatch.setattr(ws_router, "check_rate_limit", allow)
+    monkeypatch.setattr(ws_router, "VolcengineASRService", FakeASR)
+    monkeypatch.setattr(ws_router, "chat_with_llm", chat)
+    monkeypatch.setattr(ws_router, "text_to_speech_stream", tts)
+    monkeypatch.setattr(ws_router.settings, "WS_ENDPOINT_SILENCE", 0.05)
+
+    token = create_access_token({"sub": "alice"})
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/chat?token={token}&endpointing=true") as ws:
+            assert json.loads(ws.receive_text())["type"] == "session"
+            ws.send_bytes(b"first")
+
+            def texts_until_turn_end():
+                frames = []
+                while not frames or frames[-1] != "turn_end":
+                    message = ws.receive()
+                    if message.get("text") is not None:
+                        data = json.loads(message["text"])
+                        frames.append(f"{data['type']}:{data['reason']}" if data["type"] == "endpoint" else data["type"])
+                return frames
+
+            assert texts_until_turn_end() == ["asr_partial", "endpoint:silence", "asr_final", "llm_token", "turn_end"]
+
+            # The client was still recording when the endpoint reached it
+            ws.send_bytes(b"tail")
+            ws.send_text(json.dumps({"action": "finish_speaking"}))
+            ws.send_bytes(b"second")
+            ws.send_text(json.dumps({"action": "finish_speaking"}))
+            assert texts_until_turn_end() == ["asr_final", "llm_token", "turn_end"]
+
+    assert heard == [[b"first"], [b"second"]]
+
+def test_hands_free_client_keeps_streaming_without_finish_speaking(monkeypatch):
+    async def allow(user):
+        return True
+
+    header = EBML_MAGIC + b"tracks"
+
+    def cluster(text):
+        return CLUSTER_ID + text.encode()
+
+    heard = []
+
+    class FakeASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            audio = b""
+            async for chunk in audio_generator:
+                audio += chunk
+                yield {"type": "partial", "text": audio[-6:].decode(errors="replace"), "definite": False}
+            # Only a stream with its container header decodes
+            assert audio.startswith(header)
+            heard.append(audio)
+            yield {"type": "final", "text": audio[-6:].decode()}
+
+    async def chat(text, history=[], **kwargs):
+        yield "嗯"
+
+    async def tts(text_iterator, audio_format=None):
+        async for token in text_iterator:
+            yield token.encode()
+
+    monkeypatch.setattr(ws_router, "check_rate_limit", allow)
+    monkeypatch.setattr(ws_router, "VolcengineASRService", FakeASR)
+    monkeypatch.setattr(ws_router, "chat_with_llm", chat)
+    monkeypatch.setattr(ws_router, "text_to_speech_stream", tts)
+    monkeypatch.setattr(ws_router.settings, "WS_ENDPOINT_SILENCE", 0.05)
+    monkeypatch.setattr(ws_router.settings, "WS_ENDPOINT_TAIL", 0.3)
+
+    token = create_access_token({"sub": "alice"})
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/chat?token={token}&endpointing=true") as ws:
+            assert json.loads(ws.receive_text())["type"] == "session"
+
+            def utterance(audio):
+                ws.send_bytes(audio)
+                frames = []
+                while not frames or frames[-1] != "turn_end":
+                    message = ws.receive()
+                    if message.get("text") is not None:
+                        frames.append(json.loads(message["text"])["type"])
+                        if frames[-1] == "endpoint":
+                            # Still streaming when the endpoint arrives: the end of a cluster
+                            ws.send_bytes(b"...")
+                return frames
+
+            # One recording, one container header, never a finish_speaking
+            assert utterance(header + cluster("first!")) == ["asr_partial", "endpoint", "asr_final", "llm_token", "turn_end"]
+            time.sleep(0.4)
+            assert utterance(cluster("second")) == ["asr_partial", "endpoint", "asr_final", "llm_token", "turn_end"]
+
+    assert heard == [header + cluster("first!"), header + cluster("second")]
+
+@pytest.mark.asyncio
+async def test_webm_continuation_restores_the_header_of_a_recording():
+    async def chunks(*items):
+        for item in items:
+            yield item
+
+    webm = WebmContinuation()
+    header = EBML_MAGIC + b"tracks"
+    first = [c async for c in webm.utterance(chunks(header + CLUSTER_ID[:2], CLUSTER_ID[2:] + b"one"))]
+    assert first == [header + CLUSTER_ID[:2], CLUSTER_ID[2:] + b"one"] and webm.header == header
+    # Resumes mid-cluster, with the next cluster id split across chunks
+    rest = [c async for c in webm.utterance(chunks(b"ne" + CLUSTER_ID[:3], CLUSTER_ID[3:] + b"two", b"more"))]
+    assert rest == [header + CLUSTER_ID + b"two", b"more"]
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+import main
+from auth import create_access_token
+from config import settings
+from routers import ws_router
+from services import filler_audio
+from services.audio_format import DEFAULT_AUDIO_FORMAT
+from services.filler_audio import FillerPool, FillerTimer
+
+class RecordingLane:
+    def __init__(self, current=True):
+        self.is_current = current
+        self.frames = []
+
+    async def send_json(self, data):
+        self.frames.append(data["type"])
+
+    async def send_bytes(self, data, frame="audio"):
+        await asyncio.sleep(0.02)
+        self.frames.append((frame, data))
+
+def ready_pool():
+    pool = FillerPool(phrases=["嗯，"])
+    pool.add(DEFAULT_AUDIO_FORMAT, "嗯，", b"clip")
+    return pool
+
+@pytest.mark.asyncio
+async def test_filler_is_sent_when_the_answer_is_slow():
+    lane = RecordingLane()
+    timer = FillerTimer(lane, DEFAULT_AUDIO_FORMAT, delay=0.01, pool=ready_pool()).start()
+    await asyncio.sleep(0.015)
+    # The clip is still being queued: the answer waits for it
+    await timer.close()
+    await lane.send_bytes(b"answer")
+    assert lane.frames == ["filler", ("filler_audio", b"clip"), ("audio", b"answer")]
+
+@pytest.mark.asyncio
+async def test_no_filler_once_the_answer_started():
+    lane = RecordingLane()
+    timer = FillerTimer(lane, DEFAULT_AUDIO_FORMAT, delay=0.02, pool=ready_pool()).start()
+    await timer.close()
+    await asyncio.sleep(0.05)
+    assert lane.frames == []
+
+@pytest.mark.asyncio
+async def test_no_filler_while_an_earlier_turn_is_playing():
+    lane = RecordingLane(current=False)
+    timer = FillerTimer(lane, DEFAULT_AUDIO_FORMAT, delay=0.01, pool=ready_pool()).start()
+    await asyncio.sleep(0.03)
+    await timer.close()
+    assert lane.frames == [] and not timer.sent
+
+@pytest.mark.asyncio
+async def test_pool_synthesizes_clips_in_the_background(monkeypatch):
+    async def tts_request(text, audio_format):
+        yield text.encode()
+        yield b"!"
+
+    monkeypatch.setattr(filler_audio, "tts_request", tts_request)
+    pool = FillerPool(phrases=["好的，"])
+    assert pool.get(DEFAULT_AUDIO_FORMAT) is None
+    await pool.preload(DEFAULT_AUDIO_FORMAT)
+    assert pool.get(DEFAULT_AUDIO_FORMAT) == ("好的，", "好的，".encode() + b"!")
+
+@pytest.fixture
+def slow_llm(monkeypatch):
+    async def allow(user):
+        return True
+
+    class FakeASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            async for _ in audio_generator:
+                pass
+            yield {"type": "final", "text": "你好"}
+
+    async def chat(text, history=[], **kwargs):
+        await asyncio.sleep(0.2)
+        yield "嗨"
+
+    async def tts(text_iterator, audio_format=None):
+        async for token in text_iterator:
+            yield token.encode()
+
+    monkeypatch.setattr(ws_router, "check_rate_limit", allow)
+    monkeypatch.setattr(ws_router, "VolcengineASRService", FakeASR)
+    monkeypatch.setattr(ws_router, "chat_with_llm", chat)
+    monkeypatch.setattr(ws_router, "text_to_speech_stream", tts)
+    monkeypatch.setattr(filler_audio, "filler_pool", ready_pool())
+    monkeypatch.setattr(settings, "WS_FILLER_ENABLED", True)
+    monkeypatch.setattr(settings, "WS_FILLER_DELAY", 0.05)
+
+def test_filler_precedes_a_slow_answer(slow_llm):
+    token = create_access_token({"sub": "alice"})
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+            assert json.loads(ws.receive_text())["type"] == "session"
+            ws.send_bytes(b"a" * 100)
+            ws.send_text(json.dumps({"action": "finish_speaking"}))
+
+            frames = []
+            while frames[-1:] != ["turn_end"]:
+                message = ws.receive()
+                if message.get("bytes") is not None:
+                    frames.append(message["bytes"])
+                else:
+                    frames.append(json.loads(message["text"])["type"])
+
+    assert frames == ["asr_final", "filler", b"clip", "llm_token", "嗨".encode(), "turn_end"]
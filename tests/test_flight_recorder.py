@@ -0,0 +1,124 @@
+import asyncio
+import json
+import pytest
+from httpx import AsyncClient
+import main
+from auth import create_access_token
+from config import settings
+from services.flight_recorder import FlightRecorder, SlowTurnStore, slow_turns
+
+@pytest.mark.asyncio
+async def test_slow_turn_is_saved_as_compact_timeline(tmp_path):
+    path = tmp_path / "slow_turns.jsonl"
+    store = SlowTurnStore(path=str(path), keep=10)
+    recorder = FlightRecorder("ws_chat", session_id="s1", slo=0.05, store=store)
+
+    recorder.record("audio_chunk", bytes=320)
+    recorder.record("audio_chunk", bytes=320)
+    recorder.record("asr_final", chars=4)
+    await asyncio.sleep(0.1)
+    recorder.record("llm_first_token")
+    for _ in range(3):
+        recorder.record("frame_sent", frame="audio", bytes=1000)
+
+    timeline = recorder.finish_turn(1)
+    assert timeline["latency"] >= 0.1
+    assert timeline["audio_sent"]
+    names = [name for _, name, _ in timeline["events"]]
+    assert names == ["audio_chunk", "asr_final", "llm_first_token", "frame_sent"]
+    assert timeline["events"][0][2] == {"bytes": 640, "count": 2, "until_ms": timeline["events"][0][2]["until_ms"]}
+    assert timeline["events"][-1][2]["count"] == 3
+
+    # Persisted off the loop
+    for _ in range(50):
+        if path.exists() and path.read_text():
+            break
+        await asyncio.sleep(0.01)
+    assert json.loads(path.read_text())["session_id"] == "s1"
+    assert store.recent() == [timeline]
+
+@pytest.mark.asyncio
+async def test_fast_turn_is_not_saved_and_turns_are_separate():
+    store = SlowTurnStore(path="", keep=10)
+    recorder = FlightRecorder("ws_chat", session_id="s1", slo=1.0, store=store)
+
+    recorder.record("asr_final", chars=2)
+    recorder.record("frame_sent", frame="audio", bytes=10)
+    assert recorder.finish_turn(1) is None
+
+    # Nothing recorded since the last turn
+    assert recorder.finish_turn(2) is None
+    assert store.recent() == []
+
+@pytest.mark.asyncio
+async def test_process_audio_slow_turn_on_admin_endpoint(client: AsyncClient, monkeypatch):
+    async def mock_transcribe(*args, **kwargs):
+        return "你好"
+
+    async def mock_chat(*args, **kwargs):
+        yield "你好"
+        yield "！"
+
+    async def mock_tts_stream(text_iterator, audio_format=None):
+        async for _ in text_iterator:
+            pass
+        yield b"audio_chunk"
+
+    monkeypatch.setattr(main, "transcribe_audio", mock_transcribe)
+    monkeypatch.setattr(main, "chat_with_llm", mock_chat)
+    monkeypatch.setattr(main, "text_to_speech_stream", mock_tts_stream)
+    monkeypatch.setattr(settings, "UPLOAD_STREAMING_ASR", False)
+    monkeypatch.setattr(settings, "FLIGHT_RECORDER_SLO", 0.0)
+    monkeypatch.setattr(settings, "ADMIN_USERS", ["ops"])
+    monkeypatch.setattr(slow_turns, "path", "")
+    slow_turns.turns.clear()
+
+    files = {"audio": ("test.wav", b"RIFF\x24\x00\x00\x00WAVE" + b"\x00" * 100, "audio/wav")}
+    response = await client.post("/api/process_audio", files=files)
+    assert response.status_code == 200
+
+    token = create_access_token({"sub": "ops"})
+    response = await client.get("/admin/slow_turns?limit=5", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    turn = response.json()["turns"][0]
+    assert turn["kind"] == "process_audio"
+    names = [name for _, name, _ in turn["events"]]
+    assert names[:5] == ["upload_started", "upload_received", "asr_final", "llm_first_token", "llm_last_token"]
+    assert ["frame_sent", "meta"] == [names[5], turn["events"][5][2]["frame"]]
+
+@pytest.mark.asyncio
+async def test_overlapping_turns_are_measured_separately():
+    store = SlowTurnStore(path="", keep=10)
+    recorder = FlightRecorder("ws_chat", session_id="s1", slo=0.0, store=store)
+
+    recorder.record("turn_start", turn=1)
+    recorder.record("asr_final", chars=2, turn=1)
+    # The next utterance is recognised while turn 1 is still speaking
+    recorder.record("turn_start", turn=2)
+    await asyncio.sleep(0.05)
+    recorder.record("asr_final", chars=2, turn=2)
+    recorder.record("frame_sent", frame="audio", bytes=10, turn=1)
+    first = recorder.finish_turn(1)
+
+    await asyncio.sleep(0.05)
+    recorder.record("frame_sent", frame="audio", bytes=10, turn=2)
+    second = recorder.finish_turn(2)
+
+    assert first["latency"] >= 0.05
+    # From turn 2's own speech end, not turn 1's audio
+    assert 0.05 <= second["latency"] < first["latency"] + 0.05
+    assert second["events"][0][1] == "turn_start"
+
+@pytest.mark.asyncio
+async def test_filler_counts_as_first_sound_not_as_answer():
+    store = SlowTurnStore(path="", keep=10)
+    recorder = FlightRecorder("ws_chat", session_id="s1", slo=0.05, store=store)
+
+    recorder.record("asr_final", chars=2)
+    recorder.record("frame_sent", frame="filler_audio", bytes=10)
+    await asyncio.sleep(0.1)
+    recorder.record("frame_sent", frame="audio", bytes=10)
+
+    timeline = recorder.finish_turn(1)
+    assert timeline["latency"] >= 0.1
+    assert timeline["first_sound"] < 0.05
@@ -0,0 +1,30 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from services import warmup
+
+class DeadRedis:
+    async def ping(self):
+        raise ConnectionError("Connection refused")
+
+@pytest.mark.asyncio
+async def test_readiness_after_warmup_with_degraded_dependency(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(warmup, "readiness", warmup.Readiness())
+
+    async def no_network(*args, **kwargs):
+        return None
+    monkeypatch.setattr(warmup, "_connect_pool", no_network)
+    monkeypatch.setattr(warmup, "_resolve", no_network)
+
+    assert (await client.get("/healthz")).status_code == 200
+    assert (await client.get("/readyz")).status_code == 503
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    await warmup.warm_up(redis_clients=[DeadRedis()], engine=engine, timeout=1.0)
+    await engine.dispose()
+
+    response = await client.get("/readyz")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["degraded"] == ["redis"]
+    assert body["dependencies"]["database"]["ok"]
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from services.hedging import hedged_stream, FirstTokenError
+
+def make_stream(tokens, first_delay=0.0, fail_before=False, fail_after=None, log=None):
+    async def gen():
+        try:
+            await asyncio.sleep(first_delay)
+            if fail_before:
+                raise RuntimeError("upstream 502")
+            for i, token in enumerate(tokens):
+                if fail_after is not None and i == fail_after:
+                    raise RuntimeError("connection reset")
+                yield token
+        finally:
+            if log is not None:
+                log.append("closed")
+    return gen
+
+async def collect(agen):
+    return [item async for item in agen]
+
+@pytest.mark.asyncio
+async def test_hedge_wins_when_primary_misses_deadline():
+    closed = []
+    primary = make_stream(["slow"], first_delay=5, log=closed)
+    hedge = make_stream(["fast", "!"])
+
+    result = await collect(hedged_stream(primary, hedge, ttft_deadline=0.05))
+    assert result == ["fast", "!"]
+    assert closed == ["closed"]
+
+@pytest.mark.asyncio
+async def test_retry_only_before_first_token():
+    calls = []
+
+    def primary():
+        calls.append(1)
+        return make_stream(["a"], fail_before=len(calls) < 2)()
+
+    result = await collect(hedged_stream(primary, max_attempts=3, backoff=0))
+    assert result == ["a"]
+    assert len(calls) == 2
+
+    calls.clear()
+    def broken():
+        calls.append(1)
+        return make_stream(["a", "b", "c"], fail_after=1)()
+
+    received = []
+    with pytest.raises(RuntimeError):
+        async for token in hedged_stream(broken, max_attempts=3, backoff=0):
+            received.append(token)
+    # Mid-stream failure is surfaced, never retried
+    assert received == ["a"]
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_all_attempts_fail():
+    with pytest.raises(FirstTokenError):
+        await collect(hedged_stream(make_stream([], fail_before=True), max_attempts=2, backoff=0))
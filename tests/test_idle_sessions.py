@@ -0,0 +1,75 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+import main
+from auth import create_access_token
+from routers import ws_router
+from services.flight_recorder import FlightRecorder
+from services.ws_session import AudioInbox, OutboundWriter, SessionRegistry, WS_CLOSE_IDLE_TIMEOUT, sessions
+from tests.test_ws_resume import receive_frame, slow_pipeline
+from tests.test_ws_session import FakeWebSocket
+
+@pytest.mark.asyncio
+async def test_hibernation_releases_the_pipeline_until_the_next_message():
+    writer = OutboundWriter(FakeWebSocket(), max_bytes=1024, replay_bytes=1024).start()
+    inbox = AudioInbox(max_chunks=10, max_bytes=1024)
+    session = SessionRegistry().open("s1", "alice", writer, inbox, grace=30)
+    session.recorder = FlightRecorder("ws_chat", session_id="s1")
+    started = []
+
+    async def pipeline():
+        started.append(time.monotonic())
+        while await inbox.get() is not None:
+            pass
+
+    session.start_pipeline(pipeline)
+    await writer.send_bytes(b"x" * 100)
+    await writer.drain()
+    session.recorder.record("frame_sent", bytes=100)
+
+    # Audio waiting for ASR is not idle
+    await inbox.put(b"a")
+    assert not await session.hibernate()
+    await asyncio.sleep(0.01)
+
+    assert await session.hibernate()
+    assert session.pipeline is None
+    assert writer.retained_bytes == 0 and writer.can_resume(writer.seq)
+    assert len(session.recorder.events) == 0
+
+    session.touch()
+    assert session.wakeup.done()
+    session.wake()
+    await asyncio.sleep(0.01)
+    assert len(started) == 2 and not session.hibernated
+    await session.close()
+
+def test_idle_session_hibernates_wakes_up_and_is_closed_at_the_timeout(slow_pipeline, monkeypatch):
+    monkeypatch.setattr(ws_router.settings, "WS_IDLE_HIBERNATE", 0.2)
+    monkeypatch.setattr(ws_router.settings, "WS_IDLE_TIMEOUT", 1.5)
+    token = create_access_token({"sub": "alice"})
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+            frame, last_seq = receive_frame(ws, 0)
+            session = sessions.get(frame["session_id"], "alice")
+
+            turns = []
+            for _ in range(2):
+                ws.send_bytes(b"a" * 100)
+                ws.send_text(json.dumps({"action": "finish_speaking"}))
+                while not (isinstance(frame, dict) and frame["type"] == "turn_end"):
+                    frame, last_seq = receive_frame(ws, last_seq)
+                turns.append(session.turns)
+                frame = None
+                time.sleep(0.4)
+                assert session.hibernated and session.pipeline is None
+
+            # The second turn ran on a new pipeline, numbered after the first
+            assert turns == [1, 2]
+            with pytest.raises(WebSocketDisconnect) as closed:
+                ws.receive_text()
+            assert closed.value.code == WS_CLOSE_IDLE_TIMEOUT
+        assert session.closed
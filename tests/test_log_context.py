@@ -0,0 +1,88 @@
+import asyncio
+import json
+import logging
+import pytest
+from loguru import logger
+from log_context import BackgroundSink, JsonFileWriter, LogSampler, add_context, bind_session, bind_turn, redact
+from config import InterceptHandler
+
+def test_sampler_counts_suppressed_records():
+    now = [0.0]
+    sampler = LogSampler(interval=5.0, clock=lambda: now[0])
+
+    assert sampler.allow("chunk") == 0
+    assert sampler.allow("chunk") is None
+    assert sampler.allow("chunk") is None
+    # Keys are limited independently
+    assert sampler.allow("token") == 0
+
+    now[0] = 5.0
+    assert sampler.allow("chunk") == 2
+    assert sampler.allow("chunk") is None
+
+def test_redact_keeps_only_a_prefix():
+    token = "abcdefghijklmnopqrstuvwxyz"
+    assert redact(token) == "abcdef…(26 chars)"
+    assert "xyz" not in redact(token)
+
+@pytest.mark.asyncio
+async def test_correlation_ids_follow_the_task():
+    records = []
+    sink_id = logger.add(lambda m: records.append(m.record["extra"]), format="{message}")
+    patched = logger.patch(add_context)
+
+    async def session(turns):
+        session_id = bind_session()
+        for turn in range(1, turns + 1):
+            bind_turn(turn)
+            await asyncio.sleep(0)
+            patched.info("turn")
+        return session_id
+
+    try:
+        ids = await asyncio.gather(session(2), session(1))
+    finally:
+        logger.remove(sink_id)
+
+    assert ids[0] != ids[1]
+    pairs = sorted((r["session_id"], r["turn_id"]) for r in records)
+    assert pairs == sorted([(ids[0], 1), (ids[0], 2), (ids[1], 1)])
+
+def test_stdlib_records_reach_loguru():
+    records = []
+    sink_id = logger.add(lambda m: records.append(m.record), format="{message}")
+    std_logger = logging.getLogger("tests.intercept")
+    std_logger.addHandler(InterceptHandler())
+    std_logger.propagate = False
+    try:
+        std_logger.warning("upstream %s", "slow")
+    finally:
+        std_logger.handlers = []
+        logger.remove(sink_id)
+
+    assert records[0]["message"] == "upstream slow"
+    assert records[0]["level"].name == "WARNING"
+    # Attributed to the caller, not to the logging module
+    assert records[0]["function"] == "test_stdlib_records_reach_loguru"
+
+@pytest.mark.asyncio
+async def test_background_sink_writes_json_lines(tmp_path):
+    path = tmp_path / "app.log"
+    sink_id = logger.add(BackgroundSink(JsonFileWriter(str(path))), format="{message}")
+    patched = logger.patch(add_context)
+    session_id = bind_session()
+    bind_turn(3)
+    try:
+        patched.info("hello")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            patched.exception("failed")
+        await logger.complete()
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+    finally:
+        logger.remove(sink_id)
+
+    assert [l["message"] for l in lines] == ["hello", "failed"]
+    assert lines[0]["extra"] == {"session_id": session_id, "turn_id": 3}
+    assert "ValueError: boom" in lines[1]["exception"]
@@ -0,0 +1,53 @@
+import asyncio
+import time
+import pytest
+from httpx import AsyncClient
+from auth import create_access_token
+from config import settings
+from services.loop_monitor import LoopMonitor
+
+def blocking_hash():
+    # Stands in for argon2 / gzip running on the loop
+    time.sleep(0.3)
+
+@pytest.mark.asyncio
+async def test_stall_is_caught_with_blocking_stack():
+    monitor = LoopMonitor(interval=0.01, threshold=0.05, max_offenders=10).start()
+    try:
+        await asyncio.sleep(0.05)
+
+        async def handle_login():
+            blocking_hash()
+        await asyncio.create_task(handle_login(), name="login-request")
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    assert monitor.max_lag >= 0.2
+    offender = monitor.report()["offenders"][0]
+    assert offender["lag"] >= 0.2
+    assert offender["task"].startswith("login-request")
+    assert offender["samples"] > 0
+    assert "blocking_hash" in offender["stack"][-1]
+
+@pytest.mark.asyncio
+async def test_short_lag_is_not_an_offender():
+    monitor = LoopMonitor(interval=0.01, threshold=0.5)
+    monitor.record_lag(0.02)
+    assert monitor.last_lag == 0.02
+    assert monitor.offenders == type(monitor.offenders)()
+
+@pytest.mark.asyncio
+async def test_admin_loop_endpoint_requires_admin(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_USERS", ["ops"])
+
+    assert (await client.get("/admin/loop")).status_code == 401
+
+    user_token = create_access_token({"sub": "alice"})
+    response = await client.get("/admin/loop", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 403
+
+    admin_token = create_access_token({"sub": "ops"})
+    response = await client.get("/admin/loop", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert "offenders" in response.json()
@@ -0,0 +1,151 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+import main
+from auth import create_access_token
+from routers import admin_router, ws_router
+from services import metering, tts_service
+from services.audio_format import DEFAULT_AUDIO_FORMAT
+from services.metering import UsageMeter, bind_user
+from services.ws_session import WS_CLOSE_QUOTA_EXCEEDED
+
+class FakeRedis:
+    """The hash and set commands of the meter, with a pipeline."""
+
+    def __init__(self, fail=False):
+        self.hashes = {}
+        self.sets = {}
+        self.ttls = {}
+        self.fail = fail
+        self.executed = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def hgetall(self, key):
+        return {k: str(v) for k, v in self.hashes.get(key, {}).items()}
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def hincrby(self, key, field, amount):
+        self.commands.append(("hincrby", key, field, amount))
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", key, ttl))
+
+    def sadd(self, key, *members):
+        self.commands.append(("sadd", key, members))
+
+    def hgetall(self, key):
+        self.commands.append(("hgetall", key))
+
+    async def execute(self):
+        redis = self.redis
+        if redis.fail:
+            raise ConnectionError("Connection refused")
+        redis.executed += 1
+        replies = []
+        for command, key, *args in self.commands:
+            if command == "hincrby":
+                field, amount = args
+                values = redis.hashes.setdefault(key, {})
+                values[field] = values.get(field, 0) + amount
+                replies.append(values[field])
+            elif command == "expire":
+                redis.ttls[key] = args[0]
+                replies.append(True)
+            elif command == "sadd":
+                redis.sets.setdefault(key, set()).update(args[0])
+                replies.append(len(args[0]))
+            else:
+                replies.append(await redis.hgetall(key))
+        return replies
+
+@pytest.mark.asyncio
+async def test_counts_are_flushed_in_one_pipeline_per_batch():
+    redis = FakeRedis()
+    meter = UsageMeter(redis=redis, retention_days=2)
+    # Usage on another instance
+    redis.hashes[metering.usage_key(meter.day, "alice")] = {"llm_tokens": 100}
+
+    bind_user("alice")
+    for _ in range(50):
+        meter.add("llm_tokens", 1)
+    meter.add("tts_chars", 12)
+    meter.add("asr_ms", 1500, user="bob")
+    meter.add("tts_chars", 0, user="carol")
+
+    await meter.flush()
+    assert redis.executed == 1
+    assert redis.hashes[metering.usage_key(meter.day, "alice")] == {"llm_tokens": 150, "tts_chars": 12}
+    assert redis.sets[metering.users_key(meter.day)] == {"alice", "bob"}
+    assert redis.ttls[metering.usage_key(meter.day, "bob")] == 2 * 86400
+
+    # Totals come back with the flush, pending counts are added on top
+    meter.add("llm_tokens", 5, user="alice")
+    assert meter.usage("alice") == {"llm_tokens": 155, "tts_chars": 12}
+    await meter.flush()
+    await meter.flush()
+    assert redis.executed == 2
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_the_counts():
+    redis = FakeRedis(fail=True)
+    meter = UsageMeter(redis=redis)
+    meter.add("tts_chars", 10, user="alice")
+    await meter.flush()
+    meter.add("tts_chars", 5, user="alice")
+
+    redis.fail = False
+    await meter.flush()
+    assert redis.hashes[metering.usage_key(meter.day, "alice")] == {"tts_chars": 15}
+
+@pytest.mark.asyncio
+async def test_tts_cache_hits_are_counted_separately(monkeypatch):
+    class CachedAudio:
+        async def get(self, key):
+            return b"audio"
+
+    meter = UsageMeter(redis=FakeRedis())
+    monkeypatch.setattr(tts_service, "usage_meter", meter)
+    monkeypatch.setattr(tts_service, "redis_client", CachedAudio())
+    chunks = [chunk async for chunk in tts_service.tts_request("你好世界", DEFAULT_AUDIO_FORMAT)]
+    assert chunks == [b"audio"]
+    assert meter.usage(metering.ANONYMOUS) == {"tts_cached_chars": 4}
+
+def test_quota_refuses_new_sessions_and_usage_is_queryable(monkeypatch):
+    async def allow(user):
+        return True
+
+    redis = FakeRedis()
+    meter = UsageMeter(redis=redis, quotas={"llm_tokens": 1000})
+    meter.add("llm_tokens", 1000, user="alice")
+    meter.add("llm_tokens", 10, user="bob")
+    monkeypatch.setattr(ws_router, "usage_meter", meter)
+    monkeypatch.setattr(admin_router, "usage_meter", meter)
+    monkeypatch.setattr(ws_router, "check_rate_limit", allow)
+    monkeypatch.setattr(admin_router.settings, "ADMIN_USERS", ["root"])
+
+    with TestClient(main.app) as client:
+        token = create_access_token({"sub": "alice"})
+        with pytest.raises(WebSocketDisconnect) as refused:
+            with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+                ws.receive()
+        assert refused.value.code == WS_CLOSE_QUOTA_EXCEEDED
+
+        admin = {"Authorization": f"Bearer {create_access_token({'sub': 'root'})}"}
+        body = client.get("/admin/usage", headers=admin).json()
+        assert body["users"] == {"alice": {"llm_tokens": 1000}, "bob": {"llm_tokens": 10}}
+        assert client.get("/admin/usage?day=yesterday", headers=admin).status_code == 422
@@ -0,0 +1,167 @@
+import asyncio
+import gzip
+import json
+import struct
+import time
+import httpx
+import pytest
+import main
+import replay_session
+from config import settings
+from routers import ws_router
+from services import asr_service, llm_service, session_archive, tts_service, volcengine_asr
+from services.session_archive import NULL_UPSTREAM, SessionArchive, load
+
+async def chunks(*items, delay=0.0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+def volc_frame(text):
+    payload = gzip.compress(json.dumps({"result": [{"text": text}]}).encode())
+    return b"\x11\x90\x11\x00" + struct.pack(">I", len(payload)) + payload
+
+@pytest.mark.asyncio
+async def test_archive_round_trip(tmp_path):
+    archive = SessionArchive("ws_chat", session_id="abc", params={"audio_format": "pcm"}, directory=str(tmp_path)).bind()
+    session_archive.capture("client", "audio", b"\x00\x01")
+    session_archive.capture("client", "text", '{"action": "finish_speaking"}')
+    for _ in range(2):
+        upstream = session_archive.upstream("llm", endpoint="primary")
+        upstream.record("status", 200)
+        assert [c async for c in upstream.tap(chunks(b"data: 1\n\n", b"data: [DONE]\n\n"))] == [b"data: 1\n\n", b"data: [DONE]\n\n"]
+    path = await archive.save()
+    session_archive.current_archive.set(None)
+
+    header, events = load(path)
+    assert path.startswith(str(tmp_path)) and path.endswith("-abc.jsonl.gz")
+    assert header["kind"] == "ws_chat" and header["params"] == {"audio_format": "pcm"}
+    assert [e[1:] for e in events[:3]] == [
+        ("client", "audio", b"\x00\x01"),
+        ("client", "text", '{"action": "finish_speaking"}'),
+        ("llm:1", "open", {"endpoint": "primary"}),
+    ]
+    assert [(stream, event) for _, stream, event, _ in events[6:]] == [
+        ("llm:2", "open"), ("llm:2", "status"), ("llm:2", "data"), ("llm:2", "data"),
+    ]
+    offsets = [e[0] for e in events]
+    assert offsets == sorted(offsets)
+
+def test_archive_is_off_by_default():
+    assert session_archive.start("ws_chat") is None
+    source = chunks(b"x")
+    assert session_archive.upstream("llm") is NULL_UPSTREAM
+    assert NULL_UPSTREAM.tap(source) is source
+
+def test_archive_stops_at_max_bytes():
+    archive = SessionArchive("ws_chat", session_id="abc", max_bytes=10)
+    archive.capture("client", "audio", b"x" * 8)
+    archive.capture("client", "audio", b"x" * 8)
+    archive.capture("client", "audio", b"x")
+    assert len(archive.events) == 1
+    assert archive.header()["truncated"]
+
+@pytest.mark.asyncio
+async def test_stand_in_replays_recorded_timing():
+    recordings = replay_session.upstream_recordings([
+        (0.0, "llm:1", "open", {}),
+        (100.0, "llm:1", "status", 200),
+        (300.0, "llm:1", "data", b"a"),
+        (500.0, "llm:1", "data", b"b"),
+    ])
+    stand_ins = replay_session.StandIns(recordings, speed=10)
+    async with httpx.AsyncClient(transport=stand_ins.transport("llm")) as client:
+        start = time.monotonic()
+        async with client.stream("POST", "http://llm/") as response:
+            headers_at = time.monotonic() - start
+            received = [(chunk, time.monotonic() - start) async for chunk in response.aiter_bytes()]
+        response = await client.post("http://llm/")
+
+    assert 0.008 < headers_at < 0.03
+    assert [chunk for chunk, _ in received] == [b"a", b"b"]
+    assert 0.045 < received[1][1] < 0.08
+    assert response.status_code == 503
+    assert stand_ins.unmatched == {"llm": 1}
+
+@pytest.mark.asyncio
+async def test_asr_stand_in_holds_final_frames_until_last_packet():
+    recordings = replay_session.upstream_recordings([
+        (0.0, "asr:1", "open", {}),
+        (10.0, "asr:1", "data", b"partial"),
+        (900.0, "asr:1", "eos", None),
+        (950.0, "asr:1", "data", b"final"),
+    ])
+    stand_ins = replay_session.StandIns(recordings, speed=1)
+    async with stand_ins.connect("wss://asr") as ws:
+        frames = []
+
+        async def receive():
+            async for frame in ws:
+                frames.append((frame, time.monotonic()))
+
+        receiver = asyncio.create_task(receive())
+        await asyncio.sleep(0.1)
+        assert [f for f, _ in frames] == [b"partial"]
+        eos_at = time.monotonic()
+        await ws.send(b"\x11\x22\x01\x00")
+        await asyncio.wait_for(receiver, 1)
+
+    assert frames[1][0] == b"final"
+    assert 0.04 < frames[1][1] - eos_at < 0.1
+
+def test_diff_profiles():
+    base = {"summary": {"first_audio": {"p50": 800.0, "p95": 1500.0}, "turn_end": {"p50": 2000.0, "p95": 3000.0}}}
+    new = {"summary": {"first_audio": {"p50": 650.0, "p95": 1600.0}}}
+    assert replay_session.diff_profiles(base, new) == [
+        ("first_audio", "p50", 800.0, 650.0, -150.0),
+        ("first_audio", "p95", 1500.0, 1600.0, 100.0),
+    ]
+
+@pytest.fixture
+def restore_providers(monkeypatch):
+    """replay() repoints the app's provider clients; put them back afterwards."""
+    for module in (asr_service, llm_service, tts_service):
+        monkeypatch.setattr(module, "_client", module._client)
+    for module in (llm_service, tts_service, ws_router):
+        monkeypatch.setattr(module, "redis_client", module.redis_client)
+    monkeypatch.setattr(volcengine_asr, "websockets", volcengine_asr.websockets)
+    monkeypatch.setattr(main.limiter, "enabled", main.limiter.enabled)
+    monkeypatch.setattr(settings, "SESSION_RECORDING_ENABLED", False)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_ENABLED", settings.CHAT_HISTORY_ENABLED)
+    monkeypatch.setattr(settings, "WS_RESUME_GRACE_SECONDS", settings.WS_RESUME_GRACE_SECONDS)
+
+@pytest.mark.asyncio
+async def test_replay_process_audio_upload(tmp_path, restore_providers):
+    boundary = "replay"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"a.webm\"\r\n"
+            "Content-Type: audio/webm\r\n\r\n").encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    llm_event = json.dumps({"choices": [{"delta": {"content": "你好。"}}]}, ensure_ascii=False)
+    tts_event = json.dumps({"data": {"audio": "abcd", "status": 1}})
+
+    archive = SessionArchive("process_audio", session_id="up", directory=str(tmp_path),
+                             params={"content_type": f"multipart/form-data; boundary={boundary}"})
+    archive.events = [
+        (0.0, "client", "body", head + b"\x1a\x45\xdf\xa3" + b"\x00" * 400),
+        (5.0, "asr:1", "open", {"container": "webm"}),
+        (20.0, "client", "body", b"\x00" * 400 + tail),
+        (21.0, "asr:1", "eos", None),
+        (60.0, "asr:1", "data", volc_frame("你好")),
+        (70.0, "llm:1", "open", {}),
+        (80.0, "llm:1", "status", 200),
+        (120.0, "llm:1", "data", f"data: {llm_event}\n\ndata: [DONE]\n\n".encode()),
+        (130.0, "tts:1", "open", {}),
+        (140.0, "tts:1", "status", 200),
+        (170.0, "tts:1", "data", f"data: {tts_event}\n\n".encode()),
+    ]
+    path = await archive.save()
+
+    profile = await replay_session.replay([path], speed=2, timeout=5)
+
+    assert profile["unmatched"] == {}
+    [turn] = profile["turns"]
+    assert turn["archive"].endswith("-up.jsonl.gz")
+    # Recorded: ASR final 39ms after the last packet, LLM answer 50ms after its request; halved at 2x
+    assert 35 < turn["meta"] < 150
+    assert turn["meta"] < turn["first_audio"] <= turn["end"]
+    assert profile["summary"]["first_audio"]["count"] == 1
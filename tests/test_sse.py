@@ -0,0 +1,64 @@
+import json
+import httpx
+import pytest
+from services import llm_service, sse
+from services.sse import SSEDecoder, hex_field
+from services.tts_service import parse_audio_event
+
+def feed_all(decoder, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    return events + decoder.close()
+
+def test_events_split_across_chunks():
+    stream = b'data: {"a":1}\r\n\r\n: keep-alive\n\nevent: x\ndata: line1\ndata:line2\n\ndata: tail'
+    # Every split point, down to one byte per chunk
+    for size in (1, 3, 7, len(stream)):
+        chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+        assert feed_all(SSEDecoder(), chunks) == [b'{"a":1}', b"line1\nline2", b"tail"]
+
+def test_bare_json_lines():
+    stream = b'{"data":{"audio":"00ff"}}\ndata: {"x":2}\n\n'
+    assert feed_all(SSEDecoder(bare_json=True), [stream]) == [b'{"data":{"audio":"00ff"}}', b'{"x":2}']
+    # Without bare_json such lines are not events
+    assert feed_all(SSEDecoder(), [stream]) == [b'{"x":2}']
+
+def test_hex_field_and_audio_events():
+    assert hex_field(b'{"data":{"audio":"00ff10","status":1}}', b"audio") == b"\x00\xff\x10"
+    assert hex_field(b'{"data":{"audio": "00ff"}}', b"audio") is None
+    assert hex_field(b'{"data":{"audio":"zz"}}', b"audio") is None
+
+    assert parse_audio_event(b'{"data":{"audio":"0102","status":1}}') == (b"\x01\x02", None)
+    # Not compact: falls back to a full parse
+    assert parse_audio_event(b'{"data": {"audio": "0102"}}') == (b"\x01\x02", None)
+    final = b'{"data":{"audio":"","status":2},"extra_info":{"audio_length":1500}}'
+    assert parse_audio_event(final) == (b"", 1500)
+    with pytest.raises(ValueError):
+        parse_audio_event(b'{"base_resp":')
+
+@pytest.mark.asyncio
+async def test_llm_stream_from_raw_bytes(monkeypatch):
+    events = [{"choices": [{"delta": {"content": t}}]} for t in ["你", "好", "\n!"]]
+    body = b"".join(b"data: " + json.dumps(e, ensure_ascii=False).encode() + b"\n\n" for e in events)
+    body += b"data: [DONE]\n\n"
+
+    async def chunks():
+        # Split inside a multi-byte character and inside a line
+        for i in range(0, len(body), 5):
+            yield body[i:i + 5]
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+    client = httpx.AsyncClient(transport=transport)
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(llm_service, "get_httpx_client", get_client)
+    endpoint = llm_service.llm_router.pick()
+    tokens = [t async for t in llm_service.stream_completion([], endpoint)]
+    assert tokens == ["你", "好", "\n!"]
+
+def test_stdlib_fallback(monkeypatch):
+    monkeypatch.setattr(sse, "orjson", None)
+    assert sse.loads(b'{"a":[1]}') == {"a": [1]}
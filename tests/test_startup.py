@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+import startup_profile
+from config import settings
+
+# Only needed by the first login, provider call or page view
+DEFERRED = ("redis", "httpx", "jose", "passlib", "argon2", "jinja2")
+
+def test_importing_main_defers_client_libraries():
+    script = f"import json, sys, main; print(json.dumps([m for m in {DEFERRED!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=startup_profile.ROOT, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+def test_import_and_boot_stay_within_budget(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{tmp_path}/boot.db")
+    # Best of two, a single run is at the mercy of the machine
+    runs = [startup_profile.measure_boot(env=env) for _ in range(2)]
+    imported = min(run["import"] for run in runs)
+    booted = min(run["boot"] for run in runs)
+    assert imported <= settings.STARTUP_IMPORT_BUDGET, f"import main took {imported:.3f}s, see python main.py --profile-startup"
+    assert booted <= settings.STARTUP_BOOT_BUDGET, f"boot took {booted:.3f}s, see python main.py --profile-startup"
+
+def test_import_profile_breaks_time_down_by_package():
+    rows = startup_profile.import_times("config")
+    packages = dict(startup_profile.by_package(rows))
+    assert "pydantic_settings" in packages
+    assert rows[-1][3] == "config"
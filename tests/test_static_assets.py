@@ -0,0 +1,46 @@
+import gzip
+import os
+import pytest
+from httpx import AsyncClient, ASGITransport
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from static_assets import build_static_assets, PrecompressedStaticFiles, static_url, IMMUTABLE
+
+@pytest.fixture
+def built(tmp_path):
+    out_dir = str(tmp_path / "static")
+    manifest = build_static_assets(src_dir="static", out_dir=out_dir)
+    return manifest, out_dir
+
+def test_build_fingerprints_and_precompresses(built):
+    manifest, out_dir = built
+    hashed = manifest.files["script.js"]
+    assert hashed.startswith("script.") and hashed.endswith(".js") and hashed != "script.js"
+    assert static_url("script.js") == f"/static/{hashed}"
+
+    with open(os.path.join(out_dir, hashed), "rb") as f:
+        raw = f.read()
+    with open(os.path.join(out_dir, hashed + ".gz"), "rb") as f:
+        assert gzip.decompress(f.read()) == raw
+
+    # The service worker precaches exactly the hashed build
+    assert f'"/static/{hashed}"' in manifest.service_worker
+    assert manifest.version in manifest.service_worker
+    assert "sw.js" not in manifest.files
+
+@pytest.mark.asyncio
+async def test_serves_precompressed_variant(built):
+    manifest, out_dir = built
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=out_dir, manifest=manifest))])
+    hashed = manifest.files["style.css"]
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(f"/static/{hashed}", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("text/css")
+        assert response.headers["cache-control"] == IMMUTABLE
+
+        response = await ac.get("/static/style.css", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["cache-control"] == "no-cache"
@@ -0,0 +1,69 @@
+import pytest
+from config import settings
+from services import tts_service
+from services.tts_text import SpeechNormalizer, integer_to_chinese, number_to_chinese
+
+def test_markup_emoji_and_urls_are_not_spoken():
+    normalizer = SpeechNormalizer()
+    assert normalizer.normalize("**你好**，我是 *助手*！😀") == "你好，我是助手！"
+    assert normalizer.normalize("\n- 苹果\n- 香蕉\n") == "苹果，香蕉"
+    assert normalizer.normalize("# 标题\n正文") == "标题，正文"
+    assert normalizer.normalize("访问[官网](https://x.cn)或 https://example.com/a?b=1 了解") == "访问官网或了解"
+    assert normalizer.normalize("`pip install` 就行") == "pip install就行"
+
+def test_markup_removal_keeps_math():
+    normalizer = SpeechNormalizer()
+    assert normalizer.normalize("2*3=6。") == "2乘3=6。"
+    assert normalizer.normalize("5 * 4 = 20") == "5乘4 = 20"
+    assert normalizer.normalize("如果 a<b 且 b>c，那么成立。") == "如果a<b且b>c，那么成立。"
+    assert normalizer.normalize('<b>粗体</b>和<span class="x">文字</span><br/>') == "粗体和文字"
+
+def test_code_blocks_are_dropped_across_sentences():
+    normalizer = SpeechNormalizer()
+    assert normalizer.normalize("代码如下：\n```python\nprint(1)\n") == "代码如下："
+    assert normalizer.normalize("x = 2。") == ""
+    assert normalizer.normalize("\n```\n运行即可。") == "运行即可。"
+
+def test_variants_share_one_spoken_form():
+    normalizer = SpeechNormalizer()
+    variants = ["你好,世界!", "你好，世界！", "  你好， 世界！！", "**你好**，世界！", "你好，世界！🌍"]
+    assert {normalizer.normalize(v) for v in variants} == {"你好，世界！"}
+    assert normalizer.normalize("Ｈｅｌｌｏ　ｗｏｒｌｄ") == "Hello world"
+
+def test_chinese_numbers():
+    assert [integer_to_chinese(n) for n in (10, 15, 105, 1005, 10010, 20000, 100500000)] == [
+        "十", "十五", "一百零五", "一千零五", "一万零一十", "二万", "一亿零五十万"
+    ]
+    assert number_to_chinese("3.14") == "三点一四"
+    assert number_to_chinese("13800138000") == "一三八零零一三八零零零"
+
+def test_number_and_unit_expansion_is_optional():
+    assert SpeechNormalizer().normalize("今天25℃，湿度60%。") == "今天25℃，湿度60%。"
+    normalizer = SpeechNormalizer(expand_numbers=True)
+    assert normalizer.normalize("今天25℃，湿度60%。") == "今天二十五摄氏度，湿度百分之六十。"
+    assert normalizer.normalize("2024年的会议在10:30开始，要3-5天") == "二零二四年的会议在十点三十分开始，要三到五天"
+    assert normalizer.normalize("价格是1,299元，跑了5km") == "价格是一千二百九十九元，跑了五公里"
+    assert normalizer.normalize("温度是-5℃，降了-3%") == "温度是负五摄氏度，降了负百分之三"
+    assert normalizer.normalize("I have 2 cats.") == "I have 二 cats."
+    assert normalizer.normalize("我有 3 只猫") == "我有三只猫"
+
+@pytest.mark.asyncio
+async def test_stream_synthesizes_normalized_sentences(monkeypatch):
+    requested = []
+
+    async def tts_request(text, audio_format=None, rewritten=False):
+        requested.append((text, rewritten))
+        yield text.encode()
+
+    async def tokens():
+        for token in ["**圆周率**", "约", "3", ".", "14", "。", "```", "\nx=1", ".", "\n```", "好的", "。"]:
+            yield token
+
+    monkeypatch.setattr(tts_service, "tts_request", tts_request)
+    monkeypatch.setattr(settings, "TTS_NORMALIZE_TEXT", True)
+    monkeypatch.setattr(settings, "TTS_EXPAND_NUMBERS", False)
+    audio = [chunk async for chunk in tts_service.text_to_speech_stream(tokens())]
+
+    # "3.14" stays in one sentence; the code block is skipped
+    assert requested == [("圆周率约3.14。", True), ("好的。", True)]
+    assert audio == ["圆周率约3.14。".encode(), "好的。".encode()]
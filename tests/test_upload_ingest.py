@@ -0,0 +1,204 @@
+import asyncio
+import gzip
+import json
+import struct
+import pytest
+from httpx import AsyncClient
+import main
+from config import settings
+from services import volcengine_asr
+from services.upload_ingest import StreamingUpload, UploadRejected, sniff_audio_container
+
+WAV = b"RIFF\x24\x00\x00\x00WAVEfmt " + b"\x00" * 200
+BOUNDARY = "xyzBOUNDARY"
+
+def multipart(audio, history="[]"):
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="history"\r\n\r\n'
+        f"{history}\r\n"
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="audio"; filename="clip.bin"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + audio + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+class SlowRequest:
+    """Delivers the body in pieces; the last one only when `release` is set."""
+
+    def __init__(self, body, pieces=4, content_length=None):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        if content_length is not None:
+            self.headers["content-length"] = str(content_length)
+        step = len(body) // pieces + 1
+        self.parts = [body[i:i + step] for i in range(0, len(body), step)]
+        self.release = asyncio.Event()
+
+    async def stream(self):
+        for i, part in enumerate(self.parts):
+            if i == len(self.parts) - 1:
+                await self.release.wait()
+            yield part
+
+def test_sniff_audio_container():
+    assert sniff_audio_container(b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81") == "webm"
+    assert sniff_audio_container(b"OggS\x00\x02") == "ogg"
+    assert sniff_audio_container(WAV[:12]) == "wav"
+    assert sniff_audio_container(b"ID3\x04\x00") == "mp3"
+    assert sniff_audio_container(b"\xff\xfb\x90\x64") == "mp3"
+    assert sniff_audio_container(b"<html><body>") is None
+
+@pytest.mark.asyncio
+async def test_audio_is_available_before_the_upload_finishes():
+    request = SlowRequest(multipart(WAV * 20))
+    upload = await StreamingUpload(request).start()
+    assert upload.container == "wav"
+
+    received = []
+    async for chunk in upload.chunks():
+        received.append(chunk)
+        # Bytes arrive while the last piece of the body is still held back
+        if not request.release.is_set():
+            request.release.set()
+
+    assert b"".join(received) == WAV * 20
+    assert upload.fields == {"history": "[]"}
+    assert upload.body() == WAV * 20
+
+@pytest.mark.asyncio
+async def test_oversized_upload_is_rejected_midway():
+    request = SlowRequest(multipart(WAV * 100), pieces=8)
+    upload = StreamingUpload(request, max_bytes=1024)
+    with pytest.raises(UploadRejected) as e:
+        await upload.start()
+        await upload.complete()
+    assert e.value.status_code == 413
+    # Stopped reading at the limit, not at the end of the body
+    assert upload.audio_bytes < len(WAV) * 100
+
+@pytest.mark.asyncio
+async def test_declared_length_is_rejected_before_reading():
+    request = SlowRequest(multipart(WAV), content_length=50 * 1024 * 1024)
+    with pytest.raises(UploadRejected) as e:
+        await StreamingUpload(request).start()
+    assert e.value.status_code == 413
+
+@pytest.mark.asyncio
+async def test_process_audio_rejects_non_audio_by_content(client: AsyncClient):
+    files = {"audio": ("voice.wav", b"<html>not audio</html>", "audio/wav")}
+    response = await client.post("/api/process_audio", files=files)
+    assert response.status_code == 400
+    assert "Invalid file format" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_process_audio_streams_upload_into_asr(client: AsyncClient, monkeypatch):
+    fed = []
+
+    class FakeStreamingASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            async for chunk in audio_generator:
+                fed.append(chunk)
+            yield {"type": "final", "text": f"{container}:{sum(map(len, fed))}"}
+
+    async def whole_file_asr(*args, **kwargs):
+        raise AssertionError("streaming path should not fall back")
+
+    async def mock_chat(*args, **kwargs):
+        yield "好"
+
+    async def mock_tts_stream(text_iterator, audio_format=None):
+        async for _ in text_iterator:
+            pass
+        yield b"audio"
+
+    monkeypatch.setattr(settings, "UPLOAD_STREAMING_ASR", True)
+    monkeypatch.setattr(main, "VolcengineASRService", FakeStreamingASR)
+    monkeypatch.setattr(main, "transcribe_audio", whole_file_asr)
+    monkeypatch.setattr(main, "chat_with_llm", mock_chat)
+    monkeypatch.setattr(main, "text_to_speech_stream", mock_tts_stream)
+
+    audio = WAV * 50
+    files = {"audio": ("clip", audio, "application/octet-stream")}
+    response = await client.post("/api/process_audio", files=files, data={"audio_format": "pcm"})
+    assert response.status_code == 200
+
+    meta = json.loads(response.text.splitlines()[0])
+    assert meta["user_text"] == f"wav:{len(audio)}"
+    assert meta["audio"]["format"] == "pcm"
+    assert b"".join(fed) == audio
+
+@pytest.mark.asyncio
+async def test_process_audio_falls_back_only_when_streaming_asr_fails(client: AsyncClient, monkeypatch):
+    streamed = []
+
+    class FakeStreamingASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            async for _ in audio_generator:
+                pass
+            yield streamed.pop(0)
+
+    whole_file = []
+
+    async def whole_file_asr(audio, container="webm"):
+        whole_file.append(len(audio))
+        return "你好"
+
+    async def mock_chat(*args, **kwargs):
+        yield "好"
+
+    async def mock_tts_stream(text_iterator, audio_format=None):
+        async for _ in text_iterator:
+            pass
+        yield b"audio"
+
+    monkeypatch.setattr(settings, "UPLOAD_STREAMING_ASR", True)
+    monkeypatch.setattr(main, "VolcengineASRService", FakeStreamingASR)
+    monkeypatch.setattr(main, "transcribe_audio", whole_file_asr)
+    monkeypatch.setattr(main, "chat_with_llm", mock_chat)
+    monkeypatch.setattr(main, "text_to_speech_stream", mock_tts_stream)
+
+    files = {"audio": ("clip", WAV, "application/octet-stream")}
+    user_texts = []
+    for result in ({"type": "error", "text": "Speech recognition failed (45000001)"}, {"type": "final", "text": ""}):
+        streamed.append(result)
+        response = await client.post("/api/process_audio", files=files)
+        assert response.status_code == 200
+        user_texts.append(json.loads(response.text.splitlines()[0])["user_text"])
+
+    # Silence is not transcribed a second time
+    assert user_texts == ["你好", ""]
+    assert whole_file == [len(WAV)]
+
+def test_wav_format_reads_the_fmt_chunk():
+    fmt = struct.pack("<HHIIHH", 1, 2, 8000, 32000, 4, 16)
+    head = b"RIFF\x00\x00\x00\x00WAVE" + b"LIST\x03\x00\x00\x00abc\x00" + b"fmt \x10\x00\x00\x00" + fmt
+    assert volcengine_asr.wav_format(head) == (8000, 16, 2)
+    assert volcengine_asr.wav_format(head[:30]) is None
+
+@pytest.mark.asyncio
+async def test_volcengine_error_frame_is_an_error_result(monkeypatch):
+    sent = []
+    detail = "unsupported audio".encode()
+    error_frame = b"\x11\xf0\x10\x00" + struct.pack(">II", 45000001, len(detail)) + detail
+
+    class FakeSocket:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def send(self, message):
+            sent.append(message)
+
+        async def __aiter__(self):
+            yield error_frame
+
+    monkeypatch.setattr(volcengine_asr.websockets, "connect", lambda url, **kwargs: FakeSocket())
+
+    async def audio():
+        yield WAV
+
+    results = [result async for result in volcengine_asr.VolcengineASRService().transcribe_stream(audio(), container="wav")]
+    assert results == [{"type": "error", "text": "Speech recognition failed (45000001)"}]
+    request = json.loads(gzip.decompress(sent[0][8:]))
+    assert request["audio"]["format"] == "wav"
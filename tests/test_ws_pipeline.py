@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+import main
+from auth import create_access_token
+from routers import ws_router
+from services.ws_session import TurnSequencer
+
+class RecordingWriter:
+    def __init__(self):
+        self.frames = []
+
+    async def send_json(self, data, turn=None):
+        self.frames.append((turn, data["type"]))
+
+    async def send_bytes(self, data, turn=None, frame="audio"):
+        self.frames.append((turn, data))
+
+@pytest.mark.asyncio
+async def test_sequencer_holds_later_turns_until_earlier_ones_end():
+    writer = RecordingWriter()
+    sequencer = TurnSequencer(writer, max_held_bytes=1024)
+    first, second, third = (sequencer.lane(n) for n in (1, 2, 3))
+
+    await first.send_json({"type": "asr_final"})
+    await second.send_json({"type": "asr_final"})
+    await third.send_json({"type": "asr_final"})
+    await third.send_json({"type": "turn_end"})
+    await third.end()
+    await first.send_bytes(b"audio")
+    assert writer.frames == [(1, "asr_final"), (1, b"audio")]
+
+    await first.send_json({"type": "turn_end"})
+    await first.end()
+    await second.send_json({"type": "turn_end"})
+    await second.end()
+    assert writer.frames == [
+        (1, "asr_final"), (1, b"audio"), (1, "turn_end"),
+        (2, "asr_final"), (2, "turn_end"),
+        (3, "asr_final"), (3, "turn_end"),
+    ]
+    assert sequencer.held_bytes == 0
+
+@pytest.mark.asyncio
+async def test_sequencer_blocks_producers_of_later_turns_when_full():
+    writer = RecordingWriter()
+    sequencer = TurnSequencer(writer, max_held_bytes=10)
+    await sequencer.lane(2).send_bytes(b"x" * 8)
+    blocked = asyncio.create_task(sequencer.lane(2).send_bytes(b"y" * 8))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    await sequencer.lane(1).end()
+    await asyncio.wait_for(blocked, 1)
+    assert writer.frames == [(2, b"x" * 8), (2, b"y" * 8)]
+
+@pytest.fixture
+def slow_tts(monkeypatch):
+    asr_done = {}
+
+    async def allow(user):
+        return True
+
+    class FakeASR:
+        turns = 0
+
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            FakeASR.turns += 1
+            turn = FakeASR.turns
+            async for _ in audio_generator:
+                pass
+            await asyncio.sleep(0.05)
+            asr_done[turn] = time.monotonic()
+            yield {"type": "final", "text": f"u{turn}"}
+
+    async def chat(text, history=[], **kwargs):
+        for token in ["a", "b", "c"]:
+            yield token
+
+    async def tts(text_iterator, audio_format=None):
+        async for token in text_iterator:
+            await asyncio.sleep(0.1)
+            yield token.encode()
+
+    monkeypatch.setattr(ws_router, "check_rate_limit", allow)
+    monkeypatch.setattr(ws_router, "VolcengineASRService", FakeASR)
+    monkeypatch.setattr(ws_router, "chat_with_llm", chat)
+    monkeypatch.setattr(ws_router, "text_to_speech_stream", tts)
+    return asr_done
+
+def test_next_utterance_is_recognised_during_the_reply(slow_tts):
+    token = create_access_token({"sub": "alice"})
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+            assert json.loads(ws.receive_text())["type"] == "session"
+            for _ in range(2):
+                ws.send_bytes(b"a" * 100)
+                ws.send_text(json.dumps({"action": "finish_speaking"}))
+
+            frames, turn_ends = [], []
+            while len(turn_ends) < 2:
+                message = ws.receive()
+                if message.get("bytes") is not None:
+                    frames.append(message["bytes"].decode())
+                    continue
+                data = json.loads(message["text"])
+                frames.append(data.get("text") or data["type"])
+                if data["type"] == "turn_end":
+                    turn_ends.append(time.monotonic())
+
+    # Turn 2 was recognised while turn 1 was still being spoken...
+    assert slow_tts[2] < turn_ends[0]
+    # ...and its frames still came after turn 1's
+    assert frames == ["u1", "abc", "a", "b", "c", "turn_end", "u2", "abc", "a", "b", "c", "turn_end"]
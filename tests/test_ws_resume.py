@@ -0,0 +1,183 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+import main
+from auth import create_access_token
+from routers import ws_router
+from services.ws_session import OutboundWriter, WS_CLOSE_RESUMED, sessions
+from tests.test_ws_session import FakeWebSocket
+
+@pytest.mark.asyncio
+async def test_writer_replays_missed_frames_on_a_new_socket():
+    first = FakeWebSocket()
+    writer = OutboundWriter(first, max_bytes=1024, replay_bytes=1024).start()
+    await writer.send_json({"type": "asr_final", "text": "你好"})
+    await writer.send_bytes(b"audio1")
+    await writer.drain()
+
+    # Client dropped; the pipeline keeps producing
+    await writer.detach()
+    await writer.send_bytes(b"audio2")
+    await writer.send_json({"type": "turn_end"})
+    await asyncio.sleep(0.01)
+    assert len(first.sent) == 2
+
+    # The client had only seen the first frame
+    second = FakeWebSocket()
+    assert await writer.attach(second, last_seq=1)
+    await writer.close()
+    assert [m.get("bytes") or json.loads(m["text"])["seq"] for m in second.sent] == [b"audio1", b"audio2", 4]
+    assert writer.buffered_bytes == 0
+
+@pytest.mark.asyncio
+async def test_writer_cannot_resume_past_the_replay_buffer():
+    writer = OutboundWriter(FakeWebSocket(), max_bytes=1024, replay_bytes=10).start()
+    for _ in range(3):
+        await writer.send_bytes(b"x" * 8)
+    await writer.drain()
+
+    # Only the newest frame fits in 10 bytes
+    assert not writer.can_resume(0)
+    assert writer.can_resume(2)
+    assert not await writer.attach(FakeWebSocket(), last_seq=1)
+    await writer.close()
+
+@pytest.fixture
+def slow_pipeline(monkeypatch):
+    async def allow(user):
+        return True
+
+    class FakeASR:
+        async def transcribe_stream(self, audio_generator, container="webm"):
+            async for _ in audio_generator:
+                pass
+            yield {"type": "final", "text": "你好"}
+
+    async def chat(text, history=[], **kwargs):
+        for token in ["你", "好", "！", "再", "见", "。"]:
+            await asyncio.sleep(0.05)
+            yield token
+
+    async def tts(text_iterator, audio_format=None):
+        sentence = ""
+        async for token in text_iterator:
+            sentence += token
+            if token in "！。":
+                yield sentence.encode()
+                sentence = ""
+
+    monkeypatch.setattr(ws_router, "check_rate_limit", allow)
+    monkeypatch.setattr(ws_router, "VolcengineASRService", FakeASR)
+    monkeypatch.setattr(ws_router, "chat_with_llm", chat)
+    monkeypatch.setattr(ws_router, "text_to_speech_stream", tts)
+    monkeypatch.setattr(ws_router.settings, "WS_TOKEN_FLUSH_MS", 0)
+
+def receive_frame(ws, last_seq):
+    message = ws.receive()
+    if message.get("bytes") is not None:
+        return message["bytes"], last_seq + 1
+    data = json.loads(message["text"])
+    return data, data.get("seq", last_seq)
+
+def test_reconnect_gets_the_rest_of_the_turn(slow_pipeline):
+    token = create_access_token({"sub": "alice"})
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+            session, last_seq = receive_frame(ws, 0)
+            ws.send_bytes(b"a" * 100)
+            ws.send_text(json.dumps({"action": "finish_speaking"}))
+            frame = None
+            while not (isinstance(frame, dict) and frame["type"] == "asr_final"):
+                frame, last_seq = receive_frame(ws, last_seq)
+
+        # LLM and TTS keep going while nobody is connected
+        time.sleep(0.5)
+        session_id = session["session_id"]
+        assert sessions.get(session_id, "alice") is not None
+
+        url = f"/ws/chat?token={token}&session_id={session_id}&last_seq={last_seq}"
+        with client.websocket_connect(url) as ws:
+            resumed, _ = receive_frame(ws, last_seq)
+            assert resumed == {"type": "resumed", "session_id": session_id, "last_seq": last_seq}
+
+            tokens, audio = "", b""
+            while True:
+                frame, seq = receive_frame(ws, last_seq)
+                assert seq == last_seq + 1
+                last_seq = seq
+                if isinstance(frame, bytes):
+                    audio += frame
+                elif frame["type"] == "llm_token":
+                    tokens += frame["text"]
+                elif frame["type"] == "turn_end":
+                    break
+            assert tokens == "你好！再见。"
+            assert audio.decode() == "你好！再见。"
+
+        # Another user cannot take the session over
+        other = create_access_token({"sub": "mallory"})
+        with client.websocket_connect(f"/ws/chat?token={other}&session_id={session_id}&last_seq=0") as ws:
+            fresh, _ = receive_frame(ws, 0)
+            assert fresh["type"] == "session"
+            assert fresh["session_id"] != session_id
+
+class HalfOpenSocket:
+    """Server side of a socket driven by the test; close() reaches its reader `close_delay` before it returns."""
+
+    def __init__(self, close_delay=0.0):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.close_delay = close_delay
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def send_json(self, data):
+        await self.send({"type": "websocket.send", "text": json.dumps(data)})
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": code})
+        await asyncio.sleep(self.close_delay)
+
+    def frames(self):
+        return [json.loads(m["text"]) for m in self.sent if m.get("text") is not None]
+
+async def wait_for_frame(socket, frame_type):
+    for _ in range(200):
+        if any(frame["type"] == frame_type for frame in socket.frames()):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"no {frame_type} frame, got {socket.frames()}")
+
+@pytest.mark.asyncio
+async def test_resume_survives_the_previous_socket_closing_slowly(slow_pipeline):
+    token = create_access_token({"sub": "alice"})
+    old = HalfOpenSocket(close_delay=0.05)
+    old_handler = asyncio.create_task(ws_router.websocket_chat(old, token=token))
+    await wait_for_frame(old, "session")
+    session_id = old.frames()[0]["session_id"]
+
+    # The client reconnects before the server noticed the old socket is gone
+    new = HalfOpenSocket()
+    new_handler = asyncio.create_task(ws_router.websocket_chat(new, token=token, session_id=session_id, last_seq=1))
+    await wait_for_frame(new, "resumed")
+    await asyncio.wait_for(old_handler, 1)
+    assert old.close_code == WS_CLOSE_RESUMED
+
+    new.incoming.put_nowait({"type": "websocket.receive", "bytes": b"a" * 100})
+    new.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps({"action": "finish_speaking"})})
+    await wait_for_frame(new, "turn_end")
+
+    new.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+    await asyncio.wait_for(new_handler, 1)
+    await sessions.get(session_id, "alice").close()
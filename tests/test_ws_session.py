@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from services.ws_session import (
+    AudioInbox,
+    OutboundWriter,
+    AudioOverflowError,
+    SessionClosedError,
+    TokenBatcher,
+    CLOSED,
+    WS_CLOSE_SLOW_CONSUMER
+)
+
+class FakeWebSocket:
+    def __init__(self, stall=False):
+        self.sent = []
+        self.stall = stall
+        self.close_code = None
+
+    async def send(self, message):
+        if self.stall:
+            await asyncio.sleep(3600)
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+@pytest.mark.asyncio
+async def test_audio_inbox_drop_policy():
+    inbox = AudioInbox(max_chunks=2, max_bytes=1024, policy="drop")
+    assert await inbox.put(b"a" * 10)
+    assert await inbox.put(b"b" * 10)
+    assert not await inbox.put(b"c" * 10)
+
+    inbox.end_utterance()
+    inbox.close()
+    assert await inbox.get() == b"a" * 10
+    assert await inbox.get() == b"b" * 10
+    assert await inbox.get() is None
+    assert await inbox.get() is CLOSED
+    assert await inbox.get() is CLOSED
+    assert inbox.buffered_bytes == 0
+
+@pytest.mark.asyncio
+async def test_audio_inbox_holds_the_tail_after_a_server_side_endpoint():
+    inbox = AudioInbox(max_chunks=10, max_bytes=1024)
+    await inbox.put(b"speech")
+    inbox.end_utterance(tail=0.05)
+    await inbox.put(b"tail")
+    # The client ended the utterance too: what it sent in between is dropped
+    inbox.end_utterance()
+    await inbox.put(b"next")
+    assert [await inbox.get() for _ in range(3)] == [b"speech", None, b"next"]
+
+    # Nobody ended it: held back until the window is over, then passed on
+    inbox.end_utterance(tail=0.05)
+    await inbox.put(b"more")
+    assert inbox.buffered_chunks == 0
+    await asyncio.sleep(0.06)
+    await inbox.put(b"speech")
+    assert [await inbox.get() for _ in range(3)] == [None, b"more", b"speech"]
+
+@pytest.mark.asyncio
+async def test_audio_inbox_block_policy_times_out():
+    inbox = AudioInbox(max_chunks=1, max_bytes=1024, policy="block", overflow_timeout=0.05)
+    await inbox.put(b"a")
+    with pytest.raises(AudioOverflowError):
+        await inbox.put(b"b")
+
+    # Space freed by the consumer unblocks the producer
+    put_task = asyncio.create_task(inbox.put(b"c"))
+    await asyncio.sleep(0)
+    assert await inbox.get() == b"a"
+    assert await put_task
+    assert await inbox.get() == b"c"
+
+@pytest.mark.asyncio
+async def test_outbound_writer_delivers_in_order():
+    ws = FakeWebSocket()
+    writer = OutboundWriter(ws, max_bytes=1024).start()
+    await writer.send_json({"type": "asr_final", "text": "你好"})
+    await writer.send_bytes(b"audio")
+    await writer.close()
+
+    assert ws.sent[0] == {"type": "websocket.send", "text": '{"type":"asr_final","text":"你好","seq":1}'}
+    assert ws.sent[1] == {"type": "websocket.send", "bytes": b"audio"}
+    assert writer.buffered_bytes == 0
+
+@pytest.mark.asyncio
+async def test_outbound_writer_disconnects_slow_consumer():
+    ws = FakeWebSocket(stall=True)
+    writer = OutboundWriter(ws, max_bytes=10, slow_consumer_timeout=0.05).start()
+    with pytest.raises(SessionClosedError):
+        for _ in range(10):
+            await writer.send_bytes(b"x" * 8)
+
+    assert ws.close_code == WS_CLOSE_SLOW_CONSUMER
+    assert writer.closed
+    await writer.close()
+
+class RecordingWriter:
+    def __init__(self):
+        self.frames = []
+
+    async def send_json(self, data):
+        self.frames.append(data["text"])
+
+@pytest.mark.asyncio
+async def test_token_batcher_flushes_on_size_and_time():
+    writer = RecordingWriter()
+    batcher = TokenBatcher(writer, flush_ms=30, flush_chars=6)
+
+    for token in ["你", "好", "，", "我", "是", "小", "助"]:
+        await batcher.add(token)
+    # Six characters filled a frame, the seventh waits for the timer
+    assert writer.frames == ["你好，我是小"]
+
+    await asyncio.sleep(0.06)
+    assert writer.frames == ["你好，我是小", "助"]
+
+    await batcher.add("手")
+    await batcher.close()
+    assert writer.frames == ["你好，我是小", "助", "手"]
+    assert batcher.frames == 3
+
+@pytest.mark.asyncio
+async def test_token_batcher_zero_window_sends_every_token():
+    writer = RecordingWriter()
+    batcher = TokenBatcher(writer, flush_ms=0, flush_chars=100)
+    for token in ["a", "b", "c"]:
+        await batcher.add(token)
+    await batcher.close()
+    assert writer.frames == ["a", "b", "c"]
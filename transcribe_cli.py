@@ -0,0 +1,90 @@
+"""
+Batch transcription from the command line.
+
+Prints one NDJSON line per file as soon as it is transcribed (completion
+order), the same records as POST /api/transcribe_batch.
+
+Usage:
+    python transcribe_cli.py notes/*.webm
+    python transcribe_cli.py --manifest backlog.txt --concurrency 16 > results.ndjson
+
+Directories are searched recursively for .webm/.ogg/.wav/.mp3 files. A
+manifest lists one path per line (relative to the manifest), `#` starts a
+comment.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from config import settings
+from services import asr_service
+from services.batch_transcribe import BatchItem, transcribe_batch
+
+AUDIO_EXTENSIONS = (".webm", ".ogg", ".wav", ".mp3")
+
+
+def collect_paths(paths, manifest=None):
+    found = []
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    found.append(os.path.join(base, line))
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(
+                    os.path.join(root, n) for n in sorted(names) if n.lower().endswith(AUDIO_EXTENSIONS)
+                )
+        else:
+            found.append(path)
+    return found
+
+
+def reader(path):
+    async def read():
+        # Off the event loop, files may sit on slow storage
+        return await asyncio.to_thread(_read_file, path)
+    return read
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def run(paths, concurrency):
+    items = [BatchItem(i, path, reader(path)) for i, path in enumerate(paths)]
+    failed = 0
+    try:
+        async for result in transcribe_batch(items, concurrency=concurrency):
+            failed += "error" in result
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        client = await asr_service.get_httpx_client()
+        await client.aclose()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe many audio files concurrently.")
+    parser.add_argument("paths", nargs="*", help="Audio files or directories")
+    parser.add_argument("--manifest", help="File listing one audio path per line")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    paths = collect_paths(args.paths, args.manifest)
+    if not paths:
+        parser.error("no audio files given")
+
+    failed = asyncio.run(run(paths, args.concurrency))
+    print(f"{len(paths) - failed}/{len(paths)} transcribed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Precomputes LLM answers and TTS audio for the most frequent questions.
+
+Mines the user questions of the last CACHE_WARM_DAYS days from chat_history,
+groups ASR variants ("你好。" / "你好"), and runs the most common form of the
+top questions through the live chat_with_llm / TTS code, filling the `llm:`
+and `tts:` Redis caches. Run it after a deploy or Redis restart, or nightly
+(warmed answers are kept for CACHE_WARM_TTL).
+
+Usage:
+    python warm_cache.py
+    python warm_cache.py --top 500 --audio-format mp3,pcm --concurrency 2
+    python warm_cache.py --dry-run    # only report the projected hit rate
+"""
+import argparse
+import asyncio
+import json
+import sys
+from config import settings
+from database import SessionLocal, engine
+from services import llm_service, tts_service
+from services.audio_format import negotiate_audio_format
+from services.cache_warmer import warm_caches
+from services.chat_history import frequent_utterances
+
+
+async def run(top, days, audio_formats, concurrency, dry_run):
+    try:
+        async with SessionLocal() as db:
+            utterances, total = await frequent_utterances(db, days=days, limit=top)
+        print(f"{total} questions in the last {days} days, warming the top {len(utterances)}", file=sys.stderr)
+        return await warm_caches(utterances, total, audio_formats, concurrency=concurrency, dry_run=dry_run)
+    finally:
+        for service in (llm_service, tts_service):
+            client = await service.get_httpx_client()
+            await client.aclose()
+        await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the LLM and TTS caches with frequent questions.")
+    parser.add_argument("--top", type=int, default=settings.CACHE_WARM_TOP)
+    parser.add_argument("--days", type=int, default=settings.CACHE_WARM_DAYS)
+    parser.add_argument("--audio-format", default="", help="Comma separated presets, as ?audio_format= (default: the default format)")
+    parser.add_argument("--concurrency", type=int, default=settings.CACHE_WARM_CONCURRENCY)
+    parser.add_argument("--dry-run", action="store_true", help="Report without calling the providers")
+    args = parser.parse_args(argv)
+
+    # One variant per preset, as sessions negotiating it would get
+    formats = {}
+    for name in args.audio_format.split(",") if args.audio_format else [""]:
+        audio_format = negotiate_audio_format(name)
+        formats[audio_format.key] = audio_format
+
+    report = asyncio.run(run(args.top, args.days, list(formats.values()), args.concurrency, args.dry_run))
+    print(json.dumps(report))
+    print(
+        f"LLM cache hit rate {report['hit_rate_before']:.1%} -> {report['hit_rate_after']:.1%} "
+        f"({report['warmed']} warmed, {report['failed']} failed)",
+        file=sys.stderr
+    )
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())